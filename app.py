@@ -1,21 +1,76 @@
-from flask import Flask, session, request, jsonify, send_from_directory
+from flask import Flask, Request, Response, g, session, request, jsonify
 from flask_cors import CORS
+import io
+import json
+import logging
 import os
+import time
 import uuid
 from dotenv import load_dotenv
 
+# Load environment variables before the modules below read their settings
+load_dotenv()
+
+# Logging settings
+# LOG_LEVEL=DEBUG also logs each turn's details; LOG_FORMAT=json writes one JSON
+# object per line for log collectors
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as single-line JSON objects"""
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+# Configured before the modules below are imported, as some log while loading
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json'
+                          else logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+logging.basicConfig(level=LOG_LEVEL, handlers=[_log_handler])
+# The HTTP client libraries log whole prompts at DEBUG, keep them to warnings
+for _name in ('groq', 'httpx', 'httpcore'):
+    logging.getLogger(_name).setLevel(max(logging.WARNING, logging.getLogger().level))
+
 # Import route modules
 from routes.transcribe import transcribe_bp
 from routes.ask import ask_bp
 from routes.history import history_bp
+from routes.audio import audio_bp
 
 # Import database manager
 from utils.db_manager import db_manager
+from utils.whisper_transcriber import WHISPER_PRELOAD, start_preload
+from utils.transcription_service import transcription_service
+from utils.stream_transcriber import stream_transcriber
+from utils.transcription_cache import transcription_cache
+from utils.tts_cache import TTS_PRERENDER, tts_cache
+from utils.tts_generator import get_backend_status
+from utils.tts_jobs import tts_jobs
+from utils.audio_storage import audio_storage
+from utils.context_builder import context_builder
+from utils.llm_gateway import llm_gateway
+from utils.loan_recommender import loan_recommender
+from utils.metrics import REQUEST_SECONDS, SERVER_TIMING, metrics, server_timing_header
 
-# Load environment variables
-load_dotenv()
+# Largest upload accepted, bigger requests get a 413
+MAX_UPLOAD_MB = float(os.getenv('MAX_UPLOAD_MB', '25'))
+
+class InMemoryRequest(Request):
+    """Request that keeps file uploads in memory instead of spooling large ones to a temp file"""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
 
 app = Flask(__name__, static_folder='static')
+app.request_class = InMemoryRequest
+app.config['MAX_CONTENT_LENGTH'] = int(MAX_UPLOAD_MB * 1024 * 1024)
 CORS(app, supports_credentials=True)
 
 # Configure session
@@ -26,23 +81,84 @@ app.config['SESSION_TYPE'] = 'filesystem'
 app.register_blueprint(transcribe_bp)
 app.register_blueprint(ask_bp)
 app.register_blueprint(history_bp)
+app.register_blueprint(audio_bp)
+
+# Endpoints that never read or write conversations and so never need a user
+SESSIONLESS_ENDPOINTS = {'health_check', 'metrics_endpoint', 'audio.serve_audio', 'audio.pending_audio', 'static'}
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    """Record how long the response took, and add Server-Timing when enabled"""
+    started = g.get('request_started')
+    if started is None:
+        return response
+    
+    elapsed = time.perf_counter() - started
+    REQUEST_SECONDS.observe(elapsed, endpoint=request.endpoint or 'unknown', method=request.method,
+                            status=response.status_code)
+    
+    if SERVER_TIMING:
+        stages = server_timing_header()
+        total = f"total;dur={elapsed * 1000:.1f}"
+        response.headers['Server-Timing'] = f"{stages}, {total}" if stages else total
+    return response
 
 # Initialize user session
 @app.before_request
 def initialize_session():
+    # Skip health probes, audio fetches and CORS preflights
+    if request.method == 'OPTIONS' or request.endpoint in SESSIONLESS_ENDPOINTS:
+        return
+    
     if 'user_id' not in session:
-        # Create a new user in the database
-        user_id = db_manager.create_user()
-        session['user_id'] = user_id
-
-# Serve static files
-@app.route('/audio/<path:filename>')
-def serve_audio(filename):
-    return send_from_directory(app.static_folder, filename)
+        # Only assign an id here, the users row is written together with
+        # the user's first conversation so cookieless clients cost no INSERT
+        session['user_id'] = db_manager.new_user_id()
 
 @app.route('/health')
 def health_check():
-    return jsonify({"status": "ok"})
+    model_status = transcription_service.get_status()
+    
+    # Report not ready until the Whisper model is warm so load balancers hold traffic
+    ready = model_status["ready"] or not (WHISPER_PRELOAD or transcription_service.enabled)
+    
+    return jsonify({
+        "status": "ok" if ready else "loading",
+        "transcription_model": model_status,
+        "transcription_streams": stream_transcriber.get_status(),
+        "transcription_cache": transcription_cache.get_status(),
+        "tts_cache": tts_cache.get_status(),
+        "tts_backends": get_backend_status(),
+        "tts_jobs": tts_jobs.get_status(),
+        "audio_storage": audio_storage.get_status(),
+        "llm": llm_gateway.get_status(),
+        "llm_context": context_builder.get_status(),
+        "loan_recommender": loan_recommender.get_status(),
+        "conversation_cache": db_manager.cache_stats()
+    }), 200 if ready else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Request and per-stage latency histograms in the Prometheus text format"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Warm up the Whisper model, or start the transcription workers, render the
+# fixed prompts' speech and start the audio sweeper at startup (under the debug
+# reloader only in the child process that serves requests)
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    if transcription_service.enabled:
+        transcription_service.start()
+    elif WHISPER_PRELOAD:
+        start_preload()
+    
+    if TTS_PRERENDER:
+        tts_cache.start_prerender()
+    
+    audio_storage.start_sweeper()
 
 if __name__ == '__main__':
     # Create static folder if it doesn't exist
@@ -1,96 +1,295 @@
-from flask import Blueprint, request, jsonify, session, current_app
-import os
-import uuid
-from utils.groq_client import get_ai_response
-from utils.tts_generator import generate_speech
+import itertools
+import json
+import logging
+import math
+from flask import Blueprint, Response, request, jsonify, session
+from utils.groq_client import get_ai_response, stream_ai_response
+from utils.llm_gateway import LLMUnavailableError
+from utils.sentence_splitter import SentenceSplitter
+from utils.tts_cache import tts_cache
+from utils.tts_jobs import TTS_ASYNC, tts_jobs
 from utils.db_manager import db_manager
 
+logger = logging.getLogger(__name__)
+
 ask_bp = Blueprint('ask', __name__)
 
-@ask_bp.route('/ask', methods=['POST'])
-def ask():
+# Most messages returned in delta mode, the rest can be paged from /conversation/history
+DELTA_MAX_MESSAGES = 200
+
+# Once the reply is complete, /ask/stream waits this long per sentence for its
+# speech before handing out the long-poll URL instead
+STREAM_AUDIO_WAIT_SECONDS = 10
+
+# Error for a reply with no text, which is never stored
+EMPTY_REPLY_ERROR = "The assistant returned an empty reply, please try again"
+
+def _begin_turn(data):
     """
-    Endpoint to get AI response using GroqCloud
-    Expects:
-    - message in request.json['message']
-    - language code in request.json['language']
+    Validate an /ask request and load its conversation
+    
+    The user's message is not stored yet, _store_turn() stores it together with
+    the reply so a failed request leaves nothing behind for a retry to duplicate.
+    
     Returns:
-    - AI response text
-    - URL to audio file of the response
-    - Conversation history
+        tuple: ((conversation_id, conversation), None), or
+        (None, error response) if the request is invalid
     """
-    data = request.json
     if not data or 'message' not in data or 'language' not in data:
-        return jsonify({"error": "Message and language are required"}), 400
-    
-    message = data['message']
-    language = data['language']
+        return None, (jsonify({"error": "Message and language are required"}), 400)
     
     # Get user_id from session
     user_id = session.get('user_id')
     if not user_id:
-        return jsonify({"error": "User session not found"}), 400
+        return None, (jsonify({"error": "User session not found"}), 400)
     
     # Get conversation_id from session or create a new conversation
     conversation_id = session.get('conversation_id')
     if not conversation_id:
-        conversation_id = db_manager.get_or_create_conversation(user_id, language)
+        conversation_id = db_manager.get_or_create_conversation(user_id, data['language'])
         session['conversation_id'] = conversation_id
     
-    # Add user message to database first
-    db_manager.add_message(conversation_id, "user", message)
-    
-    # Then get updated conversation history from database
+    # The AI client adds the new message after the history
     conversation = db_manager.get_conversation_for_ai(conversation_id)
     
+    return (conversation_id, conversation), None
+
+def _store_turn(conversation_id, message, ai_response, language, async_audio):
+    """
+    Store the user's message and the assistant's reply with its speech
+    
+    Returns:
+        tuple: (user_message_id, message_id, audio_url, audio_job_id); in async
+        mode audio_url is None and audio_job_id is set when the speech is not cached yet
+    """
+    if async_audio:
+        # Answer with the text now, cached speech is used as is and anything
+        # else is synthesized in the background
+        audio_url = tts_cache.lookup(ai_response, language)
+    else:
+        # Generate speech from AI response, repeated sentences reuse their cached audio
+        audio_url = tts_cache.get_speech(ai_response, language)
+    
+    # Add the user message and the AI response to database
+    user_message_id = db_manager.add_message(conversation_id, "user", message)
+    message_id = db_manager.add_message(conversation_id, "assistant", ai_response, audio_url)
+    
+    audio_job_id = None
+    if async_audio and audio_url is None:
+        # The message's audio_url is filled in once the speech is ready
+        # Named after the message, so any process can answer for it from the stored audio_url
+        audio_job_id = tts_jobs.submit(
+            ai_response,
+            language,
+            on_ready=lambda url: db_manager.update_message_audio(conversation_id, message_id, url),
+            job_id=message_id
+        )
+    
+    return user_message_id, message_id, audio_url, audio_job_id
+
+def _llm_unavailable(error):
+    """503 response for a reply no model could produce, nothing is stored for it"""
+    logger.warning("AI response failed: %s", error)
+    response = jsonify({"error": "The assistant is not available right now, please try again shortly"})
+    response.status_code = 503
+    if error.retry_after:
+        response.headers['Retry-After'] = str(math.ceil(error.retry_after))
+    return response
+
+def _empty_reply():
+    """502 response for a reply that came back empty, nothing is stored for it"""
+    logger.warning("AI response was empty")
+    return jsonify({"error": EMPTY_REPLY_ERROR}), 502
+
+def _add_history(response_data, conversation_id, since):
+    """Add the messages the client has not seen yet to a response"""
+    # Delta mode: only send what the client has not seen yet
+    delta = db_manager.get_messages_page(conversation_id, after=since, limit=DELTA_MAX_MESSAGES) if since else None
+    if delta:
+        response_data["new_messages"], response_data["has_more"] = delta
+    else:
+        # Old clients, or a cursor from another conversation, get the full history
+        response_data["conversation_history"] = db_manager.get_conversation_history(conversation_id)
+
+@ask_bp.route('/ask', methods=['POST'])
+def ask():
+    """
+    Endpoint to get AI response using GroqCloud
+    Expects:
+    - message in request.json['message']
+    - language code in request.json['language']
+    - optionally the last message_id the client has seen in request.json['since']
+    - optionally request.json['async_audio'] to get the text before its speech is ready
+      (defaults to TTS_ASYNC)
+    Returns:
+    - AI response text
+    - URL to audio file of the response, or in async mode, when the speech is not
+      cached yet, audio_pending_url to long-poll for it instead
+    - Conversation history, or only the messages after 'since' when it is given
+    - 503 if the AI service is unavailable, with Retry-After when it is known,
+      and 502 if the reply is empty; the message is not stored in either case
+    """
+    data = request.json
+    turn, error = _begin_turn(data)
+    if error:
+        return error
+    conversation_id, conversation = turn
+    
+    message = data['message']
+    language = data['language']
+    since = data.get('since')
+    async_audio = bool(data.get('async_audio', TTS_ASYNC))
+    
     # Get AI response
     try:
-        print(f"Sending message to AI: {message}")
-        print(f"Conversation history has {len(conversation)} messages")
-        
-        # Count how many questions have been asked so far
-        assistant_messages = [msg for msg in conversation if msg["role"] == "assistant"]
-        questions_asked = len(assistant_messages)
-        print(f"Questions asked so far: {questions_asked}")
-        
-        # Determine which question to ask next based on the number of questions already asked
-        if questions_asked == 0:
-            # First question: What do you need the loan for?
-            next_question = 1
-        elif questions_asked == 1:
-            # Second question: How much money do you need?
-            next_question = 2
-        else:
-            # Third question: What is your monthly income?
-            next_question = 3
-            
-        print(f"Next question should be question #{next_question}")
+        logger.debug("Sending message to AI with %d messages of history", len(conversation))
         
         # Get AI response
         ai_response = get_ai_response(message, conversation, language)
+        if not ai_response or not ai_response.strip():
+            return _empty_reply()
         
-        # Generate speech from AI response
-        audio_filename = f"{uuid.uuid4()}.mp3"
-        audio_path = os.path.join(current_app.static_folder, audio_filename)
-        
-        speech_success = generate_speech(ai_response, language, audio_path)
-        audio_url = f"/audio/{audio_filename}" if speech_success else None
-        
-        # Add AI response to database
-        db_manager.add_message(conversation_id, "assistant", ai_response, audio_url)
-        
-        # Get updated conversation history
-        conversation_history = db_manager.get_conversation_history(conversation_id)
+        user_message_id, message_id, audio_url, audio_job_id = _store_turn(
+            conversation_id, message, ai_response, language, async_audio
+        )
         
         # Return response
         response_data = {
             "response": ai_response,
             "audio_url": audio_url,
             "conversation_id": conversation_id,
-            "conversation_history": conversation_history
+            "user_message_id": user_message_id,
+            "message_id": message_id
         }
+        if audio_job_id:
+            response_data["audio_pending_url"] = f"/audio/pending/{audio_job_id}"
+        
+        _add_history(response_data, conversation_id, since)
         
         return jsonify(response_data)
     
+    except LLMUnavailableError as e:
+        return _llm_unavailable(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+def _submit_sentence(sentence, language):
+    """Queue speech for one sentence of a streamed reply, named by its cache key so any process can find it"""
+    return tts_jobs.submit(sentence, language, job_id=tts_cache.key(sentence, language))
+
+def _sse(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@ask_bp.route('/ask/stream', methods=['POST'])
+def ask_stream():
+    """
+    Endpoint to get AI response using GroqCloud as Server-Sent Events
+    
+    Each sentence is sent to speech synthesis as soon as the model completes it,
+    so the first sentence can play while the rest is still being generated.
+    Expects:
+    - the same JSON body as /ask
+    Returns a text/event-stream of:
+    - "token" events {"text": ...} with the response as it is generated
+    - "audio" events {"index", "text", "audio_url"} per sentence, in order;
+      audio_url is null and audio_pending_url is set if the speech is not ready in time
+    - a final "done" event with the same fields as the /ask response
+    - an "error" event {"error": ...} if the response breaks off or is empty,
+      nothing is stored then
+    - 503 instead of a stream if the AI service is unavailable, as for /ask
+    """
+    data = request.json
+    turn, error = _begin_turn(data)
+    if error:
+        return error
+    conversation_id, conversation = turn
+    
+    message = data['message']
+    language = data['language']
+    since = data.get('since')
+    
+    # Wait for the first text before answering, so a failure can still be a plain 503
+    reply_stream = stream_ai_response(message, conversation, language)
+    try:
+        first = next(reply_stream, None)
+    except LLMUnavailableError as e:
+        return _llm_unavailable(e)
+    if first is None:
+        return _empty_reply()
+    reply_stream = itertools.chain([first], reply_stream)
+    
+    def generate():
+        splitter = SentenceSplitter()
+        pieces = []
+        # Speech jobs per sentence as (sentence, job_id), and the audio URL of each one sent
+        sentence_jobs = []
+        sentence_urls = []
+        
+        def audio_events(wait):
+            # Audio is sent in sentence order, so stop at the first one not ready yet
+            while len(sentence_urls) < len(sentence_jobs):
+                sentence, job_id = sentence_jobs[len(sentence_urls)]
+                job = tts_jobs.wait(job_id, wait)
+                pending = job is not None and not job.done.is_set()
+                if pending and not wait:
+                    return
+                
+                event = {"index": len(sentence_urls), "text": sentence, "audio_url": job.audio_url if job else None}
+                if pending:
+                    event["audio_pending_url"] = f"/audio/pending/{job_id}"
+                sentence_urls.append(event["audio_url"])
+                yield _sse("audio", event)
+        
+        try:
+            for piece in reply_stream:
+                pieces.append(piece)
+                yield _sse("token", {"text": piece})
+                
+                for sentence in splitter.feed(piece):
+                    sentence_jobs.append((sentence, _submit_sentence(sentence, language)))
+                yield from audio_events(0)
+            
+            for sentence in splitter.flush():
+                sentence_jobs.append((sentence, _submit_sentence(sentence, language)))
+            yield from audio_events(STREAM_AUDIO_WAIT_SECONDS)
+            
+            ai_response = "".join(pieces).strip()
+            if not ai_response:
+                logger.warning("AI response was empty")
+                yield _sse("error", {"error": EMPTY_REPLY_ERROR})
+                return
+            
+            # The stored message gets speech for the whole reply, for replaying history;
+            # it is joined from the sentences' speech, and only synthesized again if
+            # some sentence had none in time or their clips can't be joined
+            tts_cache.join_speech(ai_response, language, sentence_urls)
+            user_message_id, message_id, audio_url, audio_job_id = _store_turn(
+                conversation_id, message, ai_response, language, True
+            )
+            
+            response_data = {
+                "response": ai_response,
+                "audio_url": audio_url,
+                "conversation_id": conversation_id,
+                "user_message_id": user_message_id,
+                "message_id": message_id
+            }
+            if audio_job_id:
+                response_data["audio_pending_url"] = f"/audio/pending/{audio_job_id}"
+            
+            _add_history(response_data, conversation_id, since)
+            
+            yield _sse("done", response_data)
+        
+        except LLMUnavailableError as e:
+            logger.warning("AI response failed: %s", e)
+            yield _sse("error", {"error": "The assistant's reply was interrupted, please try again"})
+        except Exception as e:
+            yield _sse("error", {"error": str(e)})
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Keep proxies such as nginx from buffering the events
+        'X-Accel-Buffering': 'no'
+    })
@@ -0,0 +1,132 @@
+import os
+import re
+import time
+from flask import Blueprint, request, jsonify, redirect, current_app, make_response, send_from_directory
+from werkzeug.security import safe_join
+from utils.metrics import timed
+from utils.tts_cache import tts_cache
+from utils.tts_jobs import tts_jobs
+from utils.db_manager import db_manager
+from utils.audio_storage import audio_storage
+
+audio_bp = Blueprint('audio', __name__)
+
+# Longest a request for pending audio is held open waiting for it
+PENDING_AUDIO_MAX_WAIT_SECONDS = 25
+# How often a job run by another worker process is checked in shared state
+PENDING_AUDIO_POLL_SECONDS = 0.25
+
+# Job ids of whole replies are message ids, those of streamed sentences TTS cache keys
+MESSAGE_ID_PATTERN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+TTS_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+# Files under these paths are named by a hash of what they contain and never
+# change, so browsers and CDNs may keep them for a year without revalidating
+IMMUTABLE_AUDIO_PREFIXES = ("tts/",)
+IMMUTABLE_MAX_AGE_SECONDS = 365 * 24 * 3600
+
+# Serve static files
+@audio_bp.route('/audio/<path:filename>')
+def serve_audio(filename):
+    """
+    Endpoint to serve generated audio
+    Returns:
+    - the file, or the requested byte range of it (206) so players can seek
+      without downloading the whole file
+    - 304 if the client's copy is current (If-None-Match / If-Modified-Since)
+    """
+    immutable = filename.startswith(IMMUTABLE_AUDIO_PREFIXES)
+    
+    # Audio files are written once under a unique name, so the name is a stable
+    # ETag; the default one includes the mtime, which the storage sweeper updates
+    etag = os.path.splitext(os.path.basename(filename))[0]
+    # Finding and opening the file and answering conditional and range requests;
+    # the body is sent by the server afterwards
+    with timed("audio_serve"):
+        response = send_from_directory(
+            current_app.static_folder,
+            filename,
+            etag=etag,
+            max_age=IMMUTABLE_MAX_AGE_SECONDS if immutable else None
+        )
+    
+    if immutable:
+        response.cache_control.immutable = True
+    
+    # Audio that is played keeps its place in the sweeper's LRU order
+    path = safe_join(current_app.static_folder, filename)
+    if path:
+        audio_storage.touch(path)
+    return response
+
+def _wait_elsewhere(job_id, wait):
+    """
+    Wait for speech synthesized by another worker process, from the state it writes to
+    
+    Returns:
+        tuple: (status, audio_url), status is 'ready', 'pending' or 'unknown'
+    """
+    if MESSAGE_ID_PATTERN.match(job_id):
+        check = db_manager.get_message_audio
+    elif TTS_KEY_PATTERN.match(job_id):
+        # A streamed sentence, its audio is stored in the cache under the id
+        check = lambda key: (True, tts_cache.lookup_key(key))
+    else:
+        return "unknown", None
+    
+    deadline = time.monotonic() + wait
+    while True:
+        # A message may still be queued for writing in the other process, so
+        # a missing one only counts as unknown once the wait is over
+        known, audio_url = check(job_id)
+        if audio_url:
+            return "ready", audio_url
+        if time.monotonic() >= deadline:
+            return ("pending" if known else "unknown"), None
+        time.sleep(min(PENDING_AUDIO_POLL_SECONDS, max(0.0, deadline - time.monotonic())))
+
+@audio_bp.route('/audio/pending/<job_id>')
+def pending_audio(job_id):
+    """
+    Endpoint to wait for speech that is still being synthesized (long-poll)
+    Expects:
+    - job_id from the audio_pending_url returned by /ask
+    - optionally the seconds to wait in request.args['wait'] (default and maximum 25)
+    - optionally format=json to get the audio URL instead of a redirect to it
+    Returns:
+    - a redirect to the audio file once it is ready, so the URL can be used as an
+      <audio> source directly, or {"status": "ready", "audio_url": ...} with format=json
+    - 202 with {"status": "pending"} if it is not ready within the wait
+    - 404 for an unknown or expired job, 500 if synthesis failed
+    
+    Jobs run by another worker process, or expired here, are answered from the
+    message's stored audio_url or the TTS cache.
+    """
+    wait = request.args.get('wait', PENDING_AUDIO_MAX_WAIT_SECONDS, type=float)
+    wait = max(0.0, min(wait, PENDING_AUDIO_MAX_WAIT_SECONDS))
+    
+    job = tts_jobs.wait(job_id, wait)
+    if job is None:
+        status, audio_url = _wait_elsewhere(job_id, wait)
+    elif not job.done.is_set():
+        status, audio_url = "pending", None
+    elif job.failed:
+        status, audio_url = "failed", None
+    else:
+        status, audio_url = "ready", job.audio_url
+    
+    if status == "unknown":
+        response = jsonify({"error": "Unknown or expired audio job"}), 404
+    elif status == "pending":
+        response = jsonify({"status": "pending"}), 202
+    elif status == "failed":
+        response = jsonify({"status": "failed", "error": "Speech could not be generated"}), 500
+    elif request.args.get('format') == 'json':
+        response = jsonify({"status": "ready", "audio_url": audio_url})
+    else:
+        response = redirect(audio_url)
+    
+    # The answer changes as the job progresses, only the audio it points to is cacheable
+    response = make_response(response)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
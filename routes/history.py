@@ -1,16 +1,40 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, request, jsonify, session, make_response
+import hashlib
 from utils.db_manager import db_manager
 
 history_bp = Blueprint('history', __name__)
 
+# Page size limits for the paginated endpoints
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def _get_page_size(default=DEFAULT_PAGE_SIZE):
+    """Read the limit query parameter, or None if it is not a positive integer"""
+    limit = request.args.get('limit', default, type=int)
+    if limit is None or limit < 1:
+        return None
+    return min(limit, MAX_PAGE_SIZE)
+
+def _conversation_etag(conversation):
+    """ETag for a response derived from the conversation's revision and the query"""
+    key = f"{conversation['conversation_id']}:{conversation['last_updated_at']}:{conversation['revision']}:{request.query_string.decode()}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
 @history_bp.route('/conversation/history', methods=['GET'])
 def get_conversation_history():
     """
     Endpoint to retrieve conversation history for the current user
+    Accepts (all optional):
+    - after: message_id cursor, return only newer messages
+    - before: message_id cursor, return only older messages
+    - limit: page size, when paginating
+    - If-None-Match header: ETag of a previous response
     Returns:
     - conversation_id: ID of the current conversation
     - language_code: Language code of the conversation
-    - messages: List of messages in the conversation
+    - messages: List of messages in the conversation, or one page of them
+    - has_more: Whether more messages exist in the paging direction (paginated requests only)
+    - 304 Not Modified if the conversation has not changed since the given ETag
     """
     user_id = session.get('user_id')
     if not user_id:
@@ -31,45 +55,87 @@ def get_conversation_history():
                 "messages": []
             })
     
-    # Get conversation history
-    conversation_history = db_manager.get_conversation_history(conversation_id)
-    
     # Get conversation details
-    try:
-        conn = db_manager._get_connection()
-        cursor = conn.cursor()
+    conversation = db_manager.get_conversation(conversation_id)
+    language_code = conversation["language_code"] if conversation else None
+    
+    # Answer polling clients without touching the messages if nothing changed
+    etag = _conversation_etag(conversation) if conversation else None
+    if etag and request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    
+    after = request.args.get('after')
+    before = request.args.get('before')
+    paginated = after or before or 'limit' in request.args
+    
+    if paginated:
+        if after and before:
+            return jsonify({"error": "Use either after or before, not both"}), 400
         
-        cursor.execute("""
-        SELECT language_code FROM conversations WHERE conversation_id = ?
-        """, (conversation_id,))
+        limit = _get_page_size()
+        if limit is None:
+            return jsonify({"error": "limit must be a positive integer"}), 400
         
-        result = cursor.fetchone()
-        language_code = result[0] if result else None
+        page = db_manager.get_messages_page(conversation_id, after=after, before=before, limit=limit)
+        if page is None:
+            return jsonify({"error": "Unknown message cursor"}), 400
         
-        conn.close()
-    except Exception as e:
-        print(f"Error getting conversation details: {str(e)}")
-        language_code = None
+        messages, has_more = page
+        response_data = {
+            "conversation_id": conversation_id,
+            "language_code": language_code,
+            "messages": messages,
+            "has_more": has_more
+        }
+    else:
+        # Old clients get the whole conversation
+        response_data = {
+            "conversation_id": conversation_id,
+            "language_code": language_code,
+            "messages": db_manager.get_conversation_history(conversation_id)
+        }
     
-    return jsonify({
-        "conversation_id": conversation_id,
-        "language_code": language_code,
-        "messages": conversation_history
-    })
+    response = jsonify(response_data)
+    if etag:
+        response.set_etag(etag)
+    return response
 
 @history_bp.route('/conversation/list', methods=['GET'])
 def list_conversations():
     """
     Endpoint to list all conversations for the current user
+    Accepts (all optional):
+    - before: conversation_id cursor, return conversations listed after it
+    - limit: page size, when paginating
     Returns:
     - conversations: List of conversation objects with id, language, and timestamps
+    - has_more: Whether more conversations follow (paginated requests only)
     """
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({"error": "User session not found"}), 400
     
-    conversations = db_manager.get_user_conversations(user_id)
+    before = request.args.get('before')
+    if not before and 'limit' not in request.args:
+        conversations = db_manager.get_user_conversations(user_id)
+        
+        return jsonify({
+            "conversations": conversations
+        })
+    
+    limit = _get_page_size(default=20)
+    if limit is None:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    
+    page = db_manager.get_user_conversations_page(user_id, before=before, limit=limit)
+    if page is None:
+        return jsonify({"error": "Unknown conversation cursor"}), 400
+    
+    conversations, has_more = page
     
     return jsonify({
-        "conversations": conversations
+        "conversations": conversations,
+        "has_more": has_more
     })
@@ -1,12 +1,71 @@
-from flask import Blueprint, request, jsonify, session
-import os
-import tempfile
-import uuid
-from utils.whisper_transcriber import transcribe_audio
+from flask import Blueprint, Response, request, jsonify, session, stream_with_context
+import json
+from utils.metrics import timed
+from utils.transcription_service import (
+    transcription_service, TranscriptionBusyError, TranscriptionTimeoutError
+)
+from utils.transcription_cache import transcription_cache
+from utils.stream_transcriber import stream_transcriber, StreamNotFoundError, StreamLimitError, StreamBusyError
 from utils.db_manager import db_manager
 
 transcribe_bp = Blueprint('transcribe', __name__)
 
+# Most messages returned in delta mode, the rest can be paged from /conversation/history
+DELTA_MAX_MESSAGES = 200
+
+# Durations reported back from preprocess_audio()
+AUDIO_STATS = ("audio_duration", "speech_duration", "skipped_duration", "truncated_duration")
+
+def _save_transcription(transcription, language, detected_language, since):
+    """
+    Store a transcription as the user's next message
+    
+    Args:
+        transcription: Transcribed text
+        language: Language code the client asked for, or None
+        detected_language: Language the model detected
+        since: Last message_id the client has seen, or None
+    
+    Returns:
+        dict: Response data with the message and either the new messages or the full history
+    """
+    # Get user_id from session
+    user_id = session.get('user_id')
+    
+    # Get or create a conversation for this user and language
+    language_code = language or detected_language
+    conversation_id = db_manager.get_or_create_conversation(user_id, language_code)
+    
+    # Store conversation_id in session
+    session['conversation_id'] = conversation_id
+    
+    # Add user message to database
+    message_id = db_manager.add_message(conversation_id, "user", transcription)
+    
+    response_data = {
+        "transcription": transcription,
+        "detected_language": detected_language,
+        "conversation_id": conversation_id,
+        "message_id": message_id
+    }
+    
+    # Delta mode: only send what the client has not seen yet
+    delta = db_manager.get_messages_page(conversation_id, after=since, limit=DELTA_MAX_MESSAGES) if since else None
+    if delta:
+        response_data["new_messages"], response_data["has_more"] = delta
+    else:
+        # Old clients, or a cursor from another conversation, get the full history
+        response_data["conversation_history"] = db_manager.get_conversation_history(conversation_id)
+    
+    return response_data
+
+def _read_chunk():
+    """Audio chunk from a multipart 'audio' field or the raw request body"""
+    with timed("upload_save"):
+        if 'audio' in request.files:
+            return request.files['audio'].read()
+        return request.get_data()
+
 @transcribe_bp.route('/transcribe', methods=['POST'])
 def transcribe():
     """
@@ -14,55 +73,148 @@ def transcribe():
     Expects:
     - audio file in request.files['audio']
     - language code in request.form['language']
+    - optionally the last message_id the client has seen in request.form['since']
     Returns:
     - transcribed text
     - detected language (if auto-detection was used)
+    - time the request spent queued for transcription
+    - seconds of audio received, transcribed, skipped as non-speech and cut by the length limit
+    - no_speech instead of a stored message when the clip has no speech
+    - cached when the result was served from the transcription cache
+    - conversation history, or only the messages after 'since' when it is given
     """
-    if 'audio' not in request.files:
+    # The upload is kept in memory and decoded from there, nothing is written to disk
+    with timed("upload_save"):
+        audio_file = request.files.get('audio')
+        audio_data = audio_file.read() if audio_file is not None else None
+    
+    if audio_file is None:
         return jsonify({"error": "No audio file provided"}), 400
     
-    audio_file = request.files['audio']
     language = request.form.get('language', None)  # None means auto-detect
+    since = request.form.get('since')
     
-    # Create a temporary file to store the audio
-    temp_dir = os.path.join(os.getcwd(), 'static')
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    temp_file = os.path.join(temp_dir, f"{uuid.uuid4()}.webm")
-    audio_file.save(temp_file)
+    if not audio_data:
+        return jsonify({"error": "Empty audio file"}), 400
     
     try:
-        # Transcribe the audio
-        transcription, detected_language = transcribe_audio(temp_file, language)
-        
-        # Get user_id from session
-        user_id = session.get('user_id')
+        # Retried and replayed uploads are answered from the cache without inference
+        cache_key = transcription_cache.key(audio_data, language) if transcription_cache.enabled else None
+        cached = transcription_cache.get(cache_key) if cache_key else None
         
-        # Get or create a conversation for this user and language
-        language_code = language or detected_language
-        conversation_id = db_manager.get_or_create_conversation(user_id, language_code)
+        if cached:
+            transcription, detected_language, audio_stats = cached
+            transcription_stats = dict(audio_stats, queue_time=0.0)
+        else:
+            # Transcribe the audio
+            transcription_stats = {}
+            transcription, detected_language = transcription_service.transcribe(audio_data, language, stats=transcription_stats)
+            if cache_key:
+                transcription_cache.put(cache_key, transcription, detected_language,
+                                        {key: transcription_stats.get(key, 0.0) for key in AUDIO_STATS})
         
-        # Store conversation_id in session
-        session['conversation_id'] = conversation_id
+        if transcription_stats.get("speech_duration") == 0:
+            # Nothing was said, don't add an empty message to the conversation
+            response_data = {"transcription": "", "detected_language": detected_language, "no_speech": True}
+        else:
+            response_data = _save_transcription(transcription, language, detected_language, since)
         
-        # Add user message to database
-        db_manager.add_message(conversation_id, "user", transcription)
+        # Time spent waiting for a transcription worker or batch
+        response_data["queue_time_ms"] = round(transcription_stats["queue_time"] * 1000, 1)
+        response_data["audio"] = {key: round(transcription_stats.get(key, 0.0), 2) for key in AUDIO_STATS}
+        response_data["cached"] = cached is not None
         
-        # Clean up the temporary file
-        os.remove(temp_file)
-        
-        # Get conversation history for context
-        conversation_history = db_manager.get_conversation_history(conversation_id)
-        
-        return jsonify({
-            "transcription": transcription,
-            "detected_language": detected_language,
-            "conversation_id": conversation_id,
-            "conversation_history": conversation_history
-        })
+        return jsonify(response_data)
+    
+    except (TranscriptionBusyError, TranscriptionTimeoutError) as e:
+        # Overloaded rather than broken, the client may retry
+        status = 503 if isinstance(e, TranscriptionBusyError) else 504
+        return jsonify({"error": str(e)}), status
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@transcribe_bp.route('/transcribe/stream', methods=['POST'])
+def start_stream():
+    """
+    Endpoint to start a streaming transcription
+    Expects:
+    - optionally a language code in the form or JSON body as 'language'
+    Returns:
+    - stream_id to send the recording's chunks to
+    """
+    body = request.get_json(silent=True) or request.form
+    language = body.get('language') or None  # None means auto-detect
+    
+    try:
+        stream_id = stream_transcriber.open(session.get('user_id'), language)
+    except StreamLimitError as e:
+        return jsonify({"error": str(e)}), 503
+    
+    return jsonify({"stream_id": stream_id})
+
+@transcribe_bp.route('/transcribe/stream/<stream_id>', methods=['POST'])
+def stream_chunk(stream_id):
+    """
+    Endpoint to send the next chunk of a recording
+    Expects:
+    - the chunk as 16 kHz mono 16-bit little-endian PCM, in the raw request body or in request.files['audio']
+    Returns:
+    - newline-delimited JSON, sent as it is decoded: a {"type": "final"} line
+      when a pause ends a segment that will not change anymore, then one
+      {"type": "partial"} line with the text since the last pause
+    """
+    try:
+        events = stream_transcriber.feed(stream_id, session.get('user_id'), _read_chunk())
+    except StreamNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except StreamLimitError as e:
+        return jsonify({"error": str(e)}), 413
+    except StreamBusyError as e:
+        return jsonify({"error": str(e)}), 409
+    
+    def generate():
+        try:
+            for event in events:
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            # Headers are already sent, report the error in the stream
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Ask proxies to pass segments through instead of buffering the response
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@transcribe_bp.route('/transcribe/stream/<stream_id>/finish', methods=['POST'])
+def finish_stream(stream_id):
+    """
+    Endpoint to end a streaming transcription and store it
+    Expects:
+    - optionally a last chunk as the raw request body or in request.files['audio']
+    - optionally the last message_id the client has seen as 'since' (query string or form)
+    Returns:
+    - the same response as /transcribe, no_speech instead of a stored message when nothing was said
+    """
+    since = request.values.get('since')
     
+    try:
+        transcription, detected_language = stream_transcriber.finish(stream_id, session.get('user_id'), _read_chunk())
+    except StreamNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except StreamLimitError as e:
+        return jsonify({"error": str(e)}), 413
+    except StreamBusyError as e:
+        return jsonify({"error": str(e)}), 409
+    except (TranscriptionBusyError, TranscriptionTimeoutError) as e:
+        status = 503 if isinstance(e, TranscriptionBusyError) else 504
+        return jsonify({"error": str(e)}), status
     except Exception as e:
-        # Clean up the temporary file in case of error
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
         return jsonify({"error": str(e)}), 500
+    
+    if not transcription:
+        # Nothing was said, don't add an empty message to the conversation
+        return jsonify({"transcription": "", "detected_language": detected_language, "no_speech": True})
+    
+    # finish() reports the language the stream was opened with, when one was given
+    return jsonify(_save_transcription(transcription, None, detected_language, since))
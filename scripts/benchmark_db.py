@@ -0,0 +1,144 @@
+"""
+Benchmark the hot-path DatabaseManager queries before and after the schema migrations
+
+Builds a throwaway database in the legacy (version 0, unindexed) layout, fills it
+with synthetic conversations, times the history and latest-conversation lookups,
+then opens the same file with DatabaseManager, which upgrades it in place, and
+times them again. The conversation cache is disabled so every call hits SQLite.
+
+Usage:
+    python scripts/benchmark_db.py [--messages 1000000] [--per-conversation 20]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DB_CACHE_SIZE", "0")
+
+from utils.db_manager import DatabaseManager, MIGRATIONS
+
+class LegacyDatabaseManager(DatabaseManager):
+    """DatabaseManager that leaves the schema at version 0, like an old conversation_history.db"""
+    def _migrate(self):
+        pass
+
+def build_legacy_database(db_path, total_messages, per_conversation, users):
+    """Create a version 0 database and fill it with synthetic data"""
+    db = LegacyDatabaseManager(db_path)
+    
+    conversation_count = total_messages // per_conversation
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    conversation_ids = []
+    
+    with db._transaction() as conn:
+        conn.executemany("INSERT INTO users (user_id) VALUES (?)", [(u,) for u in user_ids])
+        
+        conversations = []
+        for i in range(conversation_count):
+            conversation_id = str(uuid.uuid4())
+            conversation_ids.append(conversation_id)
+            conversations.append((
+                conversation_id,
+                random.choice(user_ids),
+                "hi",
+                f"2024-01-01 00:00:00",
+                f"2024-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:{i % 60:02d}"
+            ))
+        conn.executemany("""
+        INSERT INTO conversations (conversation_id, user_id, language_code, started_at, last_updated_at)
+        VALUES (?, ?, ?, ?, ?)
+        """, conversations)
+    
+    # Insert messages in interleaved order, like concurrent users would
+    batch = []
+    for turn in range(per_conversation):
+        for conversation_id in conversation_ids:
+            batch.append((
+                str(uuid.uuid4()),
+                conversation_id,
+                "user" if turn % 2 == 0 else "assistant",
+                f"message {turn} " * 5,
+                None,
+                f"2024-01-01 00:{turn // 60:02d}:{turn % 60:02d}"
+            ))
+            if len(batch) >= 50000:
+                with db._transaction() as conn:
+                    conn.executemany("""
+                    INSERT INTO messages (message_id, conversation_id, role, content, audio_url, timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """, batch)
+                batch = []
+    if batch:
+        with db._transaction() as conn:
+            conn.executemany("""
+            INSERT INTO messages (message_id, conversation_id, role, content, audio_url, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """, batch)
+    
+    return db, user_ids, conversation_ids
+
+def time_query(func, args_list):
+    """Run func over args_list and return latency percentiles in milliseconds"""
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50": statistics.median(samples),
+        "p95": samples[int(len(samples) * 0.95) - 1],
+        "max": samples[-1]
+    }
+
+def run_queries(db, user_ids, conversation_ids, samples):
+    """Time the hot-path queries against random users and conversations"""
+    conversations = [(random.choice(conversation_ids),) for _ in range(samples)]
+    users = [(random.choice(user_ids),) for _ in range(samples)]
+    return {
+        "get_conversation_history": time_query(db.get_conversation_history, conversations),
+        "get_latest_conversation": time_query(db.get_latest_conversation, users),
+        "get_user_conversations": time_query(db.get_user_conversations, users)
+    }
+
+def print_results(label, results):
+    print(f"\n{label}")
+    for name, stats in results.items():
+        print(f"  {name:<28} p50 {stats['p50']:9.3f} ms   p95 {stats['p95']:9.3f} ms   max {stats['max']:9.3f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--per-conversation", type=int, default=20)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--samples", type=int, default=50)
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "benchmark.db")
+        
+        start = time.perf_counter()
+        db, user_ids, conversation_ids = build_legacy_database(db_path, args.messages, args.per_conversation, args.users)
+        print(f"Built {args.messages} messages in {len(conversation_ids)} conversations for {len(user_ids)} users "
+              f"in {time.perf_counter() - start:.1f}s")
+        
+        print_results(f"Schema version {db.get_schema_version()} (no indexes)", run_queries(db, user_ids, conversation_ids, args.samples))
+        
+        db.close()
+        
+        start = time.perf_counter()
+        db = DatabaseManager(db_path)
+        print(f"\nMigrated in place to version {db.get_schema_version()} in {time.perf_counter() - start:.1f}s")
+        
+        print_results(f"Schema version {MIGRATIONS[-1][0]}", run_queries(db, user_ids, conversation_ids, args.samples))
+        db.close()
+
+if __name__ == "__main__":
+    main()
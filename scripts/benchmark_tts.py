@@ -0,0 +1,75 @@
+"""
+Benchmark the configured TTS backends
+
+Synthesizes the fixed questions, plus a longer loan recommendation, with each
+backend directly (no cache, no fallback) and reports latency percentiles,
+timeouts and failures. Use --backends espeak to measure without network access.
+
+Usage:
+    python scripts/benchmark_tts.py [--backends gtts,espeak] [--languages hi,en] [--rounds 3] [--concurrency 1]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.tts_generator import BACKENDS, SUPPORTED_LANGUAGES
+from utils.groq_client import FORCED_QUESTIONS
+
+SENTENCES = FORCED_QUESTIONS + [
+    "Based on your needs, I recommend a Farm Mechanization Loan with 9.0% interest. "
+    "This is designed for purchasing tractors and farm equipment. "
+    "Visit your local bank with ID and income proof to apply."
+]
+
+def run_backend(backend, jobs, concurrency):
+    """Synthesize every (text, language) job and return per-call latencies in milliseconds"""
+    def timed(job):
+        start = time.perf_counter()
+        audio = backend.synthesize(*job)
+        return (time.perf_counter() - start) * 1000, audio is not None
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(timed, jobs))
+
+def print_results(backend, results, wall_time):
+    samples = sorted(latency for latency, ok in results)
+    failures = sum(1 for latency, ok in results if not ok)
+    status = backend.get_status()
+    print(f"\n{backend.name} (timeout {backend.timeout}s, concurrency {backend.concurrency})")
+    print(f"  calls {len(results)}   failed {failures}   timeouts {status['timeouts']}   busy {status['busy']}   "
+          f"wall {wall_time:.1f}s")
+    print(f"  p50 {statistics.median(samples):9.1f} ms   p95 {samples[max(0, int(len(samples) * 0.95) - 1)]:9.1f} ms   "
+          f"max {samples[-1]:9.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--languages", default=",".join(SUPPORTED_LANGUAGES))
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+    
+    languages = [language for language in args.languages.split(",") if language]
+    jobs = [(text, language) for _ in range(args.rounds) for language in languages for text in SENTENCES]
+    
+    for name in args.backends.split(","):
+        if name not in BACKENDS:
+            print(f"\nUnknown backend '{name}', choose from {', '.join(BACKENDS)}")
+            continue
+        
+        backend = BACKENDS[name]()
+        if not backend.is_available():
+            print(f"\n{name} is not available on this machine, skipping it")
+            continue
+        
+        start = time.perf_counter()
+        results = run_backend(backend, jobs, args.concurrency)
+        print_results(backend, results, time.perf_counter() - start)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Fake Groq API for local testing
+
+Serves the OpenAI-compatible chat completions endpoint the Groq client calls,
+answering every request with the same reply, streamed word by word with a
+delay when the client asks for a stream. Point the app at it with
+GROQ_BASE_URL=http://localhost:8008 (any GROQ_API_KEY works).
+
+Use --fail-model to make requests for a model fail with a 503, e.g. to watch
+the app fail over to the next model in GROQ_MODELS.
+
+Usage:
+    python scripts/fake_groq_server.py [--port 8008] [--token-delay 0.05] [--first-token-delay 0.3] [--reply "..."]
+                                       [--fail-model llama3-8b-8192]
+"""
+import argparse
+import json
+import re
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = (
+    "Based on your needs, I recommend a Farm Mechanization Loan with 9.0% interest. "
+    "This is designed for purchasing tractors and farm equipment. "
+    "Visit your local bank with ID and income proof to apply."
+)
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    # Set from the command line in main()
+    reply = DEFAULT_REPLY
+    token_delay = 0.05
+    first_token_delay = 0.3
+    failing_models = set()
+    
+    protocol_version = "HTTP/1.1"
+    
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        model = body.get("model", "fake-model")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        
+        if model in self.failing_models:
+            self._send_json(503, {"error": {"message": f"{model} is over capacity", "type": "service_unavailable"}})
+            return
+        
+        time.sleep(self.first_token_delay)
+        if body.get("stream"):
+            self._stream(completion_id, model)
+        else:
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self.reply},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            })
+    
+    def _chunk(self, completion_id, model, delta, finish_reason=None):
+        return {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+    
+    def _stream(self, completion_id, model):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        
+        # Words with their following whitespace, like a tokenizer would split them
+        pieces = [{"role": "assistant", "content": ""}]
+        pieces += [{"content": word} for word in re.findall(r"\S+\s*", self.reply)]
+        for delta in pieces:
+            self._send_event(self._chunk(completion_id, model, delta))
+            time.sleep(self.token_delay)
+        
+        self._send_event(self._chunk(completion_id, model, {}, "stop"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+    
+    def _send_event(self, data):
+        self.wfile.write(f"data: {json.dumps(data)}\n\n".encode())
+        self.wfile.flush()
+    
+    def _send_json(self, status, data):
+        payload = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--token-delay", type=float, default=0.05, help="Seconds between streamed words")
+    parser.add_argument("--first-token-delay", type=float, default=0.3, help="Seconds before the first word")
+    parser.add_argument("--reply", default=DEFAULT_REPLY)
+    parser.add_argument("--fail-model", action="append", default=[], help="Answer requests for this model with a 503")
+    args = parser.parse_args()
+    
+    FakeGroqHandler.reply = args.reply
+    FakeGroqHandler.token_delay = args.token_delay
+    FakeGroqHandler.first_token_delay = args.first_token_delay
+    FakeGroqHandler.failing_models = set(args.fail_model)
+    
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), FakeGroqHandler)
+    print(f"Fake Groq API listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
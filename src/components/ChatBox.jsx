@@ -20,7 +20,7 @@ const ChatBox = ({ messages, isProcessing }) => {
               <p>{message.content}</p>
               {message.audio && message.role === 'assistant' && (
                 <div className="audio-controls">
-                  <audio controls src={message.audio}>
+                  <audio controls preload="none" src={message.audio}>
                     Your browser does not support the audio element.
                   </audio>
                 </div>
@@ -1,6 +1,30 @@
 import { useState, useRef, useEffect } from 'react';
 import axios from 'axios';
 
+// How often the audio recorded since the last chunk is streamed to the server
+const STREAM_TIMESLICE_MS = 1000;
+// The stream takes 16 kHz mono 16-bit PCM, so the server never decodes the recording again
+const STREAM_SAMPLE_RATE = 16000;
+
+// Downsample float samples to the stream's rate as little-endian 16-bit PCM
+const toPcm16 = (samples, fromRate) => {
+  const ratio = fromRate / STREAM_SAMPLE_RATE;
+  const length = Math.floor(samples.length / ratio);
+  const view = new DataView(new ArrayBuffer(length * 2));
+  for (let i = 0; i < length; i++) {
+    // Average the input samples that fall into this output sample
+    const start = Math.floor(i * ratio);
+    const end = Math.max(start + 1, Math.min(samples.length, Math.floor((i + 1) * ratio)));
+    let sum = 0;
+    for (let j = start; j < end; j++) {
+      sum += samples[j];
+    }
+    const value = Math.max(-1, Math.min(1, sum / (end - start)));
+    view.setInt16(i * 2, value < 0 ? value * 0x8000 : value * 0x7fff, true);
+  }
+  return view.buffer;
+};
+
 const Recorder = ({ 
   selectedLanguage, 
   onNewMessage, 
@@ -14,6 +38,169 @@ const Recorder = ({
   const [conversationId, setConversationId] = useState(null);
   const mediaRecorderRef = useRef(null);
   const audioChunksRef = useRef([]);
+  // Last message the server has sent us, so responses only carry new messages
+  const lastMessageIdRef = useRef(null);
+  // Streaming transcription: the open stream and the chain of chunk uploads, sent in order
+  const streamIdRef = useRef(null);
+  const chunkChainRef = useRef(Promise.resolve());
+  // Microphone samples captured for the stream since the last chunk was sent
+  const audioContextRef = useRef(null);
+  const capturedRef = useRef([]);
+  const chunkTimerRef = useRef(null);
+  const [liveTranscript, setLiveTranscript] = useState({ final: '', partial: '' });
+  // Streamed reply: the text so far, and the chain of sentence audio, played in order
+  const [liveReply, setLiveReply] = useState('');
+  const playbackChainRef = useRef(Promise.resolve());
+
+  // Play one audio URL, resolving once it has finished (or failed to play)
+  const playAudio = (audioUrl) => new Promise(resolve => {
+    // Make sure we use the full URL for audio files
+    const fullAudioUrl = audioUrl.startsWith('http') ? audioUrl : `http://localhost:5000${audioUrl}`;
+    const audio = new Audio(fullAudioUrl);
+    audio.onended = resolve;
+    audio.onerror = resolve;
+    audio.play().catch(resolve);
+  });
+
+  // Ask for the reply as Server-Sent Events, playing each sentence's speech as soon as it arrives
+  // Resolves to the final response data, or null if the stream could not be opened
+  const askStream = async (body) => {
+    let response;
+    try {
+      response = await fetch('http://localhost:5000/ask/stream', {
+        method: 'POST',
+        body: JSON.stringify(body),
+        headers: { 'Content-Type': 'application/json' },
+        credentials: 'include'
+      });
+    } catch (err) {
+      console.error('Could not start streaming reply:', err);
+      return null;
+    }
+    if (response.status === 502 || response.status === 503) {
+      // The assistant is unavailable or answered with nothing, asking again through /ask would not help
+      const data = await response.json();
+      throw new Error(data.error);
+    }
+    if (!response.ok) {
+      return null;
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) {
+        break;
+      }
+      buffered += decoder.decode(value, { stream: true });
+      const blocks = buffered.split('\n\n');
+      buffered = blocks.pop();
+      
+      for (const block of blocks) {
+        const eventLine = block.split('\n').find(line => line.startsWith('event: '));
+        const dataLine = block.split('\n').find(line => line.startsWith('data: '));
+        if (!eventLine || !dataLine) {
+          continue;
+        }
+        const type = eventLine.slice('event: '.length);
+        const data = JSON.parse(dataLine.slice('data: '.length));
+        
+        if (type === 'token') {
+          setLiveReply(current => current + data.text);
+        } else if (type === 'audio') {
+          const sentenceUrl = data.audio_url || data.audio_pending_url;
+          if (sentenceUrl) {
+            playbackChainRef.current = playbackChainRef.current.then(() => playAudio(sentenceUrl));
+          }
+        } else if (type === 'done') {
+          return data;
+        } else if (type === 'error') {
+          throw new Error(data.error);
+        }
+      }
+    }
+    throw new Error('Reply stream ended early');
+  };
+
+  // Stream the samples captured since the last chunk
+  const flushCaptured = () => {
+    const captured = capturedRef.current;
+    capturedRef.current = [];
+    if (!captured.length || !audioContextRef.current) {
+      return;
+    }
+    
+    const samples = new Float32Array(captured.reduce((total, buffer) => total + buffer.length, 0));
+    let offset = 0;
+    captured.forEach(buffer => {
+      samples.set(buffer, offset);
+      offset += buffer.length;
+    });
+    const chunk = toPcm16(samples, audioContextRef.current.sampleRate);
+    chunkChainRef.current = chunkChainRef.current.then(() => sendChunk(chunk));
+  };
+
+  // Stop capturing samples for the stream, sending whatever is left
+  const stopCapture = () => {
+    clearInterval(chunkTimerRef.current);
+    chunkTimerRef.current = null;
+    flushCaptured();
+    if (audioContextRef.current) {
+      audioContextRef.current.close();
+      audioContextRef.current = null;
+    }
+  };
+
+  // Send one chunk of the recording and apply the segments the server sends back as they arrive
+  const sendChunk = async (chunk) => {
+    const streamId = streamIdRef.current;
+    if (!streamId) {
+      return;
+    }
+    
+    try {
+      const response = await fetch(`http://localhost:5000/transcribe/stream/${streamId}`, {
+        method: 'POST',
+        body: chunk,
+        headers: { 'Content-Type': 'application/octet-stream' },
+        credentials: 'include'
+      });
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+      
+      // The response is newline-delimited JSON, one event per decoded segment
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = '';
+      for (;;) {
+        const { done, value } = await reader.read();
+        if (done) {
+          break;
+        }
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split('\n');
+        buffered = lines.pop();
+        
+        lines.filter(line => line.trim()).forEach(line => {
+          const event = JSON.parse(line);
+          if (event.type === 'final') {
+            setLiveTranscript(current => ({ ...current, final: `${current.final} ${event.text}`.trim() }));
+          } else if (event.type === 'partial') {
+            setLiveTranscript(current => ({ ...current, partial: event.text }));
+          } else if (event.type === 'error') {
+            throw new Error(event.error);
+          }
+        });
+      }
+    } catch (err) {
+      // Fall back to uploading the whole recording once it stops
+      console.error('Streaming transcription failed:', err);
+      streamIdRef.current = null;
+    }
+  };
 
   // Start recording audio
   const startRecording = async () => {
@@ -27,6 +214,37 @@ const Recorder = ({
       const mediaRecorder = new MediaRecorder(stream);
       mediaRecorderRef.current = mediaRecorder;
       audioChunksRef.current = [];
+      setLiveTranscript({ final: '', partial: '' });
+      
+      // Open a streaming transcription, without one the recording is uploaded when it stops
+      streamIdRef.current = null;
+      chunkChainRef.current = Promise.resolve();
+      try {
+        const streamResponse = await axios.post('http://localhost:5000/transcribe/stream', {
+          language: selectedLanguage
+        }, {
+          withCredentials: true
+        });
+        streamIdRef.current = streamResponse.data.stream_id;
+      } catch (err) {
+        console.error('Could not start streaming transcription:', err);
+      }
+      
+      // Capture raw samples for the stream, the recording itself is only uploaded if streaming fails
+      capturedRef.current = [];
+      if (streamIdRef.current) {
+        const audioContext = new AudioContext();
+        const source = audioContext.createMediaStreamSource(stream);
+        const processor = audioContext.createScriptProcessor(4096, 1, 1);
+        processor.onaudioprocess = (event) => {
+          capturedRef.current.push(new Float32Array(event.inputBuffer.getChannelData(0)));
+        };
+        source.connect(processor);
+        // The processor only runs while connected to an output, it writes silence to it
+        processor.connect(audioContext.destination);
+        audioContextRef.current = audioContext;
+        chunkTimerRef.current = setInterval(flushCaptured, STREAM_TIMESLICE_MS);
+      }
       
       // Handle data available event
       mediaRecorder.ondataavailable = (event) => {
@@ -50,6 +268,7 @@ const Recorder = ({
   // Stop recording audio
   const stopRecording = () => {
     if (mediaRecorderRef.current && isRecording) {
+      stopCapture();
       mediaRecorderRef.current.stop();
       setIsRecording(false);
       
@@ -63,61 +282,105 @@ const Recorder = ({
     try {
       setIsProcessing(true);
       
-      // Create audio blob from recorded chunks
-      const audioBlob = new Blob(audioChunksRef.current, { type: 'audio/webm' });
-      
-      // Create form data for API request
-      const formData = new FormData();
-      formData.append('audio', audioBlob);
-      formData.append('language', selectedLanguage);
+      // Wait for the last chunks to reach the stream
+      await chunkChainRef.current;
       
-      // Send to transcription API
-      const transcribeResponse = await axios.post('http://localhost:5000/transcribe', formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data'
-        },
-        withCredentials: true
-      });
+      let transcribeResponse;
+      if (streamIdRef.current) {
+        // Most of the recording is already transcribed, finishing only decodes the tail
+        transcribeResponse = await axios.post(
+          `http://localhost:5000/transcribe/stream/${streamIdRef.current}/finish`,
+          null,
+          {
+            params: lastMessageIdRef.current ? { since: lastMessageIdRef.current } : {},
+            withCredentials: true
+          }
+        );
+        streamIdRef.current = null;
+      } else {
+        // Create audio blob from recorded chunks
+        const audioBlob = new Blob(audioChunksRef.current, { type: 'audio/webm' });
+        
+        // Create form data for API request
+        const formData = new FormData();
+        formData.append('audio', audioBlob);
+        formData.append('language', selectedLanguage);
+        if (lastMessageIdRef.current) {
+          formData.append('since', lastMessageIdRef.current);
+        }
+        
+        // Send to transcription API
+        transcribeResponse = await axios.post('http://localhost:5000/transcribe', formData, {
+          headers: {
+            'Content-Type': 'multipart/form-data'
+          },
+          withCredentials: true
+        });
+      }
       
       const { 
         transcription, 
         conversation_id, 
-        conversation_history 
+        message_id,
+        no_speech
       } = transcribeResponse.data;
       
+      if (no_speech) {
+        setError('No speech detected, please try again.');
+        setIsProcessing(false);
+        return;
+      }
+      
       // Store conversation ID
       setConversationId(conversation_id);
+      lastMessageIdRef.current = message_id;
       
       // Update UI with transcribed text
       onNewMessage(transcription);
       
       // Conversation history handling removed
       
-      // Send transcribed text to AI for response
-      const askResponse = await axios.post('http://localhost:5000/ask', {
+      // Send transcribed text to AI for response, streamed so speech starts with the first sentence
+      setLiveReply('');
+      const askBody = {
         message: transcription,
-        language: selectedLanguage
-      }, {
-        withCredentials: true
-      });
+        language: selectedLanguage,
+        since: lastMessageIdRef.current
+      };
+      let askData = await askStream(askBody);
+      const streamed = askData !== null;
+      if (!streamed) {
+        const askResponse = await axios.post('http://localhost:5000/ask', {
+          ...askBody,
+          // Get the text right away, speech that isn't cached yet follows at audio_pending_url
+          async_audio: true
+        }, {
+          withCredentials: true
+        });
+        askData = askResponse.data;
+      }
+      setLiveReply('');
       
       const { 
         response, 
-        audio_url, 
-        conversation_history: updated_history 
-      } = askResponse.data;
+        audio_url: ready_audio_url, 
+        audio_pending_url,
+        message_id: response_message_id 
+      } = askData;
+      
+      lastMessageIdRef.current = response_message_id;
+      
+      // The pending URL waits for the speech and then redirects to it, so it plays like any audio URL
+      const audio_url = ready_audio_url || audio_pending_url;
       
       // Update UI with AI response
       onAIResponse(response, audio_url);
       
       // Updated conversation history handling removed
       
-      // Play audio response if available
-      if (audio_url) {
-        // Make sure we use the full URL for audio files
-        const fullAudioUrl = audio_url.startsWith('http') ? audio_url : `http://localhost:5000${audio_url}`;
-        const audio = new Audio(fullAudioUrl);
-        audio.play();
+      // Play audio response if available, a streamed reply is already playing sentence by sentence
+      if (audio_url && !streamed) {
+        playbackChainRef.current = playbackChainRef.current.then(() => playAudio(audio_url));
       }
       
       setIsProcessing(false);
@@ -140,6 +403,16 @@ const Recorder = ({
         {isRecording ? 'Stop Recording' : 'Start Recording'}
       </button>
       
+      {(isRecording || isProcessing) && (liveTranscript.final || liveTranscript.partial) && (
+        <div className="live-transcript">
+          {liveTranscript.final} <span className="text-muted">{liveTranscript.partial}</span>
+        </div>
+      )}
+      
+      {isProcessing && liveReply && (
+        <div className="live-transcript">{liveReply}</div>
+      )}
+      
       {isProcessing && (
         <div className="processing-indicator">
           <div className="spinner-border text-primary" role="status">
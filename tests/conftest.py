@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# The app's modules create their singletons on import, e.g. the SQLite
+# database in the working directory, so run the tests from a scratch one
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp(prefix="smart-loan-helper-tests-"))
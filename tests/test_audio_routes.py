@@ -0,0 +1,72 @@
+import os
+import pytest
+from flask import Flask
+from routes.audio import audio_bp
+
+AUDIO = bytes(range(256)) * 4
+
+@pytest.fixture
+def static_dir(tmp_path):
+    for name in ("tts/ab/cd/0123abcd-gtts.mp3", "reply-1234.mp3"):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(AUDIO)
+    return tmp_path
+
+@pytest.fixture
+def client(static_dir):
+    app = Flask(__name__, static_folder=str(static_dir))
+    app.register_blueprint(audio_bp)
+    return app.test_client()
+
+def test_cached_speech_is_immutable(client):
+    response = client.get("/audio/tts/ab/cd/0123abcd-gtts.mp3")
+    assert response.status_code == 200
+    assert response.data == AUDIO
+    assert response.cache_control.immutable
+    assert response.cache_control.max_age == 365 * 24 * 3600
+    assert response.headers["Accept-Ranges"] == "bytes"
+
+def test_other_audio_is_revalidated(client):
+    response = client.get("/audio/reply-1234.mp3")
+    assert response.status_code == 200
+    assert not response.cache_control.immutable
+    assert response.cache_control.max_age is None
+
+def test_etag_is_the_file_name_and_survives_a_touch(client, static_dir):
+    response = client.get("/audio/reply-1234.mp3")
+    assert response.get_etag() == ("reply-1234", False)
+    
+    # The storage sweeper's LRU bookkeeping changes the mtime, not the content
+    stamp = os.stat(static_dir / "reply-1234.mp3").st_mtime - 7200
+    os.utime(static_dir / "reply-1234.mp3", (stamp, stamp))
+    assert client.get("/audio/reply-1234.mp3").get_etag() == ("reply-1234", False)
+
+def test_matching_etag_gets_not_modified(client):
+    response = client.get("/audio/tts/ab/cd/0123abcd-gtts.mp3", headers={"If-None-Match": '"0123abcd-gtts"'})
+    assert response.status_code == 304
+    assert response.data == b""
+    
+    response = client.get("/audio/tts/ab/cd/0123abcd-gtts.mp3", headers={"If-None-Match": '"something-else"'})
+    assert response.status_code == 200
+
+def test_range_request_gets_partial_content(client):
+    response = client.get("/audio/reply-1234.mp3", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.data == AUDIO[100:200]
+    assert response.headers["Content-Range"] == f"bytes 100-199/{len(AUDIO)}"
+    
+    response = client.get("/audio/reply-1234.mp3", headers={"Range": f"bytes={len(AUDIO)}-"})
+    assert response.status_code == 416
+
+def test_serving_refreshes_an_old_file(client, static_dir):
+    path = static_dir / "reply-1234.mp3"
+    stamp = os.stat(path).st_mtime - 30 * 24 * 3600
+    os.utime(path, (stamp, stamp))
+    
+    client.get("/audio/reply-1234.mp3")
+    assert os.stat(path).st_mtime > stamp + 29 * 24 * 3600
+
+def test_missing_audio_is_not_found(client):
+    assert client.get("/audio/missing.mp3").status_code == 404
+    assert client.get("/audio/../secret.mp3").status_code == 404
@@ -0,0 +1,54 @@
+import os
+import time
+import pytest
+from utils.audio_storage import AudioStorage
+from utils.db_manager import db_manager
+
+@pytest.fixture
+def storage(tmp_path):
+    # No size or age allowance, so everything unprotected is deleted
+    return AudioStorage(root=str(tmp_path), max_mb=0, max_age_days=0, interval=0)
+
+def write(storage, relative_path, age_seconds):
+    path = os.path.join(storage.root, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"\0" * 1024)
+    stamp = time.time() - age_seconds
+    os.utime(path, (stamp, stamp))
+    return path
+
+def test_sweep_keeps_referenced_and_pinned_audio(storage, tmp_path):
+    conversation = db_manager.create_conversation(db_manager.create_user(), "hi")
+    referenced = write(storage, "tts/aa/bb/referenced-gtts.mp3", 7200)
+    db_manager.add_message(conversation, "assistant", "reply", storage.url_for("tts/aa/bb/referenced-gtts.mp3"))
+    pinned = write(storage, "tts/aa/cc/pinned-gtts.mp3", 7200)
+    unused = write(storage, "tts/aa/dd/unused-gtts.mp3", 7200)
+    recent = write(storage, "tts/aa/ee/recent-gtts.mp3", 60)
+    orphan = write(storage, "upload.webm", 7200)
+    
+    # Pinned by another process, which only shares the database
+    AudioStorage(root=str(tmp_path)).pin(storage.url_for("tts/aa/cc/pinned-gtts.mp3"))
+    assert storage.is_pinned(storage.url_for("tts/aa/cc/pinned-gtts.mp3"))
+    
+    stats = storage.sweep()
+    assert os.path.exists(referenced)
+    assert os.path.exists(pinned)
+    # Files this new may belong to a message still being stored
+    assert os.path.exists(recent)
+    assert not os.path.exists(unused)
+    assert not os.path.exists(orphan)
+    assert stats["deleted"] == 1
+    assert stats["orphans_deleted"] == 1
+    assert stats["kept_referenced"] == 2
+
+def test_touch_refreshes_old_files_only(storage):
+    old = write(storage, "tts/aa/bb/old-gtts.mp3", 7200)
+    new = write(storage, "tts/aa/bb/new-gtts.mp3", 60)
+    new_mtime = os.stat(new).st_mtime
+    
+    storage.touch(old)
+    storage.touch(new)
+    storage.touch(os.path.join(storage.root, "missing.mp3"))
+    assert time.time() - os.stat(old).st_mtime < 60
+    assert os.stat(new).st_mtime == new_mtime
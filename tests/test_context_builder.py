@@ -0,0 +1,101 @@
+from utils.context_builder import ContextBuilder, count_message_tokens, count_tokens, truncate_text
+
+SYSTEM = "You are a loan advisor."
+
+def pinned_history():
+    """The three fixed questions and their answers"""
+    history = []
+    for number in range(1, 4):
+        history.append({"role": "assistant", "content": f"Question {number}?"})
+        history.append({"role": "user", "content": f"Answer {number}"})
+    return history
+
+def chat(turns, words=40):
+    """Exchanges after the fixed questions, ending with the user's current message"""
+    history = []
+    for turn in range(turns):
+        history.append({"role": "assistant", "content": f"Reply {turn} " + "detail " * words})
+        history.append({"role": "user", "content": f"Follow-up {turn} " + "more " * words})
+    return history
+
+def contents(messages):
+    return [msg["content"] for msg in messages]
+
+def test_count_tokens_counts_indic_scripts_higher():
+    assert count_tokens("") == 0
+    assert count_tokens("loan") == 1
+    assert count_tokens("home loan") == 3
+    # Runs of Indic characters and of ASCII are counted separately
+    assert count_tokens("ऋणऋणऋण") == 5
+    assert count_tokens("ऋण की") == 5
+    assert count_tokens("ऋणऋणऋण") > count_tokens("loanloanloan")
+
+def test_truncate_text_marks_the_cut():
+    text = "word " * 100
+    assert truncate_text("short text", 10) == "short text"
+    
+    cut = truncate_text(text, 10)
+    assert cut.endswith(" …")
+    assert text.startswith(cut[:-2])
+    assert count_tokens(cut) <= 10
+
+def test_history_within_budget_is_kept_as_it_is():
+    builder = ContextBuilder(max_tokens=3000)
+    history = pinned_history() + chat(2)
+    
+    messages = builder.build(SYSTEM, history, 3)
+    assert messages == [{"role": "system", "content": SYSTEM}] + history
+    assert builder.get_status()["trimmed_builds"] == 0
+
+def test_older_messages_are_summarized_to_fit_the_budget():
+    builder = ContextBuilder(max_tokens=400, summary_max_tokens=80)
+    history = pinned_history() + chat(20)
+    
+    messages = builder.build(SYSTEM, history, 3)
+    assert count_message_tokens(messages) <= 400
+    # The system prompt and the fixed questions' answers are always kept
+    assert messages[:7] == [{"role": "system", "content": SYSTEM}] + pinned_history()
+    summary = messages[7]
+    assert summary["role"] == "system"
+    assert summary["content"].startswith("Earlier in this conversation")
+    assert count_message_tokens([summary]) <= 80
+    # The newest messages follow in order, ending with the current one
+    kept = messages[8:]
+    assert kept == history[-len(kept):]
+    assert len(kept) < len(history) - 6
+    
+    status = builder.get_status()
+    assert status["trimmed_builds"] == 1
+    assert status["dropped_messages"] == len(history) - 6 - len(kept)
+    assert status["prompt_tokens_last"] == count_message_tokens(messages)
+
+def test_summary_quotes_the_newest_left_out_messages():
+    builder = ContextBuilder(max_tokens=400, summary_max_tokens=60)
+    history = pinned_history() + chat(20)
+    
+    messages = builder.build(SYSTEM, history, 3)
+    lines = messages[7]["content"].splitlines()[1:]
+    kept = messages[8:]
+    newest_dropped = history[len(history) - len(kept) - 1]
+    speaker = "User" if newest_dropped["role"] == "user" else "You"
+    assert lines[-1] == f"- {speaker}: {newest_dropped['content'][:80].rstrip()} …"
+    assert not any("Follow-up 0 " in line for line in lines)
+
+def test_long_messages_are_cut():
+    builder = ContextBuilder(max_tokens=3000, message_max_tokens=20)
+    history = pinned_history() + [{"role": "user", "content": "please explain " * 200}]
+    
+    messages = builder.build(SYSTEM, history, 3)
+    assert messages[-1]["content"].endswith(" …")
+    assert count_tokens(messages[-1]["content"]) <= 20
+    assert builder.get_status()["truncated_messages"] == 1
+    # The caller's history is left as it was
+    assert history[-1]["content"] == "please explain " * 200
+
+def test_current_message_is_kept_over_budget():
+    builder = ContextBuilder(max_tokens=50, message_max_tokens=300, summary_max_tokens=20)
+    history = pinned_history() + chat(3, words=200)
+    
+    messages = builder.build(SYSTEM, history, 3)
+    assert messages[-1] == history[-1]
+    assert contents(messages[1:7]) == contents(pinned_history())
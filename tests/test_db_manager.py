@@ -0,0 +1,327 @@
+import threading
+import pytest
+from utils.db_manager import DatabaseManager, MIGRATIONS
+
+@pytest.fixture
+def db(tmp_path):
+    manager = DatabaseManager(db_path=str(tmp_path / "test.db"))
+    yield manager
+    manager.close()
+
+@pytest.fixture
+def conversation(db):
+    return db.create_conversation(db.create_user(), "hi")
+
+def add_messages(db, conversation_id, count):
+    return [db.add_message(conversation_id, "user", f"message {index}") for index in range(count)]
+
+def ids(messages):
+    return [message["message_id"] for message in messages]
+
+def test_load_messages_caches_and_appends_writes(db, conversation):
+    first = add_messages(db, conversation, 2)
+    assert ids(db.get_conversation_history(conversation)) == first
+    
+    # Written through to the cached copy, no second read
+    second = db.add_message(conversation, "assistant", "reply")
+    assert ids(db.get_conversation_history(conversation)) == first + [second]
+    assert db.cache_stats()["misses"] == 1
+    assert db.cache_stats()["hits"] == 1
+
+def test_load_messages_does_not_cache_a_read_that_raced_a_write(db, conversation, monkeypatch):
+    first = db.add_message(conversation, "user", "before")
+    read_messages = db._read_messages
+    written = []
+    
+    def read_then_write(conversation_id):
+        messages = read_messages(conversation_id)
+        # Lands after the read but before the load caches its result
+        if not written:
+            written.append(db.add_message(conversation_id, "assistant", "during"))
+        return messages
+    
+    monkeypatch.setattr(db, "_read_messages", read_then_write)
+    assert ids(db._load_messages(conversation)) == [first]
+    assert db.cache_stats()["size"] == 0
+    
+    assert ids(db._load_messages(conversation)) == [first] + written
+
+def test_load_messages_under_concurrent_writes(db, conversation):
+    writers = 4
+    per_writer = 25
+    written = [[] for _ in range(writers)]
+    errors = []
+    done = threading.Event()
+    
+    def write(index):
+        try:
+            for number in range(per_writer):
+                written[index].append(db.add_message(conversation, "user", f"{index}-{number}"))
+        except Exception as e:
+            errors.append(e)
+    
+    def read():
+        try:
+            while not done.is_set():
+                messages = db.get_conversation_history(conversation)
+                assert len(ids(messages)) == len(set(ids(messages)))
+        except Exception as e:
+            errors.append(e)
+    
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    threads = [threading.Thread(target=write, args=(index,)) for index in range(writers)]
+    for thread in readers + threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.set()
+    for thread in readers:
+        thread.join()
+    
+    assert not errors
+    cached = ids(db.get_conversation_history(conversation))
+    assert cached == ids(db._read_messages(conversation))
+    assert sorted(cached) == sorted(sum(written, []))
+    # Each writer's messages keep their order
+    for messages in written:
+        assert [message_id for message_id in cached if message_id in messages] == messages
+
+def test_writes_to_other_conversations_are_not_serialized(db, conversation):
+    other = db.create_conversation(db.create_user(), "hi")
+    written = []
+    
+    with db._conversation_lock(conversation):
+        thread = threading.Thread(target=lambda: written.append(db.add_message(other, "user", "hello")))
+        thread.start()
+        thread.join(timeout=5)
+    
+    assert written
+    assert db._write_locks == {}
+
+def test_messages_page_without_cursor_is_the_newest(db, conversation):
+    message_ids = add_messages(db, conversation, 5)
+    
+    messages, has_more = db.get_messages_page(conversation, limit=2)
+    assert ids(messages) == message_ids[3:]
+    assert has_more
+    
+    messages, has_more = db.get_messages_page(conversation, limit=5)
+    assert ids(messages) == message_ids
+    assert not has_more
+
+def test_messages_page_before_walks_back_to_the_start(db, conversation):
+    message_ids = add_messages(db, conversation, 5)
+    
+    messages, has_more = db.get_messages_page(conversation, before=message_ids[3], limit=2)
+    assert ids(messages) == message_ids[1:3]
+    assert has_more
+    
+    messages, has_more = db.get_messages_page(conversation, before=message_ids[1], limit=2)
+    assert ids(messages) == message_ids[:1]
+    assert not has_more
+
+def test_messages_page_after_returns_newer_messages(db, conversation):
+    message_ids = add_messages(db, conversation, 5)
+    
+    messages, has_more = db.get_messages_page(conversation, after=message_ids[0], limit=2)
+    assert ids(messages) == message_ids[1:3]
+    assert has_more
+    
+    messages, has_more = db.get_messages_page(conversation, after=message_ids[2], limit=2)
+    assert ids(messages) == message_ids[3:]
+    assert not has_more
+    
+    assert db.get_messages_page(conversation, after=message_ids[-1]) == ([], False)
+
+def test_messages_page_unknown_cursor(db, conversation):
+    add_messages(db, conversation, 2)
+    other = db.create_conversation(db.create_user(), "hi")
+    other_id = db.add_message(other, "user", "elsewhere")
+    
+    assert db.get_messages_page(conversation, after="missing") is None
+    assert db.get_messages_page(conversation, before="missing") is None
+    # A message of another conversation is not a cursor for this one
+    assert db.get_messages_page(conversation, before=other_id) is None
+
+def test_messages_page_includes_queued_messages(tmp_path):
+    db = DatabaseManager(db_path=str(tmp_path / "queued.db"), write_behind=True)
+    conversation = db.create_conversation(db.create_user(), "hi")
+    message_ids = add_messages(db, conversation, 4)
+    
+    # Readable right away, whether the writer committed them yet or not
+    messages, has_more = db.get_messages_page(conversation, limit=3)
+    assert ids(messages) == message_ids[1:]
+    assert has_more
+    messages, _ = db.get_messages_page(conversation, after=message_ids[1])
+    assert ids(messages) == message_ids[2:]
+    
+    # Same fields as committed messages, and copies the caller may change
+    assert set(messages[0]) == {"message_id", "role", "content", "audio_url", "timestamp"}
+    messages[0]["content"] = "changed"
+    assert db.get_conversation_history(conversation)[2]["content"] == "message 2"
+    
+    assert db.flush(timeout=5)
+    messages, has_more = db.get_messages_page(conversation, before=message_ids[2])
+    assert ids(messages) == message_ids[:2]
+    assert not has_more
+    db.close()
+
+def test_update_message_audio_of_a_queued_message(tmp_path):
+    db = DatabaseManager(db_path=str(tmp_path / "queued.db"), write_behind=True)
+    conversation = db.create_conversation(db.create_user(), "hi")
+    message_id = db.add_message(conversation, "assistant", "reply")
+    before = db.get_messages_page(conversation)[0][0]
+    
+    db.update_message_audio(conversation, message_id, "/audio/tts/reply.mp3")
+    assert before["audio_url"] is None
+    
+    assert db.flush(timeout=5)
+    assert db.get_message_audio(message_id) == (True, "/audio/tts/reply.mp3")
+    db.close()
+
+def test_writer_updates_a_message_replaced_while_it_was_inserted(tmp_path, monkeypatch):
+    db = DatabaseManager(db_path=str(tmp_path / "queued.db"), write_behind=True)
+    conversation = db.create_conversation(db.create_user(), "hi")
+    insert_messages = db._insert_messages
+    
+    def insert_then_replace(conn, messages):
+        insert_messages(conn, messages)
+        # What update_message_audio() does to a queued message, once the
+        # writer has read it but before it is committed
+        with db._pending_lock:
+            pending = db._pending[conversation]
+            pending[0] = dict(pending[0], audio_url="/audio/tts/late.mp3")
+    
+    monkeypatch.setattr(db, "_insert_messages", insert_then_replace)
+    message_id = db.add_message(conversation, "assistant", "reply")
+    
+    assert db.flush(timeout=5)
+    assert db.get_message_audio(message_id) == (True, "/audio/tts/late.mp3")
+    assert not db._pending
+    db.close()
+
+def test_cached_transcription_lookup_is_a_plain_read(db, monkeypatch):
+    db.save_cached_transcription("key", "नमस्ते", "hi", {"audio_duration": 1.5}, max_rows=10)
+    
+    def no_writes():
+        raise AssertionError("lookup took the write lock")
+    
+    with monkeypatch.context() as patch:
+        patch.setattr(db, "_transaction", no_writes)
+        assert db.get_cached_transcription("key") == ("नमस्ते", "hi", {"audio_duration": 1.5})
+        assert db.get_cached_transcription("missing") is None
+    
+    # An entry not used for a while is marked as used again
+    with db._transaction() as conn:
+        conn.execute("UPDATE transcription_cache SET last_used_at = '2000-01-01 00:00:00'")
+    assert db.get_cached_transcription("key")[0] == "नमस्ते"
+    with db._connection() as conn:
+        last_used_at = conn.execute("SELECT last_used_at FROM transcription_cache").fetchone()[0]
+    assert last_used_at > "2000-01-01 00:00:00"
+
+def test_transcription_stream_claims(db):
+    assert db.create_transcription_stream("s1", "u1", {"segments": []}, b"\x01\x00", max_streams=1, idle_seconds=60)
+    assert not db.create_transcription_stream("s2", "u1", {"segments": []}, b"", max_streams=1, idle_seconds=60)
+    
+    assert db.claim_transcription_stream("s1", 60) == ("u1", {"segments": []}, b"\x01\x00")
+    # Held until released, by this process or any other
+    assert db.claim_transcription_stream("s1", 60) is False
+    db.release_transcription_stream("s1", {"segments": ["नमस्ते"]}, b"")
+    assert db.claim_transcription_stream("s1", 60) == ("u1", {"segments": ["नमस्ते"]}, b"")
+    
+    # A claim that is never released runs out
+    db.release_transcription_stream("s1")
+    assert db.claim_transcription_stream("s1", -1)
+    assert db.claim_transcription_stream("s1", 60)
+    assert db.count_transcription_streams(idle_seconds=60) == 1
+    
+    db.delete_transcription_stream("s1")
+    assert db.claim_transcription_stream("s1", 60) is None
+    assert db.count_transcription_streams(idle_seconds=60) == 0
+
+class LegacyDatabaseManager(DatabaseManager):
+    """Leaves the schema at version 0, like a database from before the migrations"""
+    def _migrate(self):
+        pass
+
+def test_new_database_is_at_the_latest_schema_version(db):
+    assert db.get_schema_version() == MIGRATIONS[-1][0]
+
+def test_migrations_upgrade_an_old_database_once(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    legacy = LegacyDatabaseManager(db_path=path)
+    conversation = legacy.create_conversation(legacy.create_user(), "hi")
+    message_ids = [f"message-{index}" for index in range(3)]
+    with legacy._transaction() as conn:
+        # Written the way the code of that time did, it knew no revision column
+        conn.executemany('''
+        INSERT INTO messages (message_id, conversation_id, role, content, timestamp)
+        VALUES (?, ?, 'user', 'hello', ?)
+        ''', [(message_id, conversation, f"2024-01-01 00:00:0{index}") for index, message_id in enumerate(message_ids)])
+    assert legacy.get_schema_version() == 0
+    legacy.close()
+    
+    db = DatabaseManager(db_path=path)
+    assert db.get_schema_version() == MIGRATIONS[-1][0]
+    assert ids(db.get_conversation_history(conversation)) == message_ids
+    with db._connection() as conn:
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        # Revisions are backfilled from the messages already stored
+        revision = conn.execute("SELECT revision FROM conversations WHERE conversation_id = ?",
+                                (conversation,)).fetchone()[0]
+    assert {"idx_messages_conversation_timestamp", "idx_conversations_user_updated"} <= indexes
+    assert revision == 3
+    db.close()
+    
+    # Opening it again applies nothing twice, e.g. the ALTER TABLE would fail
+    again = DatabaseManager(db_path=path)
+    assert again.get_schema_version() == MIGRATIONS[-1][0]
+    assert ids(again.get_conversation_history(conversation)) == message_ids
+    again.close()
+
+def age_conversation(db, conversation_id, hours):
+    with db._transaction() as conn:
+        conn.execute("UPDATE conversations SET last_updated_at = datetime('now', ?) WHERE conversation_id = ?",
+                     (f"-{hours} hours", conversation_id))
+
+def test_get_or_create_conversation_resumes_a_recent_one(db):
+    user_id = db.create_user()
+    conversation = db.get_or_create_conversation(user_id, "hi", stale_after_hours=24)
+    age_conversation(db, conversation, 23)
+    
+    assert db.get_or_create_conversation(user_id, "hi", stale_after_hours=24) == conversation
+
+def test_get_or_create_conversation_starts_over_when_stale(db):
+    user_id = db.create_user()
+    conversation = db.get_or_create_conversation(user_id, "hi", stale_after_hours=24)
+    age_conversation(db, conversation, 25)
+    
+    fresh = db.get_or_create_conversation(user_id, "hi", stale_after_hours=24)
+    assert fresh != conversation
+    # The new one is now the latest and is resumed
+    assert db.get_or_create_conversation(user_id, "hi", stale_after_hours=24) == fresh
+
+def test_get_or_create_conversation_without_staleness_limit(db):
+    user_id = db.create_user()
+    conversation = db.get_or_create_conversation(user_id, "hi", stale_after_hours=0)
+    age_conversation(db, conversation, 24 * 365)
+    
+    assert db.get_or_create_conversation(user_id, "hi", stale_after_hours=0) == conversation
+
+def test_get_or_create_conversation_starts_over_in_another_language(db):
+    user_id = db.create_user()
+    conversation = db.get_or_create_conversation(user_id, "hi", stale_after_hours=24)
+    
+    assert db.get_or_create_conversation(user_id, "ta", stale_after_hours=24) != conversation
+
+def test_get_or_create_conversation_creates_one_under_concurrency(db):
+    user_id = db.create_user()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(db.get_or_create_conversation(user_id, "hi")))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(set(results)) == 1
@@ -0,0 +1,137 @@
+import groq
+import httpx
+import pytest
+from utils import llm_gateway
+from utils.llm_gateway import CircuitBreaker, LLMGateway, LLMUnavailableError
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_gateway.time, "monotonic", lambda: now[0])
+    return now
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    assert breaker.state == "closed"
+    
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow()
+    assert breaker.retry_after() == 0.0
+    
+    breaker.record_failure()
+    assert breaker.get_status() == {"state": "open", "consecutive_failures": 3}
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+def test_half_open_allows_one_trial_per_reset_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    
+    clock[0] += 29
+    assert not breaker.allow()
+    
+    clock[0] += 1
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    
+    # A trial that never reports back does not block the model for good
+    clock[0] += 30
+    assert breaker.allow()
+
+def test_trial_success_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow()
+    
+    breaker.record_success()
+    assert breaker.get_status() == {"state": "closed", "consecutive_failures": 0}
+    assert breaker.allow()
+
+def test_trial_failure_opens_again(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30)
+    for _ in range(5):
+        breaker.record_failure()
+    clock[0] += 30
+    assert breaker.allow()
+    
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+
+def request_error(error_class, status_code):
+    request = httpx.Request("POST", "http://127.0.0.1/openai/v1/chat/completions")
+    return error_class("error", response=httpx.Response(status_code, request=request), body=None)
+
+def timeout_error():
+    return groq.APITimeoutError(request=httpx.Request("POST", "http://127.0.0.1/openai/v1/chat/completions"))
+
+@pytest.fixture
+def gateway(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_RETRY_BASE_SECONDS", 0)
+    gateway = LLMGateway(api_key="test", models=["m1", "m2"], max_retries=2, deadline=10)
+    for breaker in gateway._breakers.values():
+        breaker.failure_threshold = 2
+    yield gateway
+    gateway._http.close()
+
+def failing(errors, attempts):
+    def request(model, timeout):
+        attempts.append(model)
+        if model in errors:
+            raise errors[model]()
+        return f"reply from {model}"
+    return request
+
+def test_retries_of_one_call_count_as_one_failure(gateway):
+    attempts = []
+    request = failing({"m1": timeout_error}, attempts)
+    
+    assert gateway._call(request, 10) == "reply from m2"
+    assert attempts == ["m1", "m1", "m1", "m2"]
+    assert gateway._breakers["m1"].get_status() == {"state": "closed", "consecutive_failures": 1}
+    
+    assert gateway._call(request, 10) == "reply from m2"
+    assert gateway._breakers["m1"].state == "open"
+    
+    # The open circuit is skipped without an attempt
+    attempts.clear()
+    assert gateway._call(request, 10) == "reply from m2"
+    assert attempts == ["m2"]
+
+def test_client_errors_do_not_trip_the_circuit(gateway):
+    attempts = []
+    request = failing({"m1": lambda: request_error(groq.BadRequestError, 400)}, attempts)
+    
+    for _ in range(3):
+        assert gateway._call(request, 10) == "reply from m2"
+    # Not retried, and the model stays in use
+    assert attempts == ["m1", "m2"] * 3
+    assert gateway._breakers["m1"].get_status() == {"state": "closed", "consecutive_failures": 0}
+
+def test_server_errors_count(gateway):
+    request = failing({"m1": lambda: request_error(groq.APIStatusError, 501)}, [])
+    
+    gateway._call(request, 10)
+    gateway._call(request, 10)
+    assert gateway._breakers["m1"].state == "open"
+
+def test_all_models_failing_raises_with_retry_after(gateway):
+    request = failing({"m1": timeout_error, "m2": timeout_error}, [])
+    
+    with pytest.raises(LLMUnavailableError):
+        gateway._call(request, 10)
+    with pytest.raises(LLMUnavailableError) as error:
+        gateway._call(request, 10)
+    assert error.value.retry_after == pytest.approx(gateway._breakers["m1"].reset_timeout, abs=1)
@@ -0,0 +1,35 @@
+import pytest
+from utils.loan_recommender import loan_recommender, parse_amount
+
+@pytest.mark.parametrize("purpose, loan_type", [
+    ("मुझे गाय खरीदनी है", "dairy_loan"),
+    ("I want to buy two cows", "dairy_loan"),
+    ("loan for my farm", "kisan_credit_card"),
+    ("बचत गट साठी", "self_help_group_loan"),
+])
+def test_classify_recognizes_purpose(purpose, loan_type):
+    assert loan_recommender.classify(purpose, "5 lakh", "20 हज़ार") == (loan_type, 1.0)
+
+@pytest.mark.parametrize("purpose", [
+    # Keywords inside other words: singer, wedding, fertilizer compound
+    "मैं गायक हूं",
+    "I am a farmer and need money for a wedding",
+    "मिट्टीखाद",
+    "our group needs money",
+])
+def test_classify_ignores_keywords_inside_other_words(purpose):
+    assert loan_recommender.classify(purpose, "5 lakh", "20 हज़ार") == (None, 0.0)
+
+def test_classify_confidence_needs_amount_and_income():
+    loan_type, confidence = loan_recommender.classify("मुझे गाय खरीदनी है", "पता नहीं", "पता नहीं")
+    assert loan_type == "dairy_loan"
+    assert confidence == pytest.approx(0.6)
+
+@pytest.mark.parametrize("text, amount", [
+    ("दस हज़ार", 10000),
+    ("५०००", 5000),
+    ("2.5 लाख।", 250000),
+    ("20k", None),
+])
+def test_parse_amount(text, amount):
+    assert parse_amount(text) == amount
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("faster_whisper")
+
+from utils import stream_transcriber
+from utils.stream_transcriber import StreamingTranscriber, StreamNotFoundError
+
+SPEECH = (np.sin(np.arange(16000) / 5) * 8000).astype("<i2").tobytes()
+SILENCE = np.zeros(16000, dtype="<i2").tobytes()
+
+@pytest.fixture(autouse=True)
+def transcribe(monkeypatch):
+    """Transcribe to the number of samples, so the text shows which audio was decoded"""
+    monkeypatch.setattr(stream_transcriber.transcription_service, "transcribe",
+                        lambda samples, language, stats=None: (f"{len(samples)} samples", "hi"))
+
+def run(transcribers, chunks):
+    stream_id = transcribers[0].open("user", "hi")
+    events = [list(transcribers[index % len(transcribers)].feed(stream_id, "user", chunk))
+              for index, chunk in enumerate(chunks)]
+    return events, transcribers[-1].finish(stream_id, "user")
+
+def test_persisted_stream_moves_between_processes():
+    # An odd split leaves half a sample for the next chunk, in the other process
+    chunks = [SPEECH + SPEECH[:1], SPEECH[1:] + SILENCE, SPEECH, SILENCE]
+    
+    in_memory = run([StreamingTranscriber(persist=False)], chunks)
+    persisted = run([StreamingTranscriber(persist=True), StreamingTranscriber(persist=True)], chunks)
+    assert persisted == in_memory
+
+def test_persisted_stream_is_gone_after_finish():
+    transcriber = StreamingTranscriber(persist=True)
+    stream_id = transcriber.open("user", "hi")
+    list(transcriber.feed(stream_id, "user", SPEECH))
+    
+    with pytest.raises(StreamNotFoundError):
+        transcriber.feed(stream_id, "someone else", SPEECH)
+    transcriber.finish(stream_id, "user")
+    with pytest.raises(StreamNotFoundError):
+        transcriber.feed(stream_id, "user", SPEECH)
@@ -0,0 +1,72 @@
+import pytest
+
+pytest.importorskip("faster_whisper")
+
+from utils import audio_preprocessor, transcription_cache as cache_module, whisper_transcriber
+from utils.db_manager import DatabaseManager
+from utils.transcription_cache import TranscriptionCache
+
+AUDIO = b"RIFF....WAVEfmt clip one"
+STATS = {"speech_seconds": 1.5}
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    db = DatabaseManager(str(tmp_path / "test.db"))
+    monkeypatch.setattr(cache_module, "db_manager", db)
+    yield db
+    db.close()
+
+def test_key_changes_with_audio_and_language():
+    cache = TranscriptionCache(max_size=4, persist=False)
+    key = cache.key(AUDIO, "hi")
+    
+    assert cache.key(AUDIO, "hi") == key
+    assert cache.key(AUDIO + b"!", "hi") != key
+    assert cache.key(AUDIO, "en") != key
+    assert cache.key(AUDIO) != key
+    # None and an empty language both mean auto-detection
+    assert cache.key(AUDIO, None) == cache.key(AUDIO, "")
+
+@pytest.mark.parametrize("module, name, value", [
+    (whisper_transcriber, "model_size", "tiny"),
+    (whisper_transcriber, "WHISPER_COMPUTE_TYPE", "float32"),
+    (audio_preprocessor, "MAX_SPEECH_SECONDS", 7),
+])
+def test_key_changes_with_settings(monkeypatch, module, name, value):
+    key = TranscriptionCache(max_size=4, persist=False).key(AUDIO, "hi")
+    monkeypatch.setattr(module, name, value)
+    assert TranscriptionCache(max_size=4, persist=False).key(AUDIO, "hi") != key
+
+def test_get_returns_what_was_put():
+    cache = TranscriptionCache(max_size=4, persist=False)
+    key = cache.key(AUDIO, "hi")
+    assert cache.get(key) is None
+    
+    cache.put(key, "namaste", "hi", STATS)
+    assert cache.get(key) == ("namaste", "hi", STATS)
+    assert cache.get_status()["hits"] == 1
+    assert cache.get_status()["misses"] == 1
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TranscriptionCache(max_size=2, persist=False)
+    for name in ("a", "b"):
+        cache.put(name, name, "hi", STATS)
+    cache.get("a")
+    cache.put("c", "c", "hi", STATS)
+    
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.get_status()["evictions"] == 1
+
+def test_persisted_entry_is_shared_between_caches(db):
+    writer = TranscriptionCache(max_size=0, persist=True)
+    reader = TranscriptionCache(max_size=4, persist=True)
+    key = writer.key(AUDIO, "hi")
+    writer.put(key, "namaste", "hi", STATS)
+    
+    assert reader.get(key) == ("namaste", "hi", STATS)
+    assert reader.get_status()["db_hits"] == 1
+    # Remembered in memory after the first read
+    assert reader.get(key) == ("namaste", "hi", STATS)
+    assert reader.get_status()["hits"] == 1
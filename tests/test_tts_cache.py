@@ -0,0 +1,159 @@
+import os
+import pytest
+from utils import tts_cache as tts_cache_module
+from utils.tts_cache import TTSCache
+
+class FakeBackend:
+    """Backend stand-in whose clips join by concatenation"""
+    extension = "wav"
+    
+    def __init__(self, name):
+        self.name = name
+    
+    def join(self, clips):
+        return b"".join(clips)
+
+GOOD = FakeBackend("good")
+FALLBACK = FakeBackend("fallback")
+
+@pytest.fixture
+def synthesized(monkeypatch):
+    """Texts synthesized, and the backend each call succeeds with (None = all fail)"""
+    calls = {"texts": [], "backend": GOOD}
+    
+    def synthesize_speech(text, language_code, backends):
+        calls["texts"].append(text)
+        backend = calls["backend"]
+        if backend is None or backend not in backends:
+            return None, None
+        return f"{backend.name}:{text}".encode(), backend
+    
+    monkeypatch.setattr(tts_cache_module, "preferred_backends", lambda language_code: [GOOD, FALLBACK])
+    monkeypatch.setattr(tts_cache_module, "tts_backends", [GOOD, FALLBACK])
+    monkeypatch.setattr(tts_cache_module, "synthesize_speech", synthesize_speech)
+    return calls
+
+@pytest.fixture
+def cache(tmp_path, synthesized):
+    return TTSCache(cache_dir=str(tmp_path), url_prefix="/audio/tts", fallback_retry=300)
+
+def read(cache, url):
+    with open(os.path.join(cache.cache_dir, url[len("/audio/tts/"):]), "rb") as f:
+        return f.read()
+
+def test_store_never_rewrites_a_cached_file(cache):
+    key = cache.key("नमस्ते", "hi")
+    filename = cache._store(key, GOOD, b"first")
+    
+    assert cache._store(key, GOOD, b"second") == filename
+    assert read(cache, f"/audio/tts/{filename}") == b"first"
+    assert not [name for name in os.listdir(os.path.dirname(os.path.join(cache.cache_dir, filename)))
+                if name.endswith(".tmp")]
+
+def test_join_over_fallback_audio_due_for_retry_keeps_the_file(cache, synthesized):
+    synthesized["backend"] = FALLBACK
+    sentences = [cache.get_speech(text, "hi") for text in ("पहला वाक्य।", "दूसरा वाक्य।")]
+    whole = cache.get_speech("पहला वाक्य। दूसरा वाक्य।", "hi")
+    original = read(cache, whole)
+    
+    # Make the whole reply's fallback audio due for a retry
+    cache._retry_at.clear()
+    assert cache.lookup("पहला वाक्य। दूसरा वाक्य।", "hi") is None
+    
+    assert cache.join_speech("पहला वाक्य। दूसरा वाक्य।", "hi", sentences) == whole
+    assert read(cache, whole) == original
+
+def test_key_ignores_spacing_and_unicode_composition(cache):
+    key = cache.key("नमस्ते  दुनिया", "hi")
+    
+    assert cache.key(" नमस्ते दुनिया\n", "hi") == key
+    # "é" composed and decomposed
+    assert cache.key("café", "en") == cache.key("café", "en")
+    assert cache.key("नमस्ते दुनिया", "mr") != key
+    assert cache.key("नमस्ते दुनिया।", "hi") != key
+
+def test_cached_speech_is_synthesized_once(cache, synthesized):
+    assert cache.lookup("नमस्ते", "hi") is None
+    
+    url = cache.get_speech("नमस्ते", "hi")
+    assert url.startswith("/audio/tts/") and url.endswith("-good.wav")
+    assert cache.get_speech(" नमस्ते ", "hi") == url
+    assert cache.lookup("नमस्ते", "hi") == url
+    assert synthesized["texts"] == ["नमस्ते"]
+    assert cache.get_status()["misses"] == 1
+    assert cache.get_status()["hits"] == 2
+
+def test_failed_synthesis_is_not_cached(cache, synthesized):
+    synthesized["backend"] = None
+    assert cache.get_speech("नमस्ते", "hi") is None
+    assert cache.get_status()["failures"] == 1
+    
+    synthesized["backend"] = GOOD
+    assert cache.get_speech("नमस्ते", "hi") is not None
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(tts_cache_module.time, "monotonic", lambda: now[0])
+    return now
+
+def test_fallback_audio_is_served_until_the_retry_is_due(cache, synthesized, clock):
+    synthesized["backend"] = FALLBACK
+    fallback = cache.get_speech("नमस्ते", "hi")
+    assert fallback.endswith("-fallback.wav")
+    
+    synthesized["backend"] = GOOD
+    clock[0] += 299
+    assert cache.get_speech("नमस्ते", "hi") == fallback
+    assert cache.lookup("नमस्ते", "hi") == fallback
+    assert synthesized["texts"] == ["नमस्ते"]
+
+def test_fallback_audio_is_replaced_once_the_preferred_backend_works(cache, synthesized, clock):
+    synthesized["backend"] = FALLBACK
+    fallback = cache.get_speech("नमस्ते", "hi")
+    
+    # Still failing at the first retry, the fallback audio is served for another period
+    synthesized["backend"] = None
+    clock[0] += 300
+    assert cache.lookup("नमस्ते", "hi") is None
+    assert cache.get_speech("नमस्ते", "hi") == fallback
+    assert cache.lookup("नमस्ते", "hi") == fallback
+    
+    synthesized["backend"] = GOOD
+    clock[0] += 300
+    upgraded = cache.get_speech("नमस्ते", "hi")
+    assert upgraded.endswith("-good.wav")
+    assert read(cache, upgraded) == "good:नमस्ते".encode()
+    assert cache.lookup("नमस्ते", "hi") == upgraded
+    # Messages that link to the fallback audio keep working
+    assert read(cache, fallback) == "fallback:नमस्ते".encode()
+    assert cache.get_status()["upgrades"] == 1
+
+def test_join_speech_caches_the_whole_text(cache, synthesized):
+    sentences = [cache.get_speech(text, "hi") for text in ("पहला वाक्य।", "दूसरा वाक्य।")]
+    
+    whole = cache.join_speech("पहला वाक्य। दूसरा वाक्य।", "hi", sentences)
+    assert read(cache, whole) == b"".join(read(cache, url) for url in sentences)
+    assert cache.lookup("पहला वाक्य। दूसरा वाक्य।", "hi") == whole
+    assert cache.get_speech("पहला वाक्य। दूसरा वाक्य।", "hi") == whole
+    # Only the sentences were synthesized
+    assert synthesized["texts"] == ["पहला वाक्य।", "दूसरा वाक्य।"]
+    assert cache.get_status()["joined"] == 1
+
+def test_join_speech_needs_every_sentence_from_one_backend(cache, synthesized):
+    first = cache.get_speech("पहला वाक्य।", "hi")
+    synthesized["backend"] = FALLBACK
+    second = cache.get_speech("दूसरा वाक्य।", "hi")
+    
+    assert cache.join_speech("पहला वाक्य। दूसरा वाक्य।", "hi", [first, second]) is None
+    assert cache.join_speech("पहला वाक्य। दूसरा वाक्य।", "hi", [first, None]) is None
+    assert cache.join_speech("पहला वाक्य। दूसरा वाक्य।", "hi", [first, "/audio/elsewhere.wav"]) is None
+    assert cache.join_speech("पहला वाक्य। दूसरा वाक्य।", "hi", []) is None
+    assert cache.lookup("पहला वाक्य। दूसरा वाक्य।", "hi") is None
+
+def test_join_speech_skips_a_clip_missing_on_disk(cache):
+    sentences = [cache.get_speech(text, "hi") for text in ("पहला वाक्य।", "दूसरा वाक्य।")]
+    os.remove(os.path.join(cache.cache_dir, sentences[1][len("/audio/tts/"):]))
+    
+    assert cache.join_speech("पहला वाक्य। दूसरा वाक्य।", "hi", sentences) is None
+    assert cache.lookup("पहला वाक्य। दूसरा वाक्य।", "hi") is None
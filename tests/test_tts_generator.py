@@ -0,0 +1,60 @@
+import base64
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from gtts import tts as gtts_tts
+from utils.tts_generator import GTTSBackend
+
+class Handler(BaseHTTPRequestHandler):
+    delay = 0
+    
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(self.delay)
+        audio = base64.b64encode(b"ID3 mp3 frames").decode()
+        body = f')]}}\'\n\n[["wrb.fr","jQ1olc","[\\"{audio}\\"]",null,null,null,"generic"]]'.encode()
+        try:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            pass
+    
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server(monkeypatch):
+    """A stand-in for the translate API, answering after Handler.delay seconds"""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), type("DelayedHandler", (Handler,), {}))
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{httpd.server_address[1]}/batchexecute"
+    monkeypatch.setattr(gtts_tts, "_translate_url", lambda tld, path: url)
+    yield httpd.RequestHandlerClass
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setenv("TTS_GTTS_TIMEOUT", "0.5")
+    monkeypatch.setenv("TTS_GTTS_CONCURRENCY", "1")
+    return GTTSBackend()
+
+def test_gtts_decodes_the_audio(server, backend):
+    assert backend.synthesize("नमस्ते", "hi") == b"ID3 mp3 frames"
+
+def test_hung_gtts_call_gives_its_slot_back(server, backend):
+    server.delay = 2
+    started = time.monotonic()
+    assert backend.synthesize("नमस्ते", "hi") is None
+    
+    # The request itself times out, so the only slot is free for the next call
+    # long before the server would have answered
+    server.delay = 0
+    assert backend.synthesize("नमस्ते", "hi") == b"ID3 mp3 frames"
+    assert backend.get_status()["busy"] == 0
+    assert time.monotonic() - started < 2
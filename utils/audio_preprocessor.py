@@ -0,0 +1,70 @@
+import os
+from faster_whisper.vad import VadOptions, get_speech_timestamps, collect_chunks
+
+# Sample rate the model expects, uploads are decoded and resampled to it
+SAMPLING_RATE = 16000
+
+# Voice activity detection settings
+# With VAD_FILTER on, only the regions Silero VAD marks as speech are sent to Whisper
+VAD_FILTER = os.getenv("VAD_FILTER", "true").lower() == "true"
+# Speech probability above which a window counts as speech
+VAD_THRESHOLD = float(os.getenv("VAD_THRESHOLD", "0.5"))
+# Pauses shorter than this stay inside the surrounding speech
+VAD_MIN_SILENCE_MS = int(os.getenv("VAD_MIN_SILENCE_MS", "500"))
+# Audio kept on both sides of each speech region so word edges aren't clipped
+VAD_SPEECH_PAD_MS = int(os.getenv("VAD_SPEECH_PAD_MS", "200"))
+# Most speech transcribed per clip, the rest is dropped (0 = no limit)
+MAX_SPEECH_SECONDS = float(os.getenv("MAX_SPEECH_SECONDS", "120"))
+
+VAD_OPTIONS = VadOptions(
+    threshold=VAD_THRESHOLD,
+    min_silence_duration_ms=VAD_MIN_SILENCE_MS,
+    speech_pad_ms=VAD_SPEECH_PAD_MS
+)
+
+def preprocess_audio(samples):
+    """
+    Drop non-speech regions and cap the speech duration before inference
+    
+    Args:
+        samples: 16 kHz mono float32 samples
+    
+    Returns:
+        tuple: (samples to transcribe, stats dict with the durations in seconds of the
+               whole clip, its speech, the non-speech audio skipped, and the speech
+               dropped for going over MAX_SPEECH_SECONDS)
+    """
+    if VAD_FILTER:
+        chunks = get_speech_timestamps(samples, VAD_OPTIONS)
+    else:
+        chunks = [{"start": 0, "end": len(samples)}] if len(samples) else []
+    
+    speech_samples = sum(chunk["end"] - chunk["start"] for chunk in chunks)
+    
+    # Keep speech up to the limit, cutting the chunk that crosses it
+    if MAX_SPEECH_SECONDS > 0:
+        budget = int(MAX_SPEECH_SECONDS * SAMPLING_RATE)
+        kept = []
+        for chunk in chunks:
+            if budget <= 0:
+                break
+            end = min(chunk["end"], chunk["start"] + budget)
+            kept.append({"start": chunk["start"], "end": end})
+            budget -= end - chunk["start"]
+        chunks = kept
+    
+    kept_samples = sum(chunk["end"] - chunk["start"] for chunk in chunks)
+    
+    # Nothing to cut, skip the copy
+    if kept_samples == len(samples):
+        speech = samples
+    else:
+        speech = collect_chunks(samples, chunks)
+    
+    stats = {
+        "audio_duration": len(samples) / SAMPLING_RATE,
+        "speech_duration": kept_samples / SAMPLING_RATE,
+        "skipped_duration": (len(samples) - speech_samples) / SAMPLING_RATE,
+        "truncated_duration": (speech_samples - kept_samples) / SAMPLING_RATE
+    }
+    return speech, stats
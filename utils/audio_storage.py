@@ -0,0 +1,208 @@
+import logging
+import os
+import threading
+import time
+from utils.db_manager import db_manager
+
+logger = logging.getLogger(__name__)
+
+# Generated audio lives under static/ and is served from /audio/<path>
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+AUDIO_URL_PREFIX = "/audio"
+
+# Retention settings
+# The sweeper deletes the least recently used audio until static/ is under
+# AUDIO_STORAGE_MAX_MB, and audio unused for AUDIO_MAX_AGE_DAYS (0 = no age limit).
+# Audio a message still points at is never deleted.
+AUDIO_STORAGE_MAX_MB = float(os.getenv("AUDIO_STORAGE_MAX_MB", "500"))
+AUDIO_MAX_AGE_DAYS = float(os.getenv("AUDIO_MAX_AGE_DAYS", "30"))
+AUDIO_SWEEP_INTERVAL_SECONDS = float(os.getenv("AUDIO_SWEEP_INTERVAL_SECONDS", "600"))
+# Leftover uploads and partial writes older than this are deleted
+AUDIO_ORPHAN_HOURS = float(os.getenv("AUDIO_ORPHAN_HOURS", "1"))
+
+AUDIO_EXTENSIONS = (".mp3", ".wav")
+ORPHAN_EXTENSIONS = (".webm", ".tmp")
+# Files this new may not be referenced yet, their message is still being stored
+EVICTION_GRACE_SECONDS = 3600
+# Files whose references are looked up per query
+SWEEP_BATCH_SIZE = 500
+# Serving a file or finding it in the TTS cache refreshes its mtime, which
+# eviction uses as its last use, at most this often
+TOUCH_INTERVAL_SECONDS = 3600
+
+def shard_path(key, filename):
+    """
+    Path of a content-addressed file in the sharded layout
+    
+    Two levels of two hex characters keep every directory small, e.g.
+    ab/cd/abcd1234....mp3, so lookups and listings stay fast at any file count.
+    """
+    return f"{key[:2]}/{key[2:4]}/{filename}"
+
+class AudioStorage:
+    """
+    Size and age bounded storage of generated audio
+    
+    Usage is measured and trimmed by a background sweeper; the file mtime
+    serves as the last-use time for LRU eviction.
+    """
+    def __init__(self, root=STATIC_DIR, max_mb=AUDIO_STORAGE_MAX_MB, max_age_days=AUDIO_MAX_AGE_DAYS,
+                 interval=AUDIO_SWEEP_INTERVAL_SECONDS, orphan_hours=AUDIO_ORPHAN_HOURS):
+        self.root = root
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_age = max_age_days * 86400
+        self.interval = interval
+        self.orphan_age = orphan_hours * 3600
+        # URLs this process already pinned, the database holds those of every process
+        self._pinned = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_sweep = None
+    
+    def url_for(self, relative_path):
+        """URL a file under the root is served at"""
+        return f"{AUDIO_URL_PREFIX}/{relative_path}"
+    
+    def pin(self, audio_url):
+        """Never evict the file at this URL, e.g. speech rendered ahead of time"""
+        with self._lock:
+            if audio_url in self._pinned:
+                return
+            self._pinned.add(audio_url)
+        # Stored so the sweepers of other processes keep it too
+        db_manager.pin_audio_url(audio_url)
+    
+    def is_pinned(self, audio_url):
+        with self._lock:
+            if audio_url in self._pinned:
+                return True
+        return audio_url in db_manager.get_pinned_audio_urls([audio_url])
+    
+    def touch(self, path):
+        """Record a use of the file for LRU eviction"""
+        try:
+            if time.time() - os.stat(path).st_mtime > TOUCH_INTERVAL_SECONDS:
+                os.utime(path)
+        except OSError:
+            pass
+    
+    def _scan(self):
+        """List (relative path, size, mtime) of every file under the root"""
+        files = []
+        pending = [self.root]
+        while pending:
+            directory = pending.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat()
+                        files.append((os.path.relpath(entry.path, self.root).replace(os.sep, "/"), stat.st_size, stat.st_mtime))
+                except OSError:
+                    continue
+        return files
+    
+    def _delete(self, relative_path):
+        try:
+            os.remove(os.path.join(self.root, relative_path))
+            return True
+        except OSError:
+            return False
+    
+    def sweep(self):
+        """
+        Delete orphaned uploads, then expired and least recently used audio
+        that no message references and no process pinned, until usage is under the cap
+        
+        Returns:
+            dict: What the sweep found and freed
+        """
+        started = time.perf_counter()
+        now = time.time()
+        files = self._scan()
+        
+        stats = {"files": 0, "bytes": 0, "deleted": 0, "freed_bytes": 0, "orphans_deleted": 0, "kept_referenced": 0}
+        
+        audio = []
+        for relative_path, size, mtime in files:
+            if relative_path.endswith(ORPHAN_EXTENSIONS):
+                # Uploads from before transcription moved in memory, and partial writes
+                if now - mtime > self.orphan_age and self._delete(relative_path):
+                    stats["orphans_deleted"] += 1
+                    stats["freed_bytes"] += size
+                    continue
+            stats["files"] += 1
+            stats["bytes"] += size
+            if relative_path.endswith(AUDIO_EXTENSIONS):
+                audio.append((mtime, size, relative_path))
+        
+        # Oldest first: expired files, then whatever it takes to get under the cap.
+        # References are looked up a batch at a time, so a sweep costs a few
+        # indexed queries however many files there are.
+        audio = [entry for entry in sorted(audio) if now - entry[0] >= EVICTION_GRACE_SECONDS]
+        evicting = True
+        for start in range(0, len(audio), SWEEP_BATCH_SIZE):
+            if not evicting:
+                break
+            batch = audio[start:start + SWEEP_BATCH_SIZE]
+            audio_urls = [self.url_for(path) for mtime, size, path in batch]
+            referenced = db_manager.get_referenced_audio_urls(audio_urls)
+            pinned = db_manager.get_pinned_audio_urls(audio_urls)
+            
+            for mtime, size, relative_path in batch:
+                expired = self.max_age > 0 and now - mtime > self.max_age
+                if not expired and stats["bytes"] <= self.max_bytes:
+                    evicting = False
+                    break
+                
+                audio_url = self.url_for(relative_path)
+                if audio_url in pinned or audio_url in referenced:
+                    stats["kept_referenced"] += 1
+                    continue
+                if self._delete(relative_path):
+                    stats["deleted"] += 1
+                    stats["freed_bytes"] += size
+                    stats["files"] -= 1
+                    stats["bytes"] -= size
+        
+        stats["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        with self._lock:
+            self._last_sweep = dict(stats, finished_at=time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now)))
+        
+        if stats["deleted"] or stats["orphans_deleted"]:
+            logger.info("Audio sweep deleted %d files and %d orphans, freed %.1f MB",
+                        stats["deleted"], stats["orphans_deleted"], stats["freed_bytes"] / 1024 / 1024)
+        return stats
+    
+    def _run(self):
+        """Sweeper loop"""
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.exception("Error sweeping audio storage: %s", e)
+            time.sleep(self.interval)
+    
+    def start_sweeper(self):
+        """Start the background sweeper, once per process"""
+        with self._lock:
+            if self._thread is None and self.interval > 0:
+                self._thread = threading.Thread(target=self._run, name="audio-sweeper", daemon=True)
+                self._thread.start()
+    
+    def get_status(self):
+        """Get the last sweep's results for health reporting"""
+        with self._lock:
+            return {
+                "max_mb": self.max_bytes / 1024 / 1024,
+                "max_age_days": self.max_age / 86400,
+                "last_sweep": self._last_sweep
+            }
+
+# Create a singleton instance
+audio_storage = AudioStorage()
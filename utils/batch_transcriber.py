@@ -0,0 +1,242 @@
+import os
+import queue
+import threading
+import time
+import zlib
+import numpy as np
+import ctranslate2
+from faster_whisper.tokenizer import Tokenizer
+from utils.whisper_transcriber import load_model, load_audio, SAMPLING_RATE
+from utils.audio_preprocessor import preprocess_audio
+
+# Micro-batching settings
+# Requests arriving within TRANSCRIBE_BATCH_WAIT_MS of each other are decoded
+# together, up to TRANSCRIBE_BATCH_SIZE clips per batch. A size of 1 disables batching.
+TRANSCRIBE_BATCH_SIZE = int(os.getenv("TRANSCRIBE_BATCH_SIZE", "1"))
+TRANSCRIBE_BATCH_WAIT_MS = float(os.getenv("TRANSCRIBE_BATCH_WAIT_MS", "10"))
+
+# Whisper works on 30 second windows, longer clips are decoded on their own
+MAX_BATCHED_SECONDS = 30
+
+# Decoding options, matching WhisperModel.transcribe()'s defaults
+BEAM_SIZE = 5
+NO_SPEECH_THRESHOLD = 0.6
+LOG_PROB_THRESHOLD = -1.0
+COMPRESSION_RATIO_THRESHOLD = 2.4
+
+def _compression_ratio(text):
+    """How well text compresses, repetition loops compress very well"""
+    text_bytes = text.encode("utf-8")
+    return len(text_bytes) / len(zlib.compress(text_bytes))
+
+class _BatchRequest:
+    """One clip waiting for a batch, and its result once decoded"""
+    def __init__(self, audio, language):
+        self.audio = audio
+        self.language = language
+        self.enqueued_at = time.perf_counter()
+        self.queue_time = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+class BatchTranscriber:
+    """
+    Micro-batching scheduler for short clips
+    
+    Concurrent requests are collected for up to max_wait_ms or max_batch_size clips,
+    run through the encoder and decoder as one batch, and each result is handed
+    back to the request thread waiting for it.
+    
+    The batched pass decodes each clip as one segment without timestamp tokens,
+    with the beam search and thresholds of WhisperModel.transcribe(). Clips whose
+    result transcribe() would reject (a likely repetition loop or a low log
+    probability) are decoded again with model.transcribe() and its temperature
+    fallback. The results that pass can still differ slightly from
+    transcribe(), which predicts timestamps and may split a clip into segments,
+    so turning batching on can change transcriptions.
+    """
+    def __init__(self, max_batch_size=TRANSCRIBE_BATCH_SIZE, max_wait_ms=TRANSCRIBE_BATCH_WAIT_MS):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"batches": 0, "requests": 0, "queue_time_total": 0.0, "queue_time_max": 0.0}
+    
+    @property
+    def enabled(self):
+        return self.max_batch_size > 1
+    
+    def _start(self):
+        """Start the scheduler thread, once per process"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="whisper-batcher", daemon=True)
+                self._thread.start()
+    
+    def transcribe(self, audio, language=None, stats=None):
+        """
+        Transcribe a clip as part of the next batch
+        
+        Args:
+            audio: Encoded audio as bytes or a file-like object, a file path, or decoded samples
+            language: ISO language code (e.g., 'hi' for Hindi) or None for auto-detection
+            stats: Optional dict, receives the seconds spent waiting for the batch as
+                   'queue_time' and the durations from preprocess_audio()
+        
+        Returns:
+            tuple: (transcription text, detected language)
+        """
+        if stats is None:
+            stats = {}
+        stats["queue_time"] = 0.0
+        
+        self._start()
+        
+        # Decode and trim in the request thread so the scheduler only runs the model,
+        # with silence cut out more clips fit the batched single-window path
+        samples, audio_stats = preprocess_audio(load_audio(audio))
+        stats.update(audio_stats)
+        if not len(samples):
+            return "", language
+        
+        request = _BatchRequest(samples, language)
+        self._queue.put(request)
+        request.done.wait()
+        
+        if request.error:
+            raise Exception(f"Transcription error: {request.error}")
+        stats["queue_time"] = request.queue_time
+        return request.result
+    
+    def _run(self):
+        """Scheduler loop: collect a batch, decode it, repeat"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0].enqueued_at + self.max_wait
+            
+            # Wait for more clips until the deadline, but always take clips that
+            # already queued up while the previous batch was decoding
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            started = time.perf_counter()
+            for request in batch:
+                request.queue_time = started - request.enqueued_at
+            
+            try:
+                self._decode(batch)
+            except Exception as e:
+                for request in batch:
+                    if request.result is None:
+                        request.error = str(e)
+            
+            with self._lock:
+                self._stats["batches"] += 1
+                self._stats["requests"] += len(batch)
+                for request in batch:
+                    self._stats["queue_time_total"] += request.queue_time
+                    self._stats["queue_time_max"] = max(self._stats["queue_time_max"], request.queue_time)
+            
+            for request in batch:
+                request.done.set()
+    
+    def _decode(self, batch):
+        """Decode a batch of requests"""
+        model = load_model()
+        
+        short = [r for r in batch if len(r.audio) <= MAX_BATCHED_SECONDS * SAMPLING_RATE]
+        if short:
+            self._decode_short(model, short)
+        
+        for request in batch:
+            if request.result is None:
+                # Long clips need the sliding-window decoder, and rejected ones the
+                # temperature fallback, after the others are answered
+                segments, info = model.transcribe(request.audio, language=request.language, task="transcribe")
+                request.result = (" ".join(segment.text for segment in segments).strip(), info.language)
+                request.done.set()
+    
+    def _decode_short(self, model, short):
+        """
+        Decode clips of up to one window in a single encoder pass and generate call
+        
+        Clips transcribe() would decode again at a higher temperature are left
+        without a result, for _decode() to run through transcribe().
+        """
+        # Log-Mel features padded or trimmed to one 30 second window each
+        n_frames = model.feature_extractor.nb_max_frames
+        features = np.stack([model.feature_extractor(r.audio)[:, :n_frames] for r in short])
+        encoder_output = model.model.encode(
+            ctranslate2.StorageView.from_array(np.ascontiguousarray(features)),
+            to_cpu=False
+        )
+        
+        # Detect the language of clips that didn't specify one
+        languages = [r.language for r in short]
+        if None in languages:
+            if model.model.is_multilingual:
+                detected = model.model.detect_language(encoder_output)
+                languages = [language or detected[i][0][0][2:-2] for i, language in enumerate(languages)]
+            else:
+                languages = [language or "en" for language in languages]
+        
+        tokenizers = [
+            Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe", language=language)
+            for language in languages
+        ]
+        prompts = [model.get_prompt(tokenizer, [], without_timestamps=True) for tokenizer in tokenizers]
+        
+        results = model.model.generate(
+            encoder_output,
+            prompts,
+            beam_size=BEAM_SIZE,
+            max_length=model.max_length,
+            return_scores=True,
+            return_no_speech_prob=True,
+            suppress_blank=True,
+            suppress_tokens=[-1]
+        )
+        
+        for request, tokenizer, language, result in zip(short, tokenizers, languages, results):
+            tokens = result.sequences_ids[0]
+            avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+            
+            # Same silence rule as WhisperModel.transcribe()
+            if result.no_speech_prob > NO_SPEECH_THRESHOLD and avg_logprob < LOG_PROB_THRESHOLD:
+                request.result = ("", language)
+                request.done.set()
+                continue
+            
+            text = tokenizer.decode(tokens).strip()
+            if _compression_ratio(text) > COMPRESSION_RATIO_THRESHOLD or avg_logprob < LOG_PROB_THRESHOLD:
+                continue
+            request.result = (text, language)
+            request.done.set()
+    
+    def get_status(self):
+        """Get the batching counters for health reporting"""
+        with self._lock:
+            stats = dict(self._stats)
+        
+        requests = stats.pop("requests")
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": stats["batches"],
+            "requests": requests,
+            "average_batch_size": requests / stats["batches"] if stats["batches"] else 0,
+            "average_queue_ms": stats["queue_time_total"] * 1000 / requests if requests else 0,
+            "max_queue_ms": stats["queue_time_max"] * 1000
+        }
+
+# Create a singleton instance
+batch_transcriber = BatchTranscriber()
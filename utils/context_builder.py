@@ -0,0 +1,187 @@
+import logging
+import math
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Prompt budget settings
+# Tokens the prompt sent to the LLM may use. The models have an 8k context
+# and the reply takes up to 1024 of it; a smaller prompt is also a faster call
+LLM_CONTEXT_MAX_TOKENS = int(os.getenv("LLM_CONTEXT_MAX_TOKENS", "3072"))
+# A single longer message is cut to this many tokens
+LLM_CONTEXT_MESSAGE_MAX_TOKENS = int(os.getenv("LLM_CONTEXT_MESSAGE_MAX_TOKENS", "300"))
+# Tokens the summary of left-out older messages may use
+LLM_CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("LLM_CONTEXT_SUMMARY_MAX_TOKENS", "200"))
+
+# Characters of each left-out message quoted in the summary
+SUMMARY_SNIPPET_CHARS = 80
+
+# Tokens the chat format adds per message (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Latin text averages about 4 characters per token; Indic scripts split into
+# far more tokens, so their characters are counted close to one each
+_TEXT_RUN = re.compile(r"[\x00-\x7f]+|[^\x00-\x7f]+")
+ASCII_CHARS_PER_TOKEN = 4
+OTHER_CHARS_PER_TOKEN = 1.25
+
+def count_tokens(text):
+    """
+    Estimate the number of tokens in text
+    
+    An approximation of the Llama/Mixtral tokenizers that errs on the high
+    side, so a prompt within budget fits the model.
+    
+    Returns:
+        int: Estimated token count
+    """
+    tokens = 0
+    for run in _TEXT_RUN.findall(text):
+        per_token = ASCII_CHARS_PER_TOKEN if run.isascii() else OTHER_CHARS_PER_TOKEN
+        tokens += math.ceil(len(run) / per_token)
+    return tokens
+
+def count_message_tokens(messages):
+    """Estimate the tokens a list of chat messages takes in the prompt"""
+    return sum(count_tokens(msg["content"]) + MESSAGE_OVERHEAD_TOKENS for msg in messages)
+
+def truncate_text(text, max_tokens):
+    """Cut text to at most max_tokens, marking the cut"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    
+    # Binary search for the longest prefix that fits with the marker, counted
+    # together since its space can add a token to the run before it
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle].rstrip() + " …") <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low].rstrip() + " …"
+
+class ContextBuilder:
+    """
+    Fit the conversation into a token budget for the LLM
+    
+    The system prompt and the answers to the fixed questions (purpose, amount
+    and income) are always kept. Later messages are kept newest first while
+    they fit the budget, and the ones that do not are replaced by a short
+    summary quoting the start of each.
+    """
+    def __init__(self, max_tokens=LLM_CONTEXT_MAX_TOKENS, message_max_tokens=LLM_CONTEXT_MESSAGE_MAX_TOKENS,
+                 summary_max_tokens=LLM_CONTEXT_SUMMARY_MAX_TOKENS):
+        self.max_tokens = max_tokens
+        self.message_max_tokens = message_max_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self._lock = threading.Lock()
+        self._stats = {
+            "builds": 0,
+            "trimmed_builds": 0,
+            "dropped_messages": 0,
+            "truncated_messages": 0,
+            "history_tokens_total": 0,
+            "prompt_tokens_total": 0,
+            "prompt_tokens_max": 0,
+            "prompt_tokens_last": 0
+        }
+    
+    def _summarize(self, dropped):
+        """One system message quoting the left-out messages, newest kept if they do not all fit"""
+        header = "Earlier in this conversation (older messages shortened):"
+        lines = []
+        used = count_tokens(header) + MESSAGE_OVERHEAD_TOKENS
+        for msg in reversed(dropped):
+            snippet = re.sub(r"\s+", " ", msg["content"]).strip()
+            if len(snippet) > SUMMARY_SNIPPET_CHARS:
+                snippet = snippet[:SUMMARY_SNIPPET_CHARS].rstrip() + " …"
+            line = f"- {'User' if msg['role'] == 'user' else 'You'}: {snippet}"
+            tokens = count_tokens(line) + 1
+            if used + tokens > self.summary_max_tokens:
+                break
+            lines.append(line)
+            used += tokens
+        
+        if not lines:
+            return None
+        return {"role": "system", "content": "\n".join([header] + lines[::-1])}
+    
+    def build(self, system_prompt, history, pinned_questions):
+        """
+        Build the chat messages for the API
+        
+        Args:
+            system_prompt: Instructions sent as the first message
+            history: All messages so far, ending with the user's current message
+            pinned_questions: Number of fixed questions whose answers are always kept
+        
+        Returns:
+            list: Messages within the token budget
+        """
+        truncated = 0
+        messages = []
+        for msg in history:
+            content = truncate_text(msg["content"], self.message_max_tokens)
+            truncated += content != msg["content"]
+            messages.append({"role": msg["role"], "content": content})
+        
+        # Everything up to the reply after the last fixed question is pinned
+        pinned_end = len(messages)
+        assistant_count = 0
+        for index, msg in enumerate(messages):
+            if msg["role"] == "assistant":
+                assistant_count += 1
+                if assistant_count > pinned_questions:
+                    pinned_end = index
+                    break
+        pinned, rest = messages[:pinned_end], messages[pinned_end:]
+        
+        system = {"role": "system", "content": system_prompt}
+        available = self.max_tokens - count_message_tokens([system] + pinned)
+        
+        dropped = []
+        if count_message_tokens(rest) > available:
+            # Keep the newest messages that fit next to the summary, always the current one
+            available -= self.summary_max_tokens
+            kept = 0
+            used = 0
+            for msg in reversed(rest):
+                tokens = count_message_tokens([msg])
+                if kept and used + tokens > available:
+                    break
+                kept += 1
+                used += tokens
+            dropped, rest = rest[:len(rest) - kept], rest[len(rest) - kept:]
+        
+        summary = self._summarize(dropped) if dropped else None
+        result = [system] + pinned + ([summary] if summary else []) + rest
+        
+        prompt_tokens = count_message_tokens(result)
+        with self._lock:
+            self._stats["builds"] += 1
+            self._stats["trimmed_builds"] += bool(dropped)
+            self._stats["dropped_messages"] += len(dropped)
+            self._stats["truncated_messages"] += truncated
+            self._stats["history_tokens_total"] += count_message_tokens(history)
+            self._stats["prompt_tokens_total"] += prompt_tokens
+            self._stats["prompt_tokens_max"] = max(self._stats["prompt_tokens_max"], prompt_tokens)
+            self._stats["prompt_tokens_last"] = prompt_tokens
+        
+        if dropped or truncated:
+            logger.info("Context trimmed to %d tokens: %d older messages summarized, %d long messages cut",
+                        prompt_tokens, len(dropped), truncated)
+        return result
+    
+    def get_status(self):
+        """Get the prompt size counters for health reporting"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["budget_tokens"] = self.max_tokens
+        stats["prompt_tokens_avg"] = round(stats["prompt_tokens_total"] / stats["builds"]) if stats["builds"] else 0
+        return stats
+
+# Create a singleton instance
+context_builder = ContextBuilder()
@@ -1,80 +1,312 @@
 import sqlite3
+import atexit
 import json
+import logging
 import os
+import queue
+import threading
+import time
 import uuid
-from datetime import datetime
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from utils.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Connection pool settings
+# Connections are kept open and reused across requests so each query does not
+# pay for sqlite3.connect() and its prepared statements are cached per connection
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "128"))
+
+# Write-behind settings
+# When enabled add_message() only queues the message and a background writer
+# commits queued messages in batches (group commit)
+DB_WRITE_BEHIND = os.getenv("DB_WRITE_BEHIND", "false").lower() == "true"
+DB_WRITE_BATCH_SIZE = int(os.getenv("DB_WRITE_BATCH_SIZE", "256"))
+DB_WRITE_RETRY_SECONDS = float(os.getenv("DB_WRITE_RETRY_SECONDS", "0.5"))
+
+# Conversation cache settings
+# Recently used conversations are kept in memory so an active dialogue is not
+# re-read from SQLite on every turn. The TTL bounds how long writes made by
+# other processes can go unseen. A size of 0 disables the cache.
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "256"))
+DB_CACHE_TTL_SECONDS = float(os.getenv("DB_CACHE_TTL_SECONDS", "300"))
+
+# Conversations idle for longer than this are not resumed (0 disables the check)
+CONVERSATION_STALE_HOURS = float(os.getenv("CONVERSATION_STALE_HOURS", "24"))
+
+# A stored transcription's last_used_at is only rewritten once it is this old,
+# so cache lookups are plain reads and rarely wait for the write lock
+TRANSCRIPTION_TOUCH_SECONDS = 3600
+
+# Timestamp format of SQLite's CURRENT_TIMESTAMP (UTC)
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Schema migrations as (version, statements), applied in order on startup
+# The current version is tracked in PRAGMA user_version so an existing
+# database is upgraded in place. Never edit a released migration, append a new one.
+MIGRATIONS = [
+    (1, [
+        # History reads: WHERE conversation_id = ? ORDER BY timestamp
+        """
+        CREATE INDEX IF NOT EXISTS idx_messages_conversation_timestamp
+        ON messages (conversation_id, timestamp)
+        """,
+        # Latest/list conversation reads: WHERE user_id = ? ORDER BY last_updated_at DESC
+        # Covers every selected column so the table itself is never touched
+        """
+        CREATE INDEX IF NOT EXISTS idx_conversations_user_updated
+        ON conversations (user_id, last_updated_at DESC, conversation_id, language_code, started_at)
+        """
+    ]),
+    (2, [
+        # Bumped on every change to a conversation's messages, used for ETags
+        """
+        ALTER TABLE conversations ADD COLUMN revision INTEGER NOT NULL DEFAULT 0
+        """,
+        """
+        UPDATE conversations
+        SET revision = (SELECT COUNT(*) FROM messages WHERE messages.conversation_id = conversations.conversation_id)
+        """
+    ]),
+    (3, [
+        # Transcriptions keyed by a hash of the audio, language and model settings
+        """
+        CREATE TABLE IF NOT EXISTS transcription_cache (
+            cache_key TEXT PRIMARY KEY,
+            transcription TEXT NOT NULL,
+            language TEXT,
+            audio_stats TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Eviction of the least recently used rows
+        """
+        CREATE INDEX IF NOT EXISTS idx_transcription_cache_last_used
+        ON transcription_cache (last_used_at)
+        """
+    ]),
+    (4, [
+        # Reference checks of the audio sweeper: WHERE audio_url IN (...)
+        """
+        CREATE INDEX IF NOT EXISTS idx_messages_audio_url
+        ON messages (audio_url) WHERE audio_url IS NOT NULL
+        """
+    ]),
+    (5, [
+        # Audio the sweepers of every process keep, e.g. speech rendered ahead of time
+        """
+        CREATE TABLE IF NOT EXISTS pinned_audio (
+            audio_url TEXT PRIMARY KEY,
+            pinned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    ]),
+    (6, [
+        # Streaming transcriptions, so any app process can take a stream's next chunk.
+        # Times are Unix seconds, claimed_until marks a chunk being handled
+        """
+        CREATE TABLE IF NOT EXISTS transcription_streams (
+            stream_id TEXT PRIMARY KEY,
+            user_id TEXT,
+            state TEXT NOT NULL,
+            pending_audio BLOB NOT NULL,
+            last_active REAL NOT NULL,
+            claimed_until REAL NOT NULL DEFAULT 0
+        )
+        """
+    ])
+]
 
 class DatabaseManager:
     """
     SQLite database manager for storing and retrieving conversation history
     """
-    def __init__(self, db_path="conversation_history.db"):
+    def __init__(self, db_path="conversation_history.db", pool_size=DB_POOL_SIZE, write_behind=DB_WRITE_BEHIND):
         """Initialize the database manager with the path to the SQLite database"""
         # Use absolute path if db_path is not absolute
         if not os.path.isabs(db_path):
             db_path = os.path.join(os.getcwd(), db_path)
-            
+        
         self.db_path = db_path
+        self._pool = queue.LifoQueue(maxsize=pool_size)
         self._create_tables()
+        self._migrate()
         
-    def _get_connection(self):
-        """Get a connection to the SQLite database"""
-        return sqlite3.connect(self.db_path)
-    
-    def _create_tables(self):
-        """Create the necessary tables if they don't exist"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        # Queued messages not yet committed, by conversation_id, for read-your-writes
+        self.write_behind = write_behind
+        self._write_queue = queue.Queue()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._writer = None
+        # conversation_id -> [lock, writers using it]; messages of one conversation
+        # are added in turn, other conversations are written in parallel
+        self._write_locks = {}
+        self._write_locks_lock = threading.Lock()
         
-        # Create users table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id TEXT PRIMARY KEY,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-        ''')
+        # LRU cache of conversation_id -> (loaded_at, messages)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # conversation_id -> [loads in flight, generation]; every write bumps the
+        # generation so a load that started before it knows its result is stale
+        self._cache_loads = {}
+        self._cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
         
-        # Create conversations table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            conversation_id TEXT PRIMARY KEY,
-            user_id TEXT,
-            language_code TEXT,
-            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        if write_behind:
+            self._writer = threading.Thread(target=self._writer_loop, name="db-writer", daemon=True)
+            self._writer.start()
+            # Durability flush on interpreter shutdown
+            atexit.register(self.flush)
+    
+    def _get_connection(self):
+        """Open a new connection to the SQLite database"""
+        # isolation_level=None leaves transaction control to _transaction(),
+        # check_same_thread=False lets the pool hand the connection to any request thread
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE_SIZE
         )
-        ''')
         
-        # Create messages table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            message_id TEXT PRIMARY KEY,
-            conversation_id TEXT,
-            role TEXT,
-            content TEXT,
-            audio_url TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (conversation_id) REFERENCES conversations (conversation_id)
-        )
-        ''')
+        # WAL lets readers proceed while a single writer commits
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
         
-        conn.commit()
-        conn.close()
+        return conn
     
-    def create_user(self):
-        """Create a new user and return the user_id"""
-        user_id = str(uuid.uuid4())
+    @contextmanager
+    def _connection(self, stage="db_read"):
+        """Borrow a pooled connection for the duration of the block, which is timed as the given stage"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._get_connection()
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        try:
+            with timed(stage):
+                yield conn
+        finally:
+            # Never hand a connection with an open transaction back to the pool
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+    
+    @contextmanager
+    def _transaction(self):
+        """Borrow a pooled connection and run the block in a write transaction"""
+        with self._connection("db_write") as conn:
+            # IMMEDIATE takes the write lock up front so concurrent writers wait on
+            # busy_timeout instead of failing when upgrading a read lock
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.rollback()
+                raise
+            conn.commit()
+    
+    def close(self):
+        """Flush queued writes and close all pooled connections"""
+        self.flush()
         
-        cursor.execute('''
-        INSERT INTO users (user_id) VALUES (?)
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+    
+    def _create_tables(self):
+        """Create the necessary tables if they don't exist"""
+        with self._transaction() as conn:
+            cursor = conn.cursor()
+            
+            # Create users table
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                user_id TEXT PRIMARY KEY,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''')
+            
+            # Create conversations table
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS conversations (
+                conversation_id TEXT PRIMARY KEY,
+                user_id TEXT,
+                language_code TEXT,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (user_id)
+            )
+            ''')
+            
+            # Create messages table
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS messages (
+                message_id TEXT PRIMARY KEY,
+                conversation_id TEXT,
+                role TEXT,
+                content TEXT,
+                audio_url TEXT,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (conversation_id) REFERENCES conversations (conversation_id)
+            )
+            ''')
+    
+    def get_schema_version(self):
+        """Get the schema version of the database"""
+        with self._connection() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+    
+    def _migrate(self):
+        """Apply any migrations newer than the database's schema version"""
+        with self._transaction() as conn:
+            current_version = conn.execute("PRAGMA user_version").fetchone()[0]
+            
+            for version, statements in MIGRATIONS:
+                if version <= current_version:
+                    continue
+                
+                logger.info("Migrating database schema to version %s", version)
+                for statement in statements:
+                    conn.execute(statement)
+                
+                # PRAGMA does not accept bound parameters
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+    
+    def new_user_id(self):
+        """
+        Allocate a user_id without writing to the database
+        
+        The users row is inserted lazily by create_conversation() the first
+        time the user has a conversation to persist.
+        """
+        return str(uuid.uuid4())
+    
+    def _ensure_user(self, conn, user_id):
+        """Insert the users row for user_id if it does not exist yet"""
+        conn.execute('''
+        INSERT OR IGNORE INTO users (user_id) VALUES (?)
         ''', (user_id,))
+    
+    def create_user(self):
+        """Create a new user and return the user_id"""
+        user_id = self.new_user_id()
         
-        conn.commit()
-        conn.close()
+        with self._transaction() as conn:
+            self._ensure_user(conn, user_id)
         
         return user_id
     
@@ -82,129 +314,545 @@ class DatabaseManager:
         """Create a new conversation and return the conversation_id"""
         conversation_id = str(uuid.uuid4())
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self._transaction() as conn:
+            self._insert_conversation(conn, conversation_id, user_id, language_code)
         
-        cursor.execute('''
+        return conversation_id
+    
+    def _insert_conversation(self, conn, conversation_id, user_id, language_code):
+        """Insert a conversation row, creating the user row if needed"""
+        # Deferred user creation rides along in the conversation's transaction
+        self._ensure_user(conn, user_id)
+        
+        conn.execute('''
         INSERT INTO conversations (conversation_id, user_id, language_code)
         VALUES (?, ?, ?)
         ''', (conversation_id, user_id, language_code))
-        
-        conn.commit()
-        conn.close()
-        
-        return conversation_id
     
     def add_message(self, conversation_id, role, content, audio_url=None):
         """Add a message to a conversation"""
-        message_id = str(uuid.uuid4())
+        # Stamp, store and cache one message of the conversation at a time, so the
+        # cached order matches the (timestamp, rowid) order the database reads back
+        with self._conversation_lock(conversation_id):
+            message = {
+                "message_id": str(uuid.uuid4()),
+                "conversation_id": conversation_id,
+                "role": role,
+                "content": content,
+                "audio_url": audio_url,
+                # Taken now so a queued message keeps its place in the conversation
+                "timestamp": datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+            }
+            
+            if self.write_behind:
+                with self._pending_lock:
+                    self._pending.setdefault(conversation_id, []).append(message)
+                self._write_queue.put(message)
+            else:
+                with self._transaction() as conn:
+                    self._insert_messages(conn, [message])
+            
+            self._cache_append(message)
+        
+        return message["message_id"]
+    
+    @contextmanager
+    def _conversation_lock(self, conversation_id):
+        """Hold the write lock of one conversation for the duration of the block"""
+        with self._write_locks_lock:
+            entry = self._write_locks.setdefault(conversation_id, [threading.Lock(), 0])
+            entry[1] += 1
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._write_locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._write_locks[conversation_id]
+    
+    def _insert_messages(self, conn, messages):
+        """Insert messages and bump their conversations' last_updated_at"""
+        conn.executemany('''
+        INSERT INTO messages (message_id, conversation_id, role, content, audio_url, timestamp)
+        VALUES (:message_id, :conversation_id, :role, :content, :audio_url, :timestamp)
+        ''', messages)
         
-        # Add the message
-        cursor.execute('''
-        INSERT INTO messages (message_id, conversation_id, role, content, audio_url)
-        VALUES (?, ?, ?, ?, ?)
-        ''', (message_id, conversation_id, role, content, audio_url))
+        # Update each conversation's last_updated_at and revision once per batch
+        updates = {}
+        for message in messages:
+            timestamp, count = updates.get(message["conversation_id"], ("", 0))
+            updates[message["conversation_id"]] = (max(message["timestamp"], timestamp), count + 1)
         
-        # Update the conversation's last_updated_at timestamp
-        cursor.execute('''
+        conn.executemany('''
         UPDATE conversations
-        SET last_updated_at = CURRENT_TIMESTAMP
+        SET last_updated_at = MAX(last_updated_at, ?), revision = revision + ?
         WHERE conversation_id = ?
-        ''', (conversation_id,))
+        ''', [(timestamp, count, conversation_id) for conversation_id, (timestamp, count) in updates.items()])
+    
+    def _writer_loop(self):
+        """Background writer: commit queued messages in batches"""
+        while True:
+            # Block for the first message, then take whatever queued up behind it
+            batch = [self._write_queue.get()]
+            while len(batch) < DB_WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            # Insert the latest version of each message, update_message_audio()
+            # replaces queued ones instead of changing the dicts queued here
+            with self._pending_lock:
+                written = {message["message_id"]: message for message in self._queued_versions(batch)}
+            
+            # Keep retrying, the messages stay readable from _pending meanwhile
+            self._write_retrying(self._insert_messages, list(written.values()))
+            
+            # Messages replaced while they were being inserted are updated before
+            # they leave _pending, so readers never see their old audio_url again
+            while True:
+                with self._pending_lock:
+                    changed = [message for message in self._queued_versions(batch)
+                               if message is not written[message["message_id"]]]
+                    if not changed:
+                        self._drop_pending(written)
+                        break
+                
+                self._write_retrying(self._update_audio_urls, changed)
+                written.update((message["message_id"], message) for message in changed)
+            
+            for _ in batch:
+                self._write_queue.task_done()
+    
+    def _queued_versions(self, batch):
+        """Current version of each message in batch, from _pending if it is still there (call with _pending_lock held)"""
+        current = {}
+        for conversation_id in {message["conversation_id"] for message in batch}:
+            for message in self._pending.get(conversation_id, []):
+                current[message["message_id"]] = message
+        return [current.get(message["message_id"], message) for message in batch]
+    
+    def _drop_pending(self, committed):
+        """Remove committed messages, a dict by message_id, from _pending (call with _pending_lock held)"""
+        for conversation_id in {message["conversation_id"] for message in committed.values()}:
+            pending = [message for message in self._pending.get(conversation_id, [])
+                       if message["message_id"] not in committed]
+            if pending:
+                self._pending[conversation_id] = pending
+            else:
+                self._pending.pop(conversation_id, None)
+    
+    def _write_retrying(self, write, messages):
+        """Run write(conn, messages) in a transaction until it succeeds"""
+        while True:
+            try:
+                with self._transaction() as conn:
+                    write(conn, messages)
+                return
+            except Exception as e:
+                logger.warning("Error writing %d queued messages, retrying: %s", len(messages), e)
+                time.sleep(DB_WRITE_RETRY_SECONDS)
+    
+    def _update_audio_urls(self, conn, messages):
+        """Store the audio_url of messages the writer already inserted"""
+        conn.executemany('''
+        UPDATE messages SET audio_url = ? WHERE message_id = ?
+        ''', [(message["audio_url"], message["message_id"]) for message in messages])
+    
+    def flush(self, timeout=None):
+        """
+        Block until every queued message has been committed
         
-        conn.commit()
-        conn.close()
+        Returns:
+            bool: True if the queue drained, False if the timeout expired first
+        """
+        if not self.write_behind:
+            return True
         
-        return message_id
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._write_queue.all_tasks_done:
+            while self._write_queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._write_queue.all_tasks_done.wait(remaining)
+        return True
     
-    def get_conversation_history(self, conversation_id, limit=None):
-        """Get the message history for a conversation"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _cache_append(self, message):
+        """Write-through: append a new message to its cached conversation"""
+        with self._cache_lock:
+            entry = self._cache.get(message["conversation_id"])
+            # A load that read after the commit may have cached the message already
+            if entry is not None and not any(cached["message_id"] == message["message_id"]
+                                             for cached in reversed(entry[1])):
+                entry[1].append(message)
+            
+            self._invalidate_loads(message["conversation_id"])
+    
+    def _invalidate_loads(self, conversation_id):
+        """Make loads of a conversation still in flight skip caching what they read (call with _cache_lock held)"""
+        loads = self._cache_loads.get(conversation_id)
+        if loads is not None:
+            loads[1] += 1
+    
+    def _load_messages(self, conversation_id):
+        """Load all messages of a conversation, from the cache when possible"""
+        if DB_CACHE_SIZE <= 0:
+            return self._read_messages(conversation_id)
         
-        if limit:
-            cursor.execute('''
-            SELECT role, content, audio_url, timestamp
-            FROM messages
-            WHERE conversation_id = ?
-            ORDER BY timestamp ASC
-            LIMIT ?
-            ''', (conversation_id, limit))
-        else:
+        with self._cache_lock:
+            entry = self._cache.get(conversation_id)
+            if entry is not None and time.monotonic() - entry[0] <= DB_CACHE_TTL_SECONDS:
+                self._cache.move_to_end(conversation_id)
+                self._cache_stats["hits"] += 1
+                return list(entry[1])
+            
+            if entry is not None:
+                del self._cache[conversation_id]
+                self._cache_stats["evictions"] += 1
+            
+            self._cache_stats["misses"] += 1
+            loads = self._cache_loads.setdefault(conversation_id, [0, 0])
+            loads[0] += 1
+            generation = loads[1]
+        
+        messages = None
+        try:
+            messages = self._read_messages(conversation_id)
+        finally:
+            with self._cache_lock:
+                loads = self._cache_loads[conversation_id]
+                stale = loads[1] != generation
+                loads[0] -= 1
+                if not loads[0]:
+                    del self._cache_loads[conversation_id]
+                
+                # Don't cache a read that raced with a write to the same conversation
+                if messages is not None and not stale:
+                    self._cache[conversation_id] = (time.monotonic(), list(messages))
+                    self._cache.move_to_end(conversation_id)
+                    while len(self._cache) > DB_CACHE_SIZE:
+                        self._cache.popitem(last=False)
+                        self._cache_stats["evictions"] += 1
+        
+        return messages
+    
+    def cache_stats(self):
+        """Get the conversation cache's hit/miss/eviction counters and current size"""
+        with self._cache_lock:
+            return dict(self._cache_stats, size=len(self._cache))
+    
+    def _read_messages(self, conversation_id):
+        """Read all messages of a conversation, including queued ones not yet committed"""
+        # Snapshot the queue before reading so a message committed in between is
+        # found in one place or the other, never neither
+        pending = self._queued_messages(conversation_id)
+        
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            
             cursor.execute('''
-            SELECT role, content, audio_url, timestamp
+            SELECT message_id, role, content, audio_url, timestamp
             FROM messages
             WHERE conversation_id = ?
-            ORDER BY timestamp ASC
+            ORDER BY timestamp ASC, rowid ASC
             ''', (conversation_id,))
+            
+            rows = cursor.fetchall()
         
+        return self._merge_pending(self._message_rows(rows), pending)
+    
+    def _message_rows(self, rows):
+        """Convert (message_id, role, content, audio_url, timestamp) rows to dicts"""
         messages = []
-        for row in cursor.fetchall():
+        for row in rows:
             messages.append({
-                "role": row[0],
-                "content": row[1],
-                "audio_url": row[2],
-                "timestamp": row[3]
+                "message_id": row[0],
+                "role": row[1],
+                "content": row[2],
+                "audio_url": row[3],
+                "timestamp": row[4]
             })
+        return messages
+    
+    def _queued_messages(self, conversation_id):
+        """Copies of a conversation's queued messages, with the fields of committed ones"""
+        with self._pending_lock:
+            pending = list(self._pending.get(conversation_id, []))
         
-        conn.close()
-        
+        return self._message_rows(
+            (message["message_id"], message["role"], message["content"], message["audio_url"], message["timestamp"])
+            for message in pending
+        )
+    
+    def _merge_pending(self, messages, pending):
+        """Append queued messages that are newer than and not already in messages"""
+        if pending:
+            committed = {message["message_id"] for message in messages}
+            messages.extend(message for message in pending if message["message_id"] not in committed)
         return messages
     
-    def get_conversation_for_ai(self, conversation_id):
-        """Get the conversation history formatted for AI context"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def get_messages_page(self, conversation_id, after=None, before=None, limit=50):
+        """
+        Get one page of a conversation's messages using a message_id cursor
+        
+        Pages are read with an index seek, so the cost does not depend on how
+        long the conversation is. Messages are ordered oldest first.
+        
+        Args:
+            conversation_id: ID of the conversation
+            after: Return messages newer than this message_id
+            before: Return messages older than this message_id
+            limit: Maximum number of messages to return
+        
+        Without a cursor the newest page is returned.
+        
+        Returns:
+            tuple: (messages, has_more) where has_more says whether further
+            messages exist in the paging direction, or None if the cursor is unknown
+        """
+        pending = self._queued_messages(conversation_id)
+        pending_ids = [message["message_id"] for message in pending]
+        
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            
+            if after:
+                # Queued messages come after everything committed
+                if after in pending_ids:
+                    newer = pending[pending_ids.index(after) + 1:]
+                    return newer[:limit], len(newer) > limit
+                
+                position = self._message_position(cursor, conversation_id, after)
+                if position is None:
+                    return None
+                
+                cursor.execute('''
+                SELECT message_id, role, content, audio_url, timestamp
+                FROM messages
+                WHERE conversation_id = ? AND (timestamp, rowid) > (?, ?)
+                ORDER BY timestamp ASC, rowid ASC
+                LIMIT ?
+                ''', (conversation_id, position[0], position[1], limit + 1))
+                
+                messages = self._merge_pending(self._message_rows(cursor.fetchall()), pending)
+                return messages[:limit], len(messages) > limit
+            
+            if before and before in pending_ids:
+                older = pending[:pending_ids.index(before)]
+                position = None
+            elif before:
+                older = []
+                position = self._message_position(cursor, conversation_id, before)
+                if position is None:
+                    return None
+            else:
+                older = pending
+                position = None
+            
+            if position:
+                cursor.execute('''
+                SELECT message_id, role, content, audio_url, timestamp
+                FROM messages
+                WHERE conversation_id = ? AND (timestamp, rowid) < (?, ?)
+                ORDER BY timestamp DESC, rowid DESC
+                LIMIT ?
+                ''', (conversation_id, position[0], position[1], limit + 1))
+            else:
+                cursor.execute('''
+                SELECT message_id, role, content, audio_url, timestamp
+                FROM messages
+                WHERE conversation_id = ?
+                ORDER BY timestamp DESC, rowid DESC
+                LIMIT ?
+                ''', (conversation_id, limit + 1))
+            
+            rows = cursor.fetchall()
         
+        messages = self._merge_pending(self._message_rows(reversed(rows)), older)
+        return messages[-limit:], len(messages) > limit
+    
+    def _message_position(self, cursor, conversation_id, message_id):
+        """Get the (timestamp, rowid) sort key of a committed message"""
         cursor.execute('''
-        SELECT role, content, timestamp
+        SELECT timestamp, rowid
         FROM messages
-        WHERE conversation_id = ?
-        ORDER BY timestamp ASC
-        ''', (conversation_id,))
+        WHERE message_id = ? AND conversation_id = ?
+        ''', (message_id, conversation_id))
         
+        return cursor.fetchone()
+    
+    def get_conversation_history(self, conversation_id, limit=None):
+        """Get the message history for a conversation"""
         messages = []
-        for row in cursor.fetchall():
+        for message in self._load_messages(conversation_id):
+            messages.append({
+                "message_id": message["message_id"],
+                "role": message["role"],
+                "content": message["content"],
+                "audio_url": message["audio_url"],
+                "timestamp": message["timestamp"]
+            })
+        
+        if limit:
+            messages = messages[:limit]
+        
+        return messages
+    
+    def get_conversation_for_ai(self, conversation_id):
+        """Get the conversation history formatted for AI context"""
+        messages = []
+        for message in self._load_messages(conversation_id):
             # Only include messages that have content
-            if row[1] and row[1].strip():
+            if message["content"] and message["content"].strip():
                 messages.append({
-                    "role": row[0],
-                    "content": row[1]
+                    "role": message["role"],
+                    "content": message["content"]
                 })
         
-        conn.close()
-        
-        # Debug output
-        print(f"Retrieved {len(messages)} messages from database for conversation {conversation_id}")
-        for i, msg in enumerate(messages):
-            print(f"DB Message {i}: {msg['role']} - {msg['content']}")
+        logger.debug("Retrieved %d messages for conversation %s", len(messages), conversation_id)
         
         # Ensure we have a clean conversation history
         # If we have an odd number of messages and the last one is from the assistant,
         # remove it to ensure we're not repeating questions
         if len(messages) % 2 != 0 and len(messages) > 0 and messages[-1]['role'] == 'assistant':
-            print("Removing last assistant message to prevent repetition")
+            logger.debug("Removing last assistant message to prevent repetition")
             messages = messages[:-1]
         
         return messages
     
-    def get_user_conversations(self, user_id):
-        """Get all conversations for a user"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def get_message_audio(self, message_id):
+        """
+        Get the audio_url of a message
         
-        cursor.execute('''
-        SELECT conversation_id, language_code, started_at, last_updated_at
-        FROM conversations
-        WHERE user_id = ?
-        ORDER BY last_updated_at DESC
-        ''', (user_id,))
+        Returns:
+            tuple: (whether the message is stored, its audio_url or None)
+        """
+        with self._connection() as conn:
+            row = conn.execute('''
+            SELECT audio_url FROM messages WHERE message_id = ?
+            ''', (message_id,)).fetchone()
+        
+        if row is None:
+            return False, None
+        return True, row[0]
+    
+    def update_message_audio(self, conversation_id, message_id, audio_url):
+        """
+        Set the audio_url of a message whose speech was synthesized after it was stored
+        
+        Args:
+            conversation_id: ID of the message's conversation
+            message_id: ID of the message
+            audio_url: URL of the audio file
+        """
+        # A queued message is written by the writer with the new URL, and one
+        # the writer already inserted is updated below
+        with self._pending_lock:
+            pending = self._pending.get(conversation_id, [])
+            for i, message in enumerate(pending):
+                if message["message_id"] == message_id:
+                    # Replace rather than mutate, readers and the writer may hold the old dict
+                    pending[i] = dict(message, audio_url=audio_url)
+        
+        with self._transaction() as conn:
+            conn.execute('''
+            UPDATE messages SET audio_url = ? WHERE message_id = ?
+            ''', (audio_url, message_id))
+            
+            # The history changed, so its ETag must too
+            conn.execute('''
+            UPDATE conversations SET revision = revision + 1 WHERE conversation_id = ?
+            ''', (conversation_id,))
+        
+        with self._cache_lock:
+            entry = self._cache.get(conversation_id)
+            if entry is not None:
+                messages = entry[1]
+                for i, message in enumerate(messages):
+                    if message["message_id"] == message_id:
+                        # Replace rather than mutate, readers may hold the old dict
+                        messages[i] = dict(message, audio_url=audio_url)
+            
+            self._invalidate_loads(conversation_id)
+    
+    def get_conversation(self, conversation_id):
+        """Get the details of a single conversation"""
+        with self._pending_lock:
+            pending_count = len(self._pending.get(conversation_id, []))
+        
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+            SELECT conversation_id, language_code, started_at, last_updated_at, revision
+            FROM conversations
+            WHERE conversation_id = ?
+            ''', (conversation_id,))
+            
+            result = cursor.fetchone()
+        
+        if result:
+            return {
+                "conversation_id": result[0],
+                "language_code": result[1],
+                "started_at": result[2],
+                "last_updated_at": result[3],
+                # Queued messages count as changes too
+                "revision": result[4] + pending_count
+            }
+        return None
+    
+    def get_user_conversations_page(self, user_id, before=None, limit=20):
+        """
+        Get one page of a user's conversations, most recently updated first
+        
+        Args:
+            user_id: ID of the user
+            before: Return conversations listed after this conversation_id
+            limit: Maximum number of conversations to return
+        
+        Returns:
+            tuple: (conversations, has_more), or None if the cursor is unknown
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            
+            if before:
+                cursor.execute('''
+                SELECT last_updated_at
+                FROM conversations
+                WHERE conversation_id = ? AND user_id = ?
+                ''', (before, user_id))
+                
+                position = cursor.fetchone()
+                if position is None:
+                    return None
+                
+                # Same order as idx_conversations_user_updated, so this is an index seek
+                cursor.execute('''
+                SELECT conversation_id, language_code, started_at, last_updated_at
+                FROM conversations
+                WHERE user_id = ?
+                  AND (last_updated_at < ? OR (last_updated_at = ? AND conversation_id > ?))
+                ORDER BY last_updated_at DESC, conversation_id ASC
+                LIMIT ?
+                ''', (user_id, position[0], position[0], before, limit + 1))
+            else:
+                cursor.execute('''
+                SELECT conversation_id, language_code, started_at, last_updated_at
+                FROM conversations
+                WHERE user_id = ?
+                ORDER BY last_updated_at DESC, conversation_id ASC
+                LIMIT ?
+                ''', (user_id, limit + 1))
+            
+            rows = cursor.fetchall()
         
         conversations = []
-        for row in cursor.fetchall():
+        for row in rows[:limit]:
             conversations.append({
                 "conversation_id": row[0],
                 "language_code": row[1],
@@ -212,26 +860,47 @@ class DatabaseManager:
                 "last_updated_at": row[3]
             })
         
-        conn.close()
+        return conversations, len(rows) > limit
+    
+    def get_user_conversations(self, user_id):
+        """Get all conversations for a user"""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+            SELECT conversation_id, language_code, started_at, last_updated_at
+            FROM conversations
+            WHERE user_id = ?
+            ORDER BY last_updated_at DESC
+            ''', (user_id,))
+            
+            rows = cursor.fetchall()
+        
+        conversations = []
+        for row in rows:
+            conversations.append({
+                "conversation_id": row[0],
+                "language_code": row[1],
+                "started_at": row[2],
+                "last_updated_at": row[3]
+            })
         
         return conversations
     
     def get_latest_conversation(self, user_id):
         """Get the most recent conversation for a user"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-        SELECT conversation_id, language_code
-        FROM conversations
-        WHERE user_id = ?
-        ORDER BY last_updated_at DESC
-        LIMIT 1
-        ''', (user_id,))
-        
-        result = cursor.fetchone()
-        
-        conn.close()
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+            SELECT conversation_id, language_code
+            FROM conversations
+            WHERE user_id = ?
+            ORDER BY last_updated_at DESC
+            LIMIT 1
+            ''', (user_id,))
+            
+            result = cursor.fetchone()
         
         if result:
             return {
@@ -240,32 +909,244 @@ class DatabaseManager:
             }
         return None
     
-    def get_or_create_conversation(self, user_id, language_code):
-        """Get the latest conversation or create a new one if none exists"""
-        latest = self.get_latest_conversation(user_id)
+    def get_or_create_conversation(self, user_id, language_code, stale_after_hours=None):
+        """
+        Get the user's active conversation or create a new one
         
-        if latest:
-            # Check if the conversation is recent (within 24 hours)
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-            SELECT last_updated_at
+        The latest conversation is resumed if it is in the same language and was
+        updated within the staleness window, otherwise a new one is started.
+        The lookup and the insert run in one write transaction, so two concurrent
+        requests for the same user cannot both create a conversation.
+        
+        Args:
+            user_id: ID of the user
+            language_code: ISO language code of the conversation
+            stale_after_hours: Staleness window, defaults to CONVERSATION_STALE_HOURS
+        
+        Returns:
+            str: conversation_id of the active conversation
+        """
+        if stale_after_hours is None:
+            stale_after_hours = CONVERSATION_STALE_HOURS
+        
+        with self._transaction() as conn:
+            latest = conn.execute('''
+            SELECT conversation_id, language_code, last_updated_at
             FROM conversations
-            WHERE conversation_id = ?
-            ''', (latest["conversation_id"],))
+            WHERE user_id = ?
+            ORDER BY last_updated_at DESC
+            LIMIT 1
+            ''', (user_id,)).fetchone()
             
-            last_updated = cursor.fetchone()[0]
-            conn.close()
+            if latest and latest[1] == language_code:
+                cutoff = datetime.now(timezone.utc) - timedelta(hours=stale_after_hours)
+                if stale_after_hours <= 0 or latest[2] >= cutoff.strftime(TIMESTAMP_FORMAT):
+                    return latest[0]
+            
+            # No conversation, language changed or conversation is old: start a new one
+            conversation_id = str(uuid.uuid4())
+            self._insert_conversation(conn, conversation_id, user_id, language_code)
+        
+        return conversation_id
+    
+    def get_cached_transcription(self, cache_key):
+        """
+        Look up a stored transcription, marking it as recently used at most
+        once per TRANSCRIPTION_TOUCH_SECONDS
+        
+        Args:
+            cache_key: Key from the transcription cache
+        
+        Returns:
+            tuple: (transcription, language, audio stats dict), or None if not stored
+        """
+        with self._connection() as conn:
+            row = conn.execute('''
+            SELECT transcription, language, audio_stats, last_used_at FROM transcription_cache WHERE cache_key = ?
+            ''', (cache_key,)).fetchone()
+        
+        if row is None:
+            return None
+        
+        # Eviction only needs a rough order, like audio_storage.touch()
+        now = datetime.now(timezone.utc)
+        cutoff = (now - timedelta(seconds=TRANSCRIPTION_TOUCH_SECONDS)).strftime(TIMESTAMP_FORMAT)
+        if row[3] is None or row[3] < cutoff:
+            with self._transaction() as conn:
+                conn.execute('''
+                UPDATE transcription_cache SET last_used_at = ? WHERE cache_key = ?
+                ''', (now.strftime(TIMESTAMP_FORMAT), cache_key))
+        
+        return row[0], row[1], json.loads(row[2]) if row[2] else {}
+    
+    def save_cached_transcription(self, cache_key, transcription, language, audio_stats, max_rows):
+        """
+        Store a transcription, evicting the least recently used rows
+        
+        Args:
+            cache_key: Key from the transcription cache
+            transcription: Transcribed text
+            language: Detected language
+            audio_stats: Durations from preprocess_audio()
+            max_rows: Most rows kept in the table
+        """
+        with self._transaction() as conn:
+            conn.execute('''
+            INSERT OR REPLACE INTO transcription_cache (cache_key, transcription, language, audio_stats, last_used_at)
+            VALUES (?, ?, ?, ?, ?)
+            ''', (cache_key, transcription, language, json.dumps(audio_stats),
+                  datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)))
             
-            # If language changed or conversation is old, create a new one
-            if latest["language_code"] != language_code:
-                return self.create_conversation(user_id, language_code)
+            conn.execute('''
+            DELETE FROM transcription_cache WHERE cache_key IN (
+                SELECT cache_key FROM transcription_cache
+                ORDER BY last_used_at DESC
+                LIMIT -1 OFFSET ?
+            )
+            ''', (max_rows,))
+    
+    def get_referenced_audio_urls(self, audio_urls):
+        """
+        Find which audio URLs are still used by a message
+        
+        Args:
+            audio_urls: Iterable of audio URLs
+        
+        Returns:
+            set: The URLs referenced by a stored or queued message
+        """
+        audio_urls = list(audio_urls)
+        
+        with self._pending_lock:
+            referenced = {message["audio_url"] for messages in self._pending.values()
+                          for message in messages if message.get("audio_url")}
+        referenced.intersection_update(audio_urls)
+        
+        with self._connection() as conn:
+            # Batches stay well below SQLite's limit on bound parameters
+            for start in range(0, len(audio_urls), 500):
+                batch = audio_urls[start:start + 500]
+                rows = conn.execute(f'''
+                SELECT DISTINCT audio_url FROM messages WHERE audio_url IN ({", ".join("?" * len(batch))})
+                ''', batch).fetchall()
+                referenced.update(row[0] for row in rows)
+        
+        return referenced
+    
+    def pin_audio_url(self, audio_url):
+        """Keep the audio at this URL from being deleted by any process's sweeper"""
+        with self._transaction() as conn:
+            conn.execute('''
+            INSERT OR IGNORE INTO pinned_audio (audio_url) VALUES (?)
+            ''', (audio_url,))
+    
+    def get_pinned_audio_urls(self, audio_urls):
+        """
+        Find which audio URLs are pinned
+        
+        Args:
+            audio_urls: Iterable of audio URLs
+        
+        Returns:
+            set: The URLs pinned by pin_audio_url()
+        """
+        audio_urls = list(audio_urls)
+        pinned = set()
+        
+        with self._connection() as conn:
+            for start in range(0, len(audio_urls), 500):
+                batch = audio_urls[start:start + 500]
+                rows = conn.execute(f'''
+                SELECT audio_url FROM pinned_audio WHERE audio_url IN ({", ".join("?" * len(batch))})
+                ''', batch).fetchall()
+                pinned.update(row[0] for row in rows)
+        
+        return pinned
+    
+    def create_transcription_stream(self, stream_id, user_id, state, pending_audio, max_streams, idle_seconds):
+        """
+        Store a new streaming transcription, dropping idle ones first
+        
+        Args:
+            stream_id: ID of the stream
+            user_id: Owner of the stream
+            state: JSON-serializable state of the stream
+            pending_audio: Audio not final yet, as bytes
+            max_streams: Most streams open at once
+            idle_seconds: Streams without a chunk for this long are dropped
+        
+        Returns:
+            bool: False if max_streams are already open
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute('''
+            DELETE FROM transcription_streams WHERE last_active < ? AND claimed_until < ?
+            ''', (now - idle_seconds, now))
+            
+            if conn.execute("SELECT COUNT(*) FROM transcription_streams").fetchone()[0] >= max_streams:
+                return False
+            
+            conn.execute('''
+            INSERT INTO transcription_streams (stream_id, user_id, state, pending_audio, last_active)
+            VALUES (?, ?, ?, ?, ?)
+            ''', (stream_id, user_id, json.dumps(state), pending_audio, now))
+        return True
+    
+    def claim_transcription_stream(self, stream_id, lease_seconds):
+        """
+        Take a stream for one chunk, so its chunks are handled one at a time by any process
+        
+        Args:
+            stream_id: ID of the stream
+            lease_seconds: How long the claim holds if it is never released
+        
+        Returns:
+            tuple: (user_id, state, pending_audio), False if another request holds
+                   the stream, or None if it does not exist
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute('''
+            SELECT user_id, state, pending_audio, claimed_until FROM transcription_streams WHERE stream_id = ?
+            ''', (stream_id,)).fetchone()
+            
+            if row is None:
+                return None
+            if row[3] > now:
+                return False
             
-            return latest["conversation_id"]
+            conn.execute('''
+            UPDATE transcription_streams SET claimed_until = ? WHERE stream_id = ?
+            ''', (now + lease_seconds, stream_id))
         
-        # No conversation exists, create a new one
-        return self.create_conversation(user_id, language_code)
+        return row[0], json.loads(row[1]), row[2]
+    
+    def release_transcription_stream(self, stream_id, state=None, pending_audio=None):
+        """Let the next chunk claim a stream, storing its new state if given"""
+        with self._transaction() as conn:
+            if state is None:
+                conn.execute('''
+                UPDATE transcription_streams SET claimed_until = 0 WHERE stream_id = ?
+                ''', (stream_id,))
+            else:
+                conn.execute('''
+                UPDATE transcription_streams
+                SET state = ?, pending_audio = ?, last_active = ?, claimed_until = 0
+                WHERE stream_id = ?
+                ''', (json.dumps(state), pending_audio, time.time(), stream_id))
+    
+    def delete_transcription_stream(self, stream_id):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM transcription_streams WHERE stream_id = ?", (stream_id,))
+    
+    def count_transcription_streams(self, idle_seconds):
+        """Number of streams that received a chunk within idle_seconds or are handling one"""
+        now = time.time()
+        with self._connection() as conn:
+            return conn.execute('''
+            SELECT COUNT(*) FROM transcription_streams WHERE last_active >= ? OR claimed_until >= ?
+            ''', (now - idle_seconds, now)).fetchone()[0]
 
 # Create a singleton instance
 db_manager = DatabaseManager()
@@ -1,15 +1,9 @@
-import os
-import groq
-from dotenv import load_dotenv
+import logging
+from utils.context_builder import context_builder
+from utils.llm_gateway import llm_gateway
+from utils.loan_recommender import extract_answers, loan_recommender
 
-# Load environment variables
-load_dotenv()
-
-# Get API key from environment
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-
-# Initialize the Groq client
-client = groq.Groq(api_key=GROQ_API_KEY)
+logger = logging.getLogger(__name__)
 
 # Define language codes and their names
 LANGUAGE_CODES = {
@@ -62,51 +56,26 @@ AI: Based on your needs, I recommend a Farm Mechanization Loan with 9.0% interes
 FOLLOW THIS EXACT PATTERN WITHOUT DEVIATION.
 """
 
-# Define loan types and their typical interest rates
-LOAN_TYPES = {
-    "crop_loan": {
-        "name": "Crop Loan",
-        "interest_rate": "6.5%",
-        "eligibility": "Farmers with land ownership documents",
-        "purpose": "For seasonal agricultural operations"
-    },
-    "kisan_credit_card": {
-        "name": "Kisan Credit Card (KCC)",
-        "interest_rate": "7.0%",
-        "eligibility": "All farmers with land records",
-        "purpose": "For cultivation expenses and allied agricultural activities"
-    },
-    "dairy_loan": {
-        "name": "Dairy Loan",
-        "interest_rate": "8.5%",
-        "eligibility": "Farmers engaged in dairy farming",
-        "purpose": "For purchase of milch animals and dairy equipment"
-    },
-    "farm_mechanization_loan": {
-        "name": "Farm Mechanization Loan",
-        "interest_rate": "9.0%",
-        "eligibility": "Farmers with regular income",
-        "purpose": "For purchase of tractors and farm equipment"
-    },
-    "self_help_group_loan": {
-        "name": "Self Help Group (SHG) Loan",
-        "interest_rate": "10.0%",
-        "eligibility": "Members of registered SHGs",
-        "purpose": "For group-based income generation activities"
-    },
-    "microfinance_loan": {
-        "name": "Microfinance Loan",
-        "interest_rate": "12.0%",
-        "eligibility": "Low-income individuals",
-        "purpose": "For small business and income generation"
-    }
-}
+# The first three questions are always asked in this order, word for word,
+# so their speech can be rendered ahead of time (see utils/tts_cache.py)
+FORCED_QUESTIONS = [
+    # First interaction - ask about loan purpose
+    "What do you need the loan for?",
+    # Second interaction - ask about loan amount
+    "How much money do you need?",
+    # Third interaction - ask about monthly income
+    "What is your approximate monthly income?"
+]
 
-def get_ai_response(message, conversation_history, language_code):
-    """Get AI response using GroqCloud"""
-    if not GROQ_API_KEY:
-        return "Error: GROQ_API_KEY not found in environment variables. Please set it up."
+def _prepare_request(message, conversation_history, language_code):
+    """
+    Build the chat messages for the next reply
     
+    Returns:
+        tuple: (forced response, None) when the next reply is one of the fixed
+        questions or a recommendation made by the loan rules, otherwise
+        (None, messages for the API)
+    """
     # Get language name from code
     language_name = LANGUAGE_CODES.get(language_code, "English")
     
@@ -116,20 +85,19 @@ def get_ai_response(message, conversation_history, language_code):
     
     # Force the correct next question based on conversation state
     forced_response = None
-    if questions_asked == 0:
-        # First interaction - ask about loan purpose
-        forced_response = f"What do you need the loan for?"
-    elif questions_asked == 1:
-        # Second interaction - ask about loan amount
-        forced_response = f"How much money do you need?"
-    elif questions_asked == 2:
-        # Third interaction - ask about monthly income
-        forced_response = f"What is your approximate monthly income?"
+    if questions_asked < len(FORCED_QUESTIONS):
+        forced_response = FORCED_QUESTIONS[questions_asked]
     
     # If we're forcing a specific question, return it immediately
     if forced_response:
-        print(f"FORCING QUESTION #{questions_asked + 1}: {forced_response}")
-        return forced_response
+        logger.debug("Forcing question #%d: %s", questions_asked + 1, forced_response)
+        return forced_response, None
+    
+    # Once all questions are answered, clear answers get a recommendation without the LLM
+    if questions_asked == len(FORCED_QUESTIONS):
+        recommendation = loan_recommender.recommend(extract_answers(conversation_history, message), language_code)
+        if recommendation:
+            return recommendation, None
     
     # Create simple prompt with language instruction
     enhanced_prompt = f"""{SYSTEM_PROMPT}
@@ -137,41 +105,48 @@ def get_ai_response(message, conversation_history, language_code):
 IMPORTANT: You MUST respond in {language_name} only.
 """
     
-    # Debug the conversation history
-    print(f"Conversation history length: {len(conversation_history)}")
-    for i, msg in enumerate(conversation_history):
-        print(f"Message {i}: {msg['role']} - {msg['content'][:30] if len(msg['content']) > 30 else msg['content']}")
+    # Add current message if not already in history
+    history = list(conversation_history)
+    if not history or history[-1]["role"] != "user" or history[-1]["content"] != message:
+        history.append({"role": "user", "content": message})
     
-    # Prepare messages for the API - simple approach
-    messages = [
-        {"role": "system", "content": enhanced_prompt}
-    ]
+    # Keep the prompt within the token budget, however long the conversation has grown
+    messages = context_builder.build(enhanced_prompt, history, len(FORCED_QUESTIONS))
     
-    # Add conversation history
-    for msg in conversation_history:
-        messages.append(msg)
+    return None, messages
+
+def get_ai_response(message, conversation_history, language_code):
+    """
+    Get AI response using GroqCloud
     
-    # Add current message if not already in history
-    if not conversation_history or conversation_history[-1]["role"] != "user" or conversation_history[-1]["content"] != message:
-        messages.append({"role": "user", "content": message})
-        print(f"Added new user message: {message}")
-    else:
-        print("Current message already in history, not adding again.")
+    Raises:
+        LLMUnavailableError: If no model could answer
+    """
+    forced_response, messages = _prepare_request(message, conversation_history, language_code)
+    if forced_response:
+        return forced_response
+    
+    # Call the Groq API with lower temperature for more focused responses
+    return llm_gateway.complete(messages, temperature=0.5, max_tokens=1024)
+
+def stream_ai_response(message, conversation_history, language_code):
+    """
+    Get AI response using GroqCloud, yielding the text as it is generated
+    
+    Args:
+        message: The user's message
+        conversation_history: Messages so far, as for get_ai_response()
+        language_code: ISO language code (e.g., 'hi' for Hindi)
     
-    try:
-        # Choose model based on availability - LLaMA3 preferred, Mixtral as fallback
-        model = "llama3-8b-8192" if os.getenv("USE_LLAMA3", "true").lower() == "true" else "mixtral-8x7b-32768"
-        
-        # Call the Groq API with lower temperature for more focused responses
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=0.5,  # Lower temperature for more focused responses
-            max_tokens=1024,
-        )
-        
-        # Extract and return the response text
-        return response.choices[0].message.content
+    Yields:
+        str: Pieces of the response, in order
+    
+    Raises:
+        LLMUnavailableError: If no model could answer, or the response broke off
+    """
+    forced_response, messages = _prepare_request(message, conversation_history, language_code)
+    if forced_response:
+        yield forced_response
+        return
     
-    except Exception as e:
-        return f"Error communicating with GroqCloud: {str(e)}"
+    yield from llm_gateway.stream(messages, temperature=0.5, max_tokens=1024)
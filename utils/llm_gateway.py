@@ -0,0 +1,299 @@
+import logging
+import os
+import random
+import threading
+import time
+import groq
+import httpx
+from dotenv import load_dotenv
+from utils.metrics import record_stage, timed
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Get API key from environment
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Point the client at another OpenAI-compatible server, e.g. scripts/fake_groq_server.py
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+
+# Models tried in order, the next one is used when a model keeps failing.
+# USE_LLAMA3=false puts Mixtral first when GROQ_MODELS is not set.
+DEFAULT_MODELS = ["llama3-8b-8192", "mixtral-8x7b-32768"]
+if os.getenv("USE_LLAMA3", "true").lower() != "true":
+    DEFAULT_MODELS.reverse()
+GROQ_MODELS = [model.strip() for model in os.getenv("GROQ_MODELS", ",".join(DEFAULT_MODELS)).split(",") if model.strip()]
+
+# Request settings
+# Each attempt may take LLM_TIMEOUT_SECONDS, and all attempts of a call together
+# LLM_DEADLINE_SECONDS (for streams: until the first text arrives)
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "15"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "3"))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+# Retries per model for timeouts, connection errors, 429 and 5xx, with jittered exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.25"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "2"))
+
+# Connection pool settings
+# Connections to the API are kept alive and reused, so a call does not pay for a new TLS handshake
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))
+
+# Circuit breaker settings
+# After this many consecutive failed calls (counted once a call's retries are used up,
+# requests the API refused as invalid do not count) a model is skipped for LLM_BREAKER_RESET_SECONDS,
+# then a single trial call decides whether it is used again
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# Errors worth retrying on the same model
+RETRYABLE_ERRORS = (
+    groq.APITimeoutError,
+    groq.APIConnectionError,
+    groq.RateLimitError,
+    groq.InternalServerError,
+    httpx.TransportError
+)
+
+def _is_client_error(error):
+    """Check whether the API refused the request itself (4xx other than 429)"""
+    status_code = getattr(error, "status_code", None)
+    return status_code is not None and 400 <= status_code < 500 and status_code != 429
+
+class LLMUnavailableError(Exception):
+    """Raised when no model produced a response"""
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        # Seconds until a model may be tried again, when every model's circuit is open
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+    
+    closed: calls go through. open: calls are refused until the reset timeout
+    has passed. half_open: one trial call per reset timeout decides whether
+    the circuit closes again or stays open.
+    """
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURES, reset_timeout=LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+    
+    def allow(self):
+        """Check whether a call may go through, taking the trial slot when half open"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Restart the window so only one trial runs, and another one is
+                # allowed later if this one never reports back
+                self.state = "half_open"
+                self._opened_at = time.monotonic()
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+    
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+    
+    def retry_after(self):
+        """Seconds until a call may be tried again, 0 when closed"""
+        with self._lock:
+            if self.state == "closed":
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+    
+    def get_status(self):
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self._failures}
+
+class LLMGateway:
+    """
+    Chat completions with deadlines, retries, circuit breakers and model failover
+    
+    One Groq client with a pooled keep-alive HTTP client is shared by all
+    requests. A call tries each model in GROQ_MODELS in turn, retrying
+    transient errors with jittered backoff, and skips models whose circuit is
+    open. If no model answers within the deadline LLMUnavailableError is raised.
+    """
+    def __init__(self, api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL, models=GROQ_MODELS,
+                 timeout=LLM_TIMEOUT_SECONDS, deadline=LLM_DEADLINE_SECONDS, max_retries=LLM_MAX_RETRIES):
+        self.api_key = api_key
+        self.models = list(models)
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        
+        self._http = httpx.Client(limits=httpx.Limits(
+            max_connections=LLM_POOL_SIZE,
+            max_keepalive_connections=LLM_POOL_SIZE,
+            keepalive_expiry=LLM_KEEPALIVE_SECONDS
+        ))
+        # Retries are done here, per model, so the SDK's own are turned off
+        self._client = groq.Groq(api_key=api_key, base_url=base_url, max_retries=0, http_client=self._http) if api_key else None
+        
+        self._breakers = {model: CircuitBreaker() for model in self.models}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "retries": 0, "failovers": 0, "failures": 0}
+    
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+    
+    def _backoff(self, attempt, remaining):
+        """Sleep before a retry (full jitter), returns False if the deadline does not allow it"""
+        delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+        if delay >= remaining:
+            return False
+        time.sleep(delay)
+        return True
+    
+    def _call(self, request, deadline):
+        """
+        Run request(model, timeout) against the models in order until one succeeds
+        
+        Args:
+            request: Callable doing one attempt, raising on failure
+            deadline: Seconds all attempts may take together
+        
+        Returns:
+            The result of the first successful attempt
+        """
+        if not self.api_key:
+            raise LLMUnavailableError("GROQ_API_KEY not found in environment variables. Please set it up.")
+        
+        self._count("calls")
+        expires = time.monotonic() + deadline
+        last_error = None
+        
+        for index, model in enumerate(self.models):
+            breaker = self._breakers[model]
+            if index > 0:
+                self._count("failovers")
+                logger.warning("Falling back to model %s after: %s", model, last_error)
+            
+            failed = False
+            expired = False
+            for attempt in range(self.max_retries + 1):
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    expired = True
+                    break
+                
+                if not breaker.allow():
+                    last_error = f"circuit open for {model}"
+                    break
+                
+                timeout = min(self.timeout, remaining)
+                try:
+                    result = request(model, httpx.Timeout(timeout, connect=min(LLM_CONNECT_TIMEOUT_SECONDS, timeout)))
+                except (groq.AuthenticationError, groq.PermissionDeniedError) as e:
+                    # Every model shares the key, trying others cannot help
+                    self._count("failures")
+                    raise LLMUnavailableError(f"GroqCloud rejected the API key: {str(e)}") from e
+                except RETRYABLE_ERRORS as e:
+                    failed = True
+                    last_error = f"{model}: {type(e).__name__}: {str(e)}"
+                    if attempt < self.max_retries and self._backoff(attempt, expires - time.monotonic()):
+                        self._count("retries")
+                        continue
+                    break
+                except groq.APIError as e:
+                    # Rejected by this model (e.g. decommissioned or context too long), try the next.
+                    # A request the API refused says nothing about the model's health
+                    failed = not _is_client_error(e)
+                    last_error = f"{model}: {type(e).__name__}: {str(e)}"
+                    break
+                
+                breaker.record_success()
+                return result
+            
+            # One failure per call once its retries are used up, so a single
+            # slow request cannot open the circuit on its own
+            if failed:
+                breaker.record_failure()
+            if expired:
+                self._count("failures")
+                raise LLMUnavailableError(f"No response within {deadline:.0f}s: {last_error}")
+        
+        self._count("failures")
+        retry_after = min(breaker.retry_after() for breaker in self._breakers.values()) if self._breakers else None
+        raise LLMUnavailableError(f"No model available: {last_error}", retry_after=retry_after or None)
+    
+    def complete(self, messages, deadline=None, **params):
+        """
+        Get a chat completion
+        
+        Args:
+            messages: Chat messages for the API
+            deadline: Seconds the call may take including retries (default LLM_DEADLINE_SECONDS)
+            **params: Completion parameters such as temperature and max_tokens
+        
+        Returns:
+            str: The response text
+        """
+        def request(model, timeout):
+            response = self._client.chat.completions.create(model=model, messages=messages, timeout=timeout, **params)
+            return response.choices[0].message.content
+        
+        with timed("llm_call"):
+            return self._call(request, deadline or self.deadline)
+    
+    def stream(self, messages, deadline=None, **params):
+        """
+        Get a chat completion as it is generated
+        
+        Failures before the first text are retried like complete(); once text
+        has been yielded a failure raises LLMUnavailableError.
+        
+        Yields:
+            str: Pieces of the response, in order
+        """
+        def request(model, timeout):
+            chunks = self._client.chat.completions.create(
+                model=model, messages=messages, stream=True, timeout=timeout, **params
+            )
+            pieces = (chunk.choices[0].delta.content for chunk in chunks
+                      if chunk.choices and chunk.choices[0].delta.content)
+            # Wait for the first piece here, so a failure before any text is retried
+            return model, next(pieces, None), pieces
+        
+        start = time.perf_counter()
+        with timed("llm_first_token"):
+            model, first, pieces = self._call(request, deadline or self.deadline)
+        if first is None:
+            return
+        
+        yield first
+        try:
+            yield from pieces
+        except (groq.APIError, httpx.HTTPError) as e:
+            self._breakers[model].record_failure()
+            self._count("failures")
+            raise LLMUnavailableError(f"Response from {model} was interrupted: {str(e)}") from e
+        # Until the last piece, including the time the caller spent on each one
+        record_stage("llm_stream", time.perf_counter() - start)
+    
+    def get_status(self):
+        """Get the call counters and circuit states for health reporting"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["models"] = {model: breaker.get_status() for model, breaker in self._breakers.items()}
+        return stats
+
+# Create a singleton instance
+llm_gateway = LLMGateway()
@@ -0,0 +1,394 @@
+import logging
+import os
+import re
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Recommend locally after the fixed questions instead of asking the LLM, when
+# the answers clearly point at one loan type
+LOAN_RULES_ENABLED = os.getenv("LOAN_RULES_ENABLED", "true").lower() == "true"
+# Below this confidence (0-1) the recommendation is left to the LLM
+LOAN_RULES_MIN_CONFIDENCE = float(os.getenv("LOAN_RULES_MIN_CONFIDENCE", "0.7"))
+
+# Define loan types and their typical interest rates
+LOAN_TYPES = {
+    "crop_loan": {
+        "name": "Crop Loan",
+        "interest_rate": "6.5%",
+        "eligibility": "Farmers with land ownership documents",
+        "purpose": "For seasonal agricultural operations"
+    },
+    "kisan_credit_card": {
+        "name": "Kisan Credit Card (KCC)",
+        "interest_rate": "7.0%",
+        "eligibility": "All farmers with land records",
+        "purpose": "For cultivation expenses and allied agricultural activities"
+    },
+    "dairy_loan": {
+        "name": "Dairy Loan",
+        "interest_rate": "8.5%",
+        "eligibility": "Farmers engaged in dairy farming",
+        "purpose": "For purchase of milch animals and dairy equipment"
+    },
+    "farm_mechanization_loan": {
+        "name": "Farm Mechanization Loan",
+        "interest_rate": "9.0%",
+        "eligibility": "Farmers with regular income",
+        "purpose": "For purchase of tractors and farm equipment"
+    },
+    "self_help_group_loan": {
+        "name": "Self Help Group (SHG) Loan",
+        "interest_rate": "10.0%",
+        "eligibility": "Members of registered SHGs",
+        "purpose": "For group-based income generation activities"
+    },
+    "microfinance_loan": {
+        "name": "Microfinance Loan",
+        "interest_rate": "12.0%",
+        "eligibility": "Low-income individuals",
+        "purpose": "For small business and income generation"
+    }
+}
+
+# Words in the answer to "What do you need the loan for?" that point at each loan
+# type, in English (also romanized Hindi) and the supported Indian languages.
+# Matched case-insensitively as word prefixes, so inflected forms count too;
+# words in WHOLE_WORD_KEYWORDS only match on their own.
+PURPOSE_KEYWORDS = {
+    "crop_loan": [
+        "crop", "seed", "sowing", "fertiliser", "fertilizer", "pesticide", "harvest", "paddy", "wheat",
+        "rice", "cotton", "sugarcane", "kharif", "rabi", "fasal", "beej", "khad",
+        "फसल", "बीज", "बुवाई", "खाद", "गेहूं", "गेहूँ", "धान", "कपास", "गन्ना",
+        "ফসল", "বীজ", "ধান", "পাট",
+        "பயிர்", "விதை", "உரம்", "நெல்", "கரும்பு",
+        "పంట", "విత్తన", "ఎరువు", "వరి", "పత్తి",
+        "पीक", "बियाणे", "खत", "ऊस",
+        "પાક", "બીજ", "ખાતર", "કપાસ",
+        "ಬೆಳೆ", "ಬೀಜ", "ಗೊಬ್ಬರ", "ಭತ್ತ", "ಕಬ್ಬು",
+        "വിള", "വിത്ത്", "വളം", "നെല്ല്",
+        "ਫ਼ਸਲ", "ਫਸਲ", "ਬੀਜ", "ਖਾਦ", "ਕਣਕ", "ਝੋਨਾ"
+    ],
+    "kisan_credit_card": [
+        "kisan credit", "kcc", "credit card",
+        "किसान क्रेडिट", "क्रेडिट कार्ड",
+        "কিষাণ ক্রেডিট", "ক্রেডিট কার্ড",
+        "கிசான் கிரெடிட்", "கிரெடிட் கார்டு",
+        "కిసాన్ క్రెడిట్", "క్రెడిట్ కార్డ్",
+        "કિસાન ક્રેડિટ", "ક્રેડિટ કાર્ડ",
+        "ಕಿಸಾನ್ ಕ್ರೆಡಿಟ್", "ಕ್ರೆಡಿಟ್ ಕಾರ್ಡ್",
+        "കിസാൻ ക്രെഡിറ്റ്", "ക്രെഡിറ്റ് കാർഡ്",
+        "ਕਿਸਾਨ ਕ੍ਰੈਡਿਟ", "ਕ੍ਰੈਡਿਟ ਕਾਰਡ"
+    ],
+    "dairy_loan": [
+        "dairy", "cow", "buffalo", "cattle", "milk", "milch", "goat", "gai", "bhains", "doodh",
+        "डेयरी", "गाय", "गायें", "गायों", "भैंस", "दूध", "पशु", "बकरी",
+        "ডেয়ারি", "গরু", "মহিষ", "দুধ", "ছাগল",
+        "பால்", "பசு", "மாடு", "எருமை", "ஆடு",
+        "పాడి", "ఆవు", "గేదె", "పాలు", "మేక",
+        "म्हैस", "दुग्ध", "शेळी",
+        "ડેરી", "ગાય", "ભેંસ", "દૂધ", "પશુ",
+        "ಹೈನು", "ಹಸು", "ಎಮ್ಮೆ", "ಹಾಲು", "ಮೇಕೆ",
+        "ക്ഷീര", "പശു", "എരുമ", "പാൽ", "ആട്",
+        "ਡੇਅਰੀ", "ਗਾਂ", "ਮੱਝ", "ਦੁੱਧ", "ਪਸ਼ੂ"
+    ],
+    "farm_mechanization_loan": [
+        "tractor", "harvester", "thresher", "tiller", "machine", "equipment", "pump", "implement",
+        "ट्रैक्टर", "ट्रेक्टर", "मशीन", "उपकरण", "पंप", "थ्रेशर",
+        "ট্রাক্টর", "যন্ত্র", "মেশিন", "পাম্প",
+        "டிராக்டர்", "இயந்திர", "பம்ப்",
+        "ట్రాక్టర్", "యంత్ర", "పంపు",
+        "ट्रॅक्टर", "यंत्र",
+        "ટ્રેક્ટર", "મશીન", "સાધન", "પંપ",
+        "ಟ್ರ್ಯಾಕ್ಟರ್", "ಟ್ರಾಕ್ಟರ್", "ಯಂತ್ರ", "ಪಂಪ್",
+        "ട്രാക്ടർ", "യന്ത്ര", "പമ്പ്",
+        "ਟਰੈਕਟਰ", "ਟ੍ਰੈਕਟਰ", "ਮਸ਼ੀਨ", "ਪੰਪ"
+    ],
+    "self_help_group_loan": [
+        "self help", "self-help", "shg", "women's group", "womens group", "mahila group", "sangha",
+        "स्वयं सहायता", "समूह", "बचत गट",
+        "স্বনির্ভর", "গোষ্ঠী",
+        "சுய உதவி", "குழு",
+        "స్వయం సహాయక", "సంఘం",
+        "સ્વસહાય", "સ્વ-સહાય", "જૂથ",
+        "ಸ್ವಸಹಾಯ", "ಸ್ವ ಸಹಾಯ", "ಸಂಘ",
+        "കുടുംബശ്രീ", "സ്വയം സഹായ",
+        "ਸਵੈ ਸਹਾਇਤਾ", "ਸਵੈ-ਸਹਾਇਤਾ", "ਸਮੂਹ"
+    ],
+    "microfinance_loan": [
+        "shop", "business", "store", "stall", "tailoring", "trade", "vendor", "dukan", "vyapar", "dhandha",
+        "दुकान", "व्यापार", "व्यवसाय", "धंधा", "सिलाई", "कारोबार",
+        "দোকান", "ব্যবসা",
+        "கடை", "வியாபார", "தொழில்",
+        "దుకాణ", "వ్యాపార",
+        "धंदा",
+        "દુકાન", "વ્યવસાય", "ધંધો", "વેપાર",
+        "ಅಂಗಡಿ", "ವ್ಯಾಪಾರ",
+        "ബിസിനസ്", "വ്യാപാര",
+        "ਦੁਕਾਨ", "ਕਾਰੋਬਾਰ", "ਵਪਾਰ"
+    ]
+}
+
+# General farming words, which mean a Kisan Credit Card for cultivation expenses
+# when nothing more specific (seeds, a tractor, cows) was mentioned
+GENERAL_FARMING_KEYWORDS = [
+    "cultivation", "farming", "farm", "farms", "agriculture", "kheti", "kisani",
+    "खेती", "कृषि", "किसानी",
+    "চাষ", "কৃষি",
+    "விவசாய",
+    "వ్యవసాయ", "సాగు",
+    "शेती",
+    "ખેતી", "કૃષિ",
+    "ಕೃಷಿ", "ಬೇಸಾಯ",
+    "കൃഷി",
+    "ਖੇਤੀ"
+]
+
+# Short keywords that begin too many unrelated words ("गाय" starts "गायब", missing,
+# and "farm" starts "farmer", who may want the loan for anything)
+WHOLE_WORD_KEYWORDS = {"gai", "गाय", "गायें", "गायों", "farm"}
+
+# Characters that continue a word. \w misses the vowel signs and viramas of the
+# Indic scripts, so after "ि" a keyword would look like the start of a word; these
+# are the Devanagari to Sinhala blocks (U+0900-U+0DFF) without the dandas that end
+# sentences, and the zero-width (non-)joiners used inside words
+WORD_CHARS = r"\w\u0900-\u0963\u0966-\u0DFF\u200c\u200d"
+
+# Microfinance is for small amounts, a larger request needs a closer look
+MICROFINANCE_MAX_AMOUNT = 300000
+
+# Multipliers for amounts said with units, e.g. "5 lakh"
+AMOUNT_UNITS = {
+    1000: ["thousand", "hazar", "hajar", "हजार", "हज़ार", "হাজার", "ஆயிரம்", "వేల", "వేయి",
+           "હજાર", "ಸಾವಿರ", "ആയിരം", "ਹਜ਼ਾਰ", "ਹਜਾਰ"],
+    100000: ["lakh", "lakhs", "lac", "lacs", "लाख", "লাখ", "লক্ষ", "லட்சம்", "லட்ச", "లక్ష", "લાખ",
+             "ಲಕ್ಷ", "ലക്ഷം", "ਲੱਖ"],
+    10000000: ["crore", "crores", "करोड़", "करोड", "कोटी", "কোটি", "கோடி", "కోటి", "કરોડ", "ಕೋಟಿ",
+               "കോടി", "ਕਰੋੜ"]
+}
+
+# Numbers said as words, for the languages Whisper most often spells them out in
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "fifteen": 15, "twenty": 20, "twenty five": 25, "thirty": 30,
+    "forty": 40, "fifty": 50, "hundred": 100,
+    "एक": 1, "दो": 2, "तीन": 3, "चार": 4, "पांच": 5, "पाँच": 5, "छह": 6, "छः": 6, "सात": 7,
+    "आठ": 8, "नौ": 9, "दस": 10, "पंद्रह": 15, "बीस": 20, "पच्चीस": 25, "तीस": 30,
+    "चालीस": 40, "पचास": 50, "सौ": 100
+}
+
+# Recommendation sentence per language; {loan} is the localized loan name and {rate} its interest rate
+TEMPLATES = {
+    "en": "Based on your needs, I recommend a {loan} with {rate} interest. "
+          "Visit your local bank with ID and income proof to apply.",
+    "hi": "आपकी ज़रूरतों के आधार पर, मैं {rate} ब्याज वाले {loan} की सलाह देता हूँ। "
+          "आवेदन करने के लिए पहचान पत्र और आय प्रमाण के साथ अपने नज़दीकी बैंक जाएँ।",
+    "bn": "আপনার প্রয়োজন অনুযায়ী, আমি {rate} সুদে {loan} নেওয়ার পরামর্শ দিচ্ছি। "
+          "আবেদন করতে পরিচয়পত্র ও আয়ের প্রমাণ নিয়ে আপনার কাছের ব্যাংকে যান।",
+    "ta": "உங்கள் தேவைகளின் அடிப்படையில், {rate} வட்டியில் {loan} பரிந்துரைக்கிறேன். "
+          "விண்ணப்பிக்க அடையாள அட்டை மற்றும் வருமானச் சான்றுடன் அருகிலுள்ள வங்கிக்குச் செல்லுங்கள்.",
+    "te": "మీ అవసరాల ఆధారంగా, {rate} వడ్డీతో {loan} తీసుకోవాలని సూచిస్తున్నాను. "
+          "దరఖాస్తు చేయడానికి గుర్తింపు కార్డు మరియు ఆదాయ రుజువుతో మీ దగ్గరలోని బ్యాంకుకు వెళ్లండి.",
+    "mr": "तुमच्या गरजांनुसार, मी {rate} व्याजदराचे {loan} सुचवतो. "
+          "अर्ज करण्यासाठी ओळखपत्र आणि उत्पन्नाच्या पुराव्यासह जवळच्या बँकेत जा.",
+    "gu": "તમારી જરૂરિયાતો મુજબ, હું {rate} વ્યાજવાળી {loan}ની ભલામણ કરું છું. "
+          "અરજી કરવા માટે ઓળખપત્ર અને આવકના પુરાવા સાથે નજીકની બેંકમાં જાઓ.",
+    "kn": "ನಿಮ್ಮ ಅಗತ್ಯಗಳ ಆಧಾರದ ಮೇಲೆ, {rate} ಬಡ್ಡಿಯ {loan} ಅನ್ನು ಶಿಫಾರಸು ಮಾಡುತ್ತೇನೆ. "
+          "ಅರ್ಜಿ ಸಲ್ಲಿಸಲು ಗುರುತಿನ ಚೀಟಿ ಮತ್ತು ಆದಾಯ ಪುರಾವೆಯೊಂದಿಗೆ ಹತ್ತಿರದ ಬ್ಯಾಂಕಿಗೆ ಭೇಟಿ ನೀಡಿ.",
+    "ml": "നിങ്ങളുടെ ആവശ്യങ്ങൾ അനുസരിച്ച്, {rate} പലിശയുള്ള {loan} ഞാൻ ശുപാർശ ചെയ്യുന്നു. "
+          "അപേക്ഷിക്കാൻ തിരിച്ചറിയൽ രേഖയും വരുമാന സാക്ഷ്യപത്രവുമായി അടുത്തുള്ള ബാങ്ക് സന്ദർശിക്കുക.",
+    "pa": "ਤੁਹਾਡੀਆਂ ਲੋੜਾਂ ਦੇ ਆਧਾਰ 'ਤੇ, ਮੈਂ {rate} ਵਿਆਜ ਵਾਲੇ {loan} ਦੀ ਸਿਫ਼ਾਰਸ਼ ਕਰਦਾ ਹਾਂ। "
+          "ਅਰਜ਼ੀ ਦੇਣ ਲਈ ਪਛਾਣ ਪੱਤਰ ਅਤੇ ਆਮਦਨ ਦੇ ਸਬੂਤ ਨਾਲ ਆਪਣੇ ਨੇੜਲੇ ਬੈਂਕ ਜਾਓ।"
+}
+
+# Loan names per language, English ones come from LOAN_TYPES
+LOAN_NAMES = {
+    "hi": {"crop_loan": "फसल ऋण", "kisan_credit_card": "किसान क्रेडिट कार्ड", "dairy_loan": "डेयरी ऋण",
+           "farm_mechanization_loan": "कृषि यंत्रीकरण ऋण", "self_help_group_loan": "स्वयं सहायता समूह ऋण",
+           "microfinance_loan": "माइक्रोफाइनेंस ऋण"},
+    "bn": {"crop_loan": "শস্য ঋণ", "kisan_credit_card": "কিষাণ ক্রেডিট কার্ড", "dairy_loan": "দুগ্ধ খামার ঋণ",
+           "farm_mechanization_loan": "কৃষি যন্ত্রপাতি ঋণ", "self_help_group_loan": "স্বনির্ভর গোষ্ঠী ঋণ",
+           "microfinance_loan": "ক্ষুদ্রঋণ"},
+    "ta": {"crop_loan": "பயிர்க் கடன்", "kisan_credit_card": "கிசான் கிரெடிட் கார்டு", "dairy_loan": "பால்பண்ணைக் கடன்",
+           "farm_mechanization_loan": "பண்ணை இயந்திரமயமாக்கல் கடன்", "self_help_group_loan": "சுய உதவிக் குழுக் கடன்",
+           "microfinance_loan": "நுண்கடன்"},
+    "te": {"crop_loan": "పంట రుణం", "kisan_credit_card": "కిసాన్ క్రెడిట్ కార్డ్", "dairy_loan": "పాడి రుణం",
+           "farm_mechanization_loan": "వ్యవసాయ యాంత్రీకరణ రుణం", "self_help_group_loan": "స్వయం సహాయక సంఘం రుణం",
+           "microfinance_loan": "సూక్ష్మ రుణం"},
+    "mr": {"crop_loan": "पीक कर्ज", "kisan_credit_card": "किसान क्रेडिट कार्ड", "dairy_loan": "दुग्ध व्यवसाय कर्ज",
+           "farm_mechanization_loan": "कृषी यांत्रिकीकरण कर्ज", "self_help_group_loan": "बचत गट कर्ज",
+           "microfinance_loan": "सूक्ष्म वित्त कर्ज"},
+    "gu": {"crop_loan": "પાક લોન", "kisan_credit_card": "કિસાન ક્રેડિટ કાર્ડ", "dairy_loan": "ડેરી લોન",
+           "farm_mechanization_loan": "કૃષિ યાંત્રિકીકરણ લોન", "self_help_group_loan": "સ્વસહાય જૂથ લોન",
+           "microfinance_loan": "માઇક્રોફાઇનાન્સ લોન"},
+    "kn": {"crop_loan": "ಬೆಳೆ ಸಾಲ", "kisan_credit_card": "ಕಿಸಾನ್ ಕ್ರೆಡಿಟ್ ಕಾರ್ಡ್", "dairy_loan": "ಹೈನುಗಾರಿಕೆ ಸಾಲ",
+           "farm_mechanization_loan": "ಕೃಷಿ ಯಾಂತ್ರೀಕರಣ ಸಾಲ", "self_help_group_loan": "ಸ್ವಸಹಾಯ ಸಂಘದ ಸಾಲ",
+           "microfinance_loan": "ಕಿರುಸಾಲ"},
+    "ml": {"crop_loan": "വിള വായ്പ", "kisan_credit_card": "കിസാൻ ക്രെഡിറ്റ് കാർഡ്", "dairy_loan": "ക്ഷീര വായ്പ",
+           "farm_mechanization_loan": "കാർഷിക യന്ത്രവൽക്കരണ വായ്പ", "self_help_group_loan": "സ്വയം സഹായ സംഘ വായ്പ",
+           "microfinance_loan": "മൈക്രോഫിനാൻസ് വായ്പ"},
+    "pa": {"crop_loan": "ਫ਼ਸਲੀ ਕਰਜ਼ਾ", "kisan_credit_card": "ਕਿਸਾਨ ਕ੍ਰੈਡਿਟ ਕਾਰਡ", "dairy_loan": "ਡੇਅਰੀ ਕਰਜ਼ਾ",
+           "farm_mechanization_loan": "ਖੇਤੀ ਮਸ਼ੀਨੀਕਰਨ ਕਰਜ਼ਾ", "self_help_group_loan": "ਸਵੈ-ਸਹਾਇਤਾ ਸਮੂਹ ਕਰਜ਼ਾ",
+           "microfinance_loan": "ਮਾਈਕ੍ਰੋਫਾਈਨੈਂਸ ਕਰਜ਼ਾ"}
+}
+
+def _keyword_pattern(keywords):
+    """Regex matching any keyword at the start of a word, or as a whole word if it is in WHOLE_WORD_KEYWORDS"""
+    alternatives = [
+        re.escape(keyword) + (rf"(?![{WORD_CHARS}])" if keyword in WHOLE_WORD_KEYWORDS else "")
+        for keyword in sorted(keywords, key=len, reverse=True)
+    ]
+    return re.compile(rf"(?<![{WORD_CHARS}])(?:" + "|".join(alternatives) + ")", re.IGNORECASE)
+
+PURPOSE_PATTERNS = {loan_type: _keyword_pattern(keywords) for loan_type, keywords in PURPOSE_KEYWORDS.items()}
+GENERAL_FARMING_PATTERN = _keyword_pattern(GENERAL_FARMING_KEYWORDS)
+
+# A number (in any script's digits, with Indian or Western grouping) or number
+# word, optionally followed by a unit
+_UNIT_MULTIPLIERS = {unit: multiplier for multiplier, units in AMOUNT_UNITS.items() for unit in units}
+AMOUNT_PATTERN = re.compile(
+    rf"(?<![{WORD_CHARS}])(\d[\d,]*(?:\.\d+)?|" + "|".join(sorted(map(re.escape, NUMBER_WORDS), key=len, reverse=True)) + r")"
+    r"\s*(" + "|".join(sorted(map(re.escape, _UNIT_MULTIPLIERS), key=len, reverse=True)) + rf")?(?![{WORD_CHARS}])",
+    re.IGNORECASE
+)
+
+def parse_amount(text):
+    """
+    Find the largest rupee amount mentioned in text
+    
+    Handles digits in any script ("५०००"), grouping ("5,00,000"), units
+    ("5 lakh", "2.5 लाख", "20 हज़ार") and simple number words ("पांच लाख").
+    
+    Returns:
+        float: The amount, or None if there is none
+    """
+    amounts = []
+    for number, unit in AMOUNT_PATTERN.findall(unicodedata.normalize("NFC", text)):
+        if number.lower() in NUMBER_WORDS:
+            # A number word alone is too ambiguous ("one" cow), only count it with a unit
+            if not unit:
+                continue
+            value = NUMBER_WORDS[number.lower()]
+        else:
+            # float() understands digits of every script
+            try:
+                value = float(number.replace(",", ""))
+            except ValueError:
+                continue
+        amounts.append(value * _UNIT_MULTIPLIERS.get(unit.lower(), 1) if unit else value)
+    return max(amounts) if amounts else None
+
+def extract_answers(conversation_history, message):
+    """
+    Get the user's answers to the fixed questions
+    
+    Args:
+        conversation_history: Messages as from get_conversation_for_ai()
+        message: The current user message, added if it is not in the history yet
+    
+    Returns:
+        list: One answer per question asked, each the user's messages after it joined
+    """
+    answers = []
+    for msg in conversation_history:
+        if msg["role"] == "assistant":
+            answers.append([])
+        elif answers:
+            answers[-1].append(msg["content"])
+    
+    if answers and (not answers[-1] or answers[-1][-1] != message):
+        answers[-1].append(message)
+    return [" ".join(parts) for parts in answers]
+
+class LoanRecommender:
+    """
+    Rule-based loan recommendation from the answers to the fixed questions
+    
+    The purpose answer is matched against keywords for each loan type and the
+    amount and income answers are parsed for numbers. When the purpose points
+    clearly at one loan type and the numbers could be read, the recommendation
+    is rendered from a template in the user's language; otherwise recommend()
+    returns None and the LLM decides.
+    """
+    def __init__(self, enabled=LOAN_RULES_ENABLED, min_confidence=LOAN_RULES_MIN_CONFIDENCE):
+        self.enabled = enabled
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self._stats = {"local": 0, "fallback": 0}
+    
+    def classify(self, purpose, amount_answer, income_answer):
+        """
+        Pick the loan type for a set of answers
+        
+        Returns:
+            tuple: (loan type key or None, confidence between 0 and 1)
+        """
+        scores = {loan_type: len(pattern.findall(purpose)) for loan_type, pattern in PURPOSE_PATTERNS.items()}
+        # A specific need (seeds, a tractor, cows) wins over the credit card words it ties with
+        if scores["kisan_credit_card"] and scores["kisan_credit_card"] == max(
+                score for loan_type, score in scores.items() if loan_type != "kisan_credit_card"):
+            scores["kisan_credit_card"] = 0
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (loan_type, best), (_, runner_up) = ranked[0], ranked[1]
+        
+        if best:
+            purpose_confidence = (best - runner_up) / best
+        elif GENERAL_FARMING_PATTERN.search(purpose):
+            # Farming in general, without a specific need, is what the credit card is for
+            loan_type, purpose_confidence = "kisan_credit_card", 1.0
+        else:
+            return None, 0.0
+        
+        amount = parse_amount(amount_answer)
+        income = parse_amount(income_answer)
+        
+        # Purpose counts for most of the confidence, each number read for the rest
+        confidence = 0.6 * purpose_confidence + 0.2 * (amount is not None) + 0.2 * (income is not None)
+        
+        # Larger amounts than microfinance lends need a closer look
+        if loan_type == "microfinance_loan" and amount and amount > MICROFINANCE_MAX_AMOUNT:
+            confidence -= 0.4
+        
+        return loan_type, round(max(0.0, min(1.0, confidence)), 2)
+    
+    def render(self, loan_type, language_code):
+        """Recommendation text for a loan type in a language"""
+        loan = LOAN_TYPES[loan_type]
+        name = LOAN_NAMES.get(language_code, {}).get(loan_type, loan["name"])
+        return TEMPLATES.get(language_code, TEMPLATES["en"]).format(loan=name, rate=loan["interest_rate"])
+    
+    def all_texts(self, language_code):
+        """Every recommendation text in a language, for rendering speech ahead of time"""
+        return [self.render(loan_type, language_code) for loan_type in LOAN_TYPES]
+    
+    def recommend(self, answers, language_code):
+        """
+        Recommend a loan without the LLM when the answers are clear enough
+        
+        Args:
+            answers: Answers to the purpose, amount and income questions
+            language_code: ISO language code (e.g., 'hi' for Hindi)
+        
+        Returns:
+            str: The recommendation, or None to leave it to the LLM
+        """
+        if not self.enabled or len(answers) < 3:
+            return None
+        
+        loan_type, confidence = self.classify(*answers[:3])
+        local = loan_type is not None and confidence >= self.min_confidence
+        with self._lock:
+            self._stats["local" if local else "fallback"] += 1
+        
+        logger.info("Loan rules picked %s with confidence %s, %s",
+                    loan_type, confidence, "answering locally" if local else "asking the LLM")
+        return self.render(loan_type, language_code) if local else None
+    
+    def get_status(self):
+        """Get the local and fallback counts for health reporting"""
+        with self._lock:
+            return dict(self._stats, enabled=self.enabled, min_confidence=self.min_confidence)
+
+# Create a singleton instance
+loan_recommender = LoanRecommender()
@@ -0,0 +1,180 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context
+
+# Prefix of every metric name
+METRICS_PREFIX = "smart_loan_helper"
+
+# Add a Server-Timing header with the time each stage took to every response,
+# so it shows up in the browser's network panel
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+
+# Histogram buckets in seconds, from a cached DB read to a slow transcription
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter with labels, in the Prometheus data model"""
+    kind = "counter"
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def samples(self):
+        """Yield (name, labels, value) for the text exposition format"""
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+class Histogram:
+    """Cumulative histogram with labels, in the Prometheus data model"""
+    kind = "histogram"
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # labels -> [per-bucket counts, sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+    
+    def samples(self):
+        """Yield (name, labels, value) for the text exposition format"""
+        with self._lock:
+            values = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        for key, (counts, total, count) in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+class MetricsRegistry:
+    """
+    Process-wide metrics, rendered in the Prometheus text format
+    
+    Metrics live in the process that serves requests; work done in the
+    transcription worker processes is measured from the calling side.
+    """
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self._metrics = []
+        self._lock = threading.Lock()
+    
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+    
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(f"{self.prefix}_{name}", documentation, labelnames))
+    
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(f"{self.prefix}_{name}", documentation, labelnames, buckets))
+    
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics)
+        
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# Create a singleton instance
+metrics = MetricsRegistry()
+
+STAGE_SECONDS = metrics.histogram(
+    "stage_duration_seconds",
+    "Time spent in each stage of handling a request",
+    ["stage"]
+)
+STAGE_ERRORS = metrics.counter(
+    "stage_errors_total",
+    "Stages that ended with an exception",
+    ["stage"]
+)
+REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds",
+    "Time to produce each response, until the body starts for streamed responses",
+    ["endpoint", "method", "status"]
+)
+
+def record_stage(stage, seconds):
+    """
+    Record the time a stage took
+    
+    Args:
+        stage: Stage name, e.g. 'llm_call'
+        seconds: Duration in seconds
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    
+    # Add it to the current request's Server-Timing, if there is one on this thread
+    if SERVER_TIMING and has_request_context():
+        timings = g.setdefault("server_timing", {})
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+@contextmanager
+def timed(stage):
+    """Time the block as a stage, counting it as an error if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        # A generator closed early is not an error
+        if not isinstance(e, GeneratorExit):
+            STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+def server_timing_header():
+    """Server-Timing value for the stages of the current request, or None if there were none"""
+    timings = g.get("server_timing")
+    if not timings:
+        return None
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
@@ -0,0 +1,57 @@
+import os
+import re
+
+# Sentence boundaries: ., !, ? and the Devanagari danda, with any closing quotes
+# or brackets, followed by whitespace (so "9.0%" is not split), or a line break
+SENTENCE_END = re.compile(r"[.!?।॥]+[\"')\]]*(?=\s)|\n+")
+
+# Shorter fragments are joined to the next sentence so speech is not synthesized
+# for a few characters at a time
+STREAM_MIN_SENTENCE_CHARS = int(os.getenv("STREAM_MIN_SENTENCE_CHARS", "20"))
+
+class SentenceSplitter:
+    """
+    Split streamed text into complete sentences as soon as each one ends
+    
+    Usage:
+        splitter = SentenceSplitter()
+        for piece in pieces:
+            for sentence in splitter.feed(piece):
+                ...
+        for sentence in splitter.flush():
+            ...
+    """
+    def __init__(self, min_chars=STREAM_MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self._buffer = ""
+    
+    def feed(self, text):
+        """
+        Add text and take the sentences it completes
+        
+        Returns:
+            list: Complete sentences, in order
+        """
+        self._buffer += text
+        
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self._buffer):
+            sentence = self._buffer[start:match.end()].strip()
+            if len(sentence) >= self.min_chars:
+                sentences.append(sentence)
+                start = match.end()
+        
+        self._buffer = self._buffer[start:]
+        return sentences
+    
+    def flush(self):
+        """
+        Take whatever is left once the text is complete
+        
+        Returns:
+            list: The last sentence, or nothing
+        """
+        sentence = self._buffer.strip()
+        self._buffer = ""
+        return [sentence] if sentence else []
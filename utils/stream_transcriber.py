@@ -0,0 +1,362 @@
+import os
+import threading
+import time
+import uuid
+import numpy as np
+from faster_whisper.vad import get_speech_timestamps
+from utils.audio_preprocessor import VAD_FILTER, VAD_OPTIONS, VAD_MIN_SILENCE_MS, SAMPLING_RATE
+from utils.transcription_service import transcription_service
+from utils.transcription_cache import transcription_cache
+from utils.db_manager import db_manager
+
+# Streaming transcription settings
+# Audio is made final at the first pause after it; without a pause, once this much
+# is waiting it is made final anyway. Each chunk decodes all audio since the last
+# pause again for its partial text, so this bounds the decoder work per chunk:
+# during 15s of speech without a pause the last chunks each decode close to 15s
+STREAM_WINDOW_SECONDS = float(os.getenv("STREAM_WINDOW_SECONDS", "15"))
+# Streams that receive no chunk for this long are dropped
+STREAM_IDLE_TIMEOUT = float(os.getenv("STREAM_IDLE_TIMEOUT", "120"))
+# Most streams open at once, each holds its audio in memory
+STREAM_MAX_SESSIONS = int(os.getenv("STREAM_MAX_SESSIONS", "32"))
+# Most audio a single stream may receive (16 kHz 16-bit PCM is about 1.9 MB a minute)
+STREAM_MAX_MB = float(os.getenv("STREAM_MAX_MB", "25"))
+# Streams live in the memory of the process that opened them, so with several
+# app processes their chunks must reach that one; keep them in SQLite instead
+# and any process can take the next chunk
+STREAM_PERSIST = os.getenv("STREAM_PERSIST", "false").lower() == "true"
+# A persisted stream is held by the request handling its chunk for at most this
+# long, and the next chunk waits up to STREAM_CLAIM_WAIT_SECONDS for it
+STREAM_CLAIM_SECONDS = 60
+STREAM_CLAIM_WAIT_SECONDS = 10
+STREAM_CLAIM_POLL_SECONDS = 0.05
+
+# Durations reported back from preprocess_audio()
+AUDIO_STATS = ("audio_duration", "speech_duration", "skipped_duration", "truncated_duration")
+
+class StreamNotFoundError(Exception):
+    """The stream does not exist, expired, or belongs to another user"""
+
+class StreamLimitError(Exception):
+    """Too many open streams, or a stream grew past its size limit"""
+
+class StreamBusyError(Exception):
+    """Another request is still handling a chunk of the stream"""
+
+class TranscriptionStream:
+    """
+    Audio received so far for one recording, and the segments already final
+    
+    Clients send 16 kHz mono 16-bit little-endian PCM, so each chunk is
+    converted on its own and nothing already received is decoded again. Only
+    the audio since the last pause is kept, and it is transcribed again for
+    each chunk until the next pause makes it final.
+    """
+    def __init__(self, stream_id, user_id, language, window_seconds=STREAM_WINDOW_SECONDS):
+        self.stream_id = stream_id
+        self.user_id = user_id
+        self.language = language
+        self.detected_language = None
+        self.window = int(window_seconds * SAMPLING_RATE)
+        self.received = 0
+        # Samples not final yet, and the number of samples before them
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.offset = 0
+        # Odd byte left over from the last chunk
+        self._carry = b""
+        self.segments = []
+        self.partial = ""
+        self.last_active = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def _append(self, chunk):
+        """Convert a chunk of PCM to float32 samples and add them to the pending audio"""
+        data = self._carry + bytes(chunk)
+        usable = len(data) - len(data) % 2
+        self._carry = data[usable:]
+        if usable:
+            samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+            self.pending = np.concatenate((self.pending, samples))
+    
+    def _speech(self):
+        """Speech regions of the pending audio, in samples"""
+        if not len(self.pending):
+            return []
+        if VAD_FILTER:
+            return get_speech_timestamps(self.pending, VAD_OPTIONS)
+        return [{"start": 0, "end": len(self.pending)}]
+    
+    def _pause(self, speech):
+        """Samples of pending audio that will not change anymore, up to the last pause"""
+        if len(self.pending) >= self.window:
+            return len(self.pending)
+        
+        silence = int(VAD_MIN_SILENCE_MS * SAMPLING_RATE / 1000)
+        if not speech:
+            # Nothing said yet, drop the silence but keep enough to catch speech that just started
+            return max(0, len(self.pending) - silence)
+        
+        # Regions are split at pauses, the last one is over once a pause follows it
+        ends = [
+            region["end"] for index, region in enumerate(speech)
+            if index + 1 < len(speech) or len(self.pending) - region["end"] >= silence
+        ]
+        return ends[-1] if ends else 0
+    
+    def _transcribe(self, samples, cache=False):
+        """
+        Transcribe samples through the transcription service
+        
+        Args:
+            samples: 16 kHz mono float32 samples
+            cache: Whether to use the transcription cache, only worth it for final segments
+        
+        Returns:
+            str: Transcription text
+        """
+        language = self.language or self.detected_language
+        cache_key = transcription_cache.key(samples.tobytes(), language) if cache and transcription_cache.enabled else None
+        cached = transcription_cache.get(cache_key) if cache_key else None
+        
+        if cached:
+            text, detected_language, _ = cached
+        else:
+            stats = {}
+            text, detected_language = transcription_service.transcribe(samples, language, stats=stats)
+            if cache_key:
+                transcription_cache.put(cache_key, text, detected_language,
+                                        {key: stats.get(key, 0.0) for key in AUDIO_STATS})
+        
+        if text:
+            # Keep the language of the first speech for the rest of the stream
+            self.detected_language = self.detected_language or detected_language
+        return text
+    
+    def _commit(self, end, speech):
+        """
+        Make the first end samples of the pending audio final
+        
+        Yields:
+            dict: The 'final' segment, unless it had no speech
+        """
+        samples, self.pending = self.pending[:end], self.pending[end:]
+        start = self.offset / SAMPLING_RATE
+        self.offset += end
+        
+        if not speech:
+            return
+        
+        text = self._transcribe(samples, cache=True)
+        if text:
+            self.segments.append(text)
+            yield {"type": "final", "text": text, "start": round(start, 2), "end": round(self.offset / SAMPLING_RATE, 2)}
+    
+    def feed(self, chunk, final=False):
+        """
+        Add a chunk and transcribe the audio that is not final yet
+        
+        Args:
+            chunk: Next bytes of the recording's PCM
+            final: Whether the recording ended, which makes all pending audio final
+        
+        Yields:
+            dict: A 'final' segment when a pause ends one, then the current 'partial' text
+        """
+        self.received += len(chunk)
+        self.last_active = time.monotonic()
+        self._append(chunk)
+        
+        speech = self._speech()
+        end = len(self.pending) if final else self._pause(speech)
+        if end:
+            yield from self._commit(end, any(region["start"] < end for region in speech))
+            speech = [region for region in speech if region["end"] > end]
+        
+        if final:
+            self.partial = ""
+            return
+        
+        # Silence since the last pause needs no decoder pass
+        self.partial = self._transcribe(self.pending) if speech else ""
+        yield {"type": "partial", "text": self.partial}
+    
+    @property
+    def text(self):
+        return " ".join(self.segments)
+    
+    def to_state(self):
+        """
+        The stream as it is stored between chunks
+        
+        Returns:
+            tuple: (state dict, pending audio as 16-bit PCM bytes)
+        """
+        state = {
+            "language": self.language,
+            "detected_language": self.detected_language,
+            "received": self.received,
+            "offset": self.offset,
+            "carry": self._carry.hex(),
+            "segments": self.segments
+        }
+        # The samples were 16-bit PCM to begin with, so this is lossless
+        pcm = np.clip(np.round(self.pending * 32768.0), -32768, 32767).astype("<i2")
+        return state, pcm.tobytes()
+    
+    @classmethod
+    def from_state(cls, stream_id, user_id, state, pending_audio):
+        """Rebuild a stream stored with to_state()"""
+        stream = cls(stream_id, user_id, state["language"])
+        stream.detected_language = state["detected_language"]
+        stream.received = state["received"]
+        stream.offset = state["offset"]
+        stream._carry = bytes.fromhex(state["carry"])
+        stream.segments = state["segments"]
+        stream.pending = np.frombuffer(pending_audio, dtype="<i2").astype(np.float32) / 32768.0
+        return stream
+
+class StreamingTranscriber:
+    """
+    Open transcription streams, keyed by stream id
+    
+    Streams are transcribed through the transcription service, so they share
+    its worker pool or batching, chunks of one stream are transcribed one at
+    a time, and idle streams are dropped after STREAM_IDLE_TIMEOUT. With
+    persist on, streams are stored in SQLite between chunks and claimed by
+    the request handling each chunk, so any app process can handle them.
+    """
+    def __init__(self, max_sessions=STREAM_MAX_SESSIONS, idle_timeout=STREAM_IDLE_TIMEOUT, max_mb=STREAM_MAX_MB,
+                 persist=STREAM_PERSIST):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.persist = persist
+        self._streams = {}
+        self._lock = threading.Lock()
+    
+    def _expire(self):
+        """Drop idle streams, called with the lock held"""
+        now = time.monotonic()
+        for stream_id, stream in list(self._streams.items()):
+            if now - stream.last_active > self.idle_timeout:
+                del self._streams[stream_id]
+    
+    def open(self, user_id, language=None):
+        """
+        Start a stream
+        
+        Args:
+            user_id: Owner of the stream, only they may send chunks to it
+            language: ISO language code or None for auto-detection
+        
+        Returns:
+            str: Stream id
+        """
+        stream = TranscriptionStream(str(uuid.uuid4()), user_id, language)
+        if self.persist:
+            state, pending_audio = stream.to_state()
+            if not db_manager.create_transcription_stream(stream.stream_id, user_id, state, pending_audio,
+                                                          self.max_sessions, self.idle_timeout):
+                raise StreamLimitError(f"Too many open transcription streams ({self.max_sessions})")
+            return stream.stream_id
+        
+        with self._lock:
+            self._expire()
+            if len(self._streams) >= self.max_sessions:
+                raise StreamLimitError(f"Too many open transcription streams ({self.max_sessions})")
+            self._streams[stream.stream_id] = stream
+        return stream.stream_id
+    
+    def _claim(self, stream_id):
+        """Load a persisted stream, waiting for a chunk another request is handling"""
+        deadline = time.monotonic() + STREAM_CLAIM_WAIT_SECONDS
+        while True:
+            claimed = db_manager.claim_transcription_stream(stream_id, STREAM_CLAIM_SECONDS)
+            if claimed is None:
+                return None
+            if claimed:
+                user_id, state, pending_audio = claimed
+                return TranscriptionStream.from_state(stream_id, user_id, state, pending_audio)
+            if time.monotonic() >= deadline:
+                raise StreamBusyError("Transcription stream is still busy with the previous chunk")
+            time.sleep(STREAM_CLAIM_POLL_SECONDS)
+    
+    def _release(self, stream):
+        """Store a persisted stream after a chunk"""
+        db_manager.release_transcription_stream(stream.stream_id, *stream.to_state())
+    
+    def _get(self, stream_id, user_id, chunk):
+        if self.persist:
+            stream = self._claim(stream_id)
+        else:
+            with self._lock:
+                self._expire()
+                stream = self._streams.get(stream_id)
+        
+        error = None
+        if stream is None or stream.user_id != user_id:
+            error = StreamNotFoundError("Unknown or expired transcription stream")
+        elif stream.received + len(chunk) > self.max_bytes:
+            error = StreamLimitError("Transcription stream is too large")
+        
+        if error is not None:
+            if self.persist and stream is not None:
+                db_manager.release_transcription_stream(stream_id)
+            raise error
+        return stream
+    
+    def feed(self, stream_id, user_id, chunk):
+        """
+        Add a chunk to a stream
+        
+        Lookup errors are raised here, before the returned generator starts,
+        so callers can answer with a plain error response.
+        
+        Returns:
+            generator: Events from TranscriptionStream.feed()
+        """
+        stream = self._get(stream_id, user_id, chunk)
+        
+        def events():
+            with stream.lock:
+                try:
+                    yield from stream.feed(chunk)
+                finally:
+                    if self.persist:
+                        self._release(stream)
+        
+        return events()
+    
+    def finish(self, stream_id, user_id, chunk=b""):
+        """
+        Close a stream, transcribing whatever is not final yet
+        
+        Returns:
+            tuple: (transcription text, detected language), the text is empty
+                   when the recording had no speech
+        """
+        stream = self._get(stream_id, user_id, chunk)
+        
+        with stream.lock:
+            if self.persist:
+                db_manager.delete_transcription_stream(stream_id)
+            else:
+                with self._lock:
+                    self._streams.pop(stream_id, None)
+            for _ in stream.feed(chunk, final=True):
+                pass
+        
+        return stream.text, stream.language or stream.detected_language
+    
+    def get_status(self):
+        """Get the number of open streams for health reporting"""
+        if self.persist:
+            open_streams = db_manager.count_transcription_streams(self.idle_timeout)
+        else:
+            with self._lock:
+                self._expire()
+                open_streams = len(self._streams)
+        return {"open_streams": open_streams, "max_streams": self.max_sessions, "persist": self.persist}
+
+# Create a singleton instance
+stream_transcriber = StreamingTranscriber()
@@ -0,0 +1,116 @@
+import os
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from utils import whisper_transcriber, audio_preprocessor
+from utils.db_manager import db_manager
+
+# Transcription cache settings
+# Results are keyed by a hash of the uploaded bytes, the requested language and every
+# setting that changes the output, so a retried or replayed clip skips inference.
+# A size of 0 disables the in-memory cache.
+TRANSCRIBE_CACHE_SIZE = int(os.getenv("TRANSCRIBE_CACHE_SIZE", "512"))
+# Also keep results in SQLite, shared between worker processes and restarts
+TRANSCRIBE_CACHE_PERSIST = os.getenv("TRANSCRIBE_CACHE_PERSIST", "false").lower() == "true"
+TRANSCRIBE_CACHE_DB_ROWS = int(os.getenv("TRANSCRIBE_CACHE_DB_ROWS", "10000"))
+
+def _settings_fingerprint():
+    """Every setting that changes what a clip transcribes to"""
+    return json.dumps({
+        "model": whisper_transcriber.model_size,
+        "compute_type": whisper_transcriber.WHISPER_COMPUTE_TYPE,
+        "vad": audio_preprocessor.VAD_FILTER and audio_preprocessor.VAD_OPTIONS._asdict(),
+        "max_speech_seconds": audio_preprocessor.MAX_SPEECH_SECONDS
+    }, sort_keys=True)
+
+class TranscriptionCache:
+    """
+    Bounded LRU cache of transcription results, optionally backed by SQLite
+    
+    Entries never go stale, the key changes whenever the audio, language or
+    model settings do.
+    """
+    def __init__(self, max_size=TRANSCRIBE_CACHE_SIZE, persist=TRANSCRIBE_CACHE_PERSIST, max_rows=TRANSCRIBE_CACHE_DB_ROWS):
+        self.max_size = max_size
+        self.persist = persist
+        self.max_rows = max_rows
+        self._fingerprint = _settings_fingerprint()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "db_hits": 0, "misses": 0, "evictions": 0}
+    
+    @property
+    def enabled(self):
+        return self.max_size > 0 or self.persist
+    
+    def key(self, audio, language=None):
+        """
+        Cache key for a clip
+        
+        Args:
+            audio: Encoded audio bytes
+            language: ISO language code or None for auto-detection
+        
+        Returns:
+            str: Hex digest
+        """
+        digest = hashlib.sha256()
+        digest.update(self._fingerprint.encode())
+        digest.update(f"\0{language or ''}\0".encode())
+        digest.update(audio)
+        return digest.hexdigest()
+    
+    def get(self, key):
+        """
+        Look up a result
+        
+        Returns:
+            tuple: (transcription text, detected language, audio stats dict), or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry
+        
+        if self.persist:
+            entry = db_manager.get_cached_transcription(key)
+            if entry is not None:
+                with self._lock:
+                    self._stats["db_hits"] += 1
+                self._remember(key, entry)
+                return entry
+        
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+    
+    def put(self, key, transcription, language, audio_stats):
+        """Store a result"""
+        entry = (transcription, language, dict(audio_stats))
+        self._remember(key, entry)
+        
+        if self.persist:
+            db_manager.save_cached_transcription(key, transcription, language, entry[2], self.max_rows)
+    
+    def _remember(self, key, entry):
+        """Add an entry to the in-memory LRU"""
+        if self.max_size <= 0:
+            return
+        
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+    
+    def get_status(self):
+        """Get the cache counters for health reporting"""
+        with self._lock:
+            return dict(self._stats, size=len(self._entries), max_size=self.max_size, persist=self.persist)
+
+# Create a singleton instance
+transcription_cache = TranscriptionCache()
@@ -0,0 +1,303 @@
+import os
+import atexit
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from utils import whisper_transcriber
+from utils.metrics import record_stage
+from utils.whisper_transcriber import transcribe_audio
+from utils.batch_transcriber import batch_transcriber
+
+logger = logging.getLogger(__name__)
+
+# Worker pool settings
+# With TRANSCRIBE_WORKERS > 0 transcription runs in that many worker processes,
+# each holding its own loaded model, instead of in the Flask request thread
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "0"))
+# Longest a single transcription may run before its worker is killed and replaced
+TRANSCRIBE_JOB_TIMEOUT = float(os.getenv("TRANSCRIBE_JOB_TIMEOUT", "120"))
+# Longest a request waits for a free worker before giving up
+TRANSCRIBE_QUEUE_TIMEOUT = float(os.getenv("TRANSCRIBE_QUEUE_TIMEOUT", "30"))
+# Longest a new worker may take to load and warm up its model
+TRANSCRIBE_WORKER_START_TIMEOUT = float(os.getenv("TRANSCRIBE_WORKER_START_TIMEOUT", "600"))
+
+class TranscriptionError(Exception):
+    """Transcription failed"""
+
+class TranscriptionBusyError(TranscriptionError):
+    """No worker became free within the queue timeout"""
+
+class TranscriptionTimeoutError(TranscriptionError):
+    """The job ran longer than the job timeout"""
+
+def _worker_main(conn, cpu_threads):
+    """Worker process: load the model once, then transcribe jobs received on conn"""
+    # Split the cores between workers instead of every worker using all of them
+    whisper_transcriber.WHISPER_CPU_THREADS = cpu_threads
+    whisper_transcriber.preload_model()
+    if not whisper_transcriber.is_model_ready():
+        conn.send(("error", whisper_transcriber.get_model_status()["error"]))
+        return
+    
+    conn.send(("ready", None))
+    
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            # Parent went away
+            return
+        
+        if job is None:
+            return
+        
+        try:
+            stats = {}
+            transcription, language = transcribe_audio(*job, stats=stats)
+            conn.send(("ok", (transcription, language, stats)))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+class _Worker:
+    """A worker process and the parent's end of its pipe"""
+    def __init__(self, index, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.ready = False
+        self.jobs = 0
+
+class TranscriptionService:
+    """
+    Fixed pool of transcription worker processes
+    
+    Requests wait in a queue for an idle worker, each job has a deadline, and a
+    worker that crashes or times out is killed and replaced with a fresh one.
+    With zero workers transcription runs in-process, micro-batched when
+    batching is enabled.
+    """
+    def __init__(self, num_workers=TRANSCRIBE_WORKERS, job_timeout=TRANSCRIBE_JOB_TIMEOUT,
+                 queue_timeout=TRANSCRIBE_QUEUE_TIMEOUT, start_timeout=TRANSCRIBE_WORKER_START_TIMEOUT):
+        self.num_workers = num_workers
+        self.job_timeout = job_timeout
+        self.queue_timeout = queue_timeout
+        self.start_timeout = start_timeout
+        
+        # spawn, not fork: CTranslate2 and the request threads don't survive a fork
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self._workers = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._stats = {"jobs": 0, "timeouts": 0, "crashes": 0, "restarts": 0}
+        # Audio received and actually decoded, in seconds, see preprocess_audio()
+        self._audio = {"audio_duration": 0.0, "speech_duration": 0.0, "skipped_duration": 0.0, "truncated_duration": 0.0}
+    
+    @property
+    def enabled(self):
+        return self.num_workers > 0
+    
+    def _cpu_threads_per_worker(self):
+        """Threads each worker's model may use"""
+        if whisper_transcriber.WHISPER_CPU_THREADS > 0:
+            return whisper_transcriber.WHISPER_CPU_THREADS
+        return max(1, (os.cpu_count() or 1) // self.num_workers)
+    
+    def start(self):
+        """Start the worker processes, once per process"""
+        with self._lock:
+            if self._started or not self.enabled:
+                return
+            self._started = True
+        
+        for index in range(self.num_workers):
+            self._spawn(index)
+        
+        atexit.register(self.shutdown)
+    
+    def _spawn(self, index):
+        """Start a worker process and add it to the idle queue once its model is warm"""
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self._cpu_threads_per_worker()),
+            name=f"transcriber-{index}",
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        
+        worker = _Worker(index, process, parent_conn)
+        with self._lock:
+            self._workers[index] = worker
+        
+        threading.Thread(target=self._wait_until_ready, args=(worker,), name=f"transcriber-{index}-start", daemon=True).start()
+    
+    def _wait_until_ready(self, worker):
+        """Hand a new worker to the idle queue once it reports its model is loaded"""
+        try:
+            if worker.conn.poll(self.start_timeout):
+                status, error = worker.conn.recv()
+                if status == "ready":
+                    worker.ready = True
+                    logger.info("Transcription worker %d ready (pid %d)", worker.index, worker.process.pid)
+                    self._idle.put(worker)
+                    return
+                logger.error("Transcription worker %d failed to load the model: %s", worker.index, error)
+            else:
+                logger.error("Transcription worker %d did not start within %ss", worker.index, self.start_timeout)
+        except (EOFError, OSError) as e:
+            logger.error("Transcription worker %d died while starting: %s", worker.index, e)
+        
+        # A worker that cannot load the model would fail again, leave the slot empty
+        self._kill(worker)
+    
+    def _kill(self, worker):
+        """Terminate a worker process and close its pipe"""
+        if worker.process.is_alive():
+            worker.process.kill()
+        worker.process.join(timeout=5)
+        worker.conn.close()
+    
+    def _replace(self, worker):
+        """Kill a broken worker and start a fresh one in its slot"""
+        self._kill(worker)
+        with self._lock:
+            self._stats["restarts"] += 1
+        self._spawn(worker.index)
+    
+    def transcribe(self, audio, language=None, stats=None):
+        """
+        Transcribe audio, on a pooled worker when the pool is enabled
+        
+        Args:
+            audio: Encoded audio as bytes, a file path, or 16 kHz float32 samples
+            language: ISO language code (e.g., 'hi' for Hindi) or None for auto-detection
+            stats: Optional dict, receives the seconds spent queued as 'queue_time'
+                   and the durations from preprocess_audio()
+        
+        Returns:
+            tuple: (transcription text, detected language)
+        """
+        if stats is None:
+            stats = {}
+        stats["queue_time"] = 0.0
+        
+        started = time.perf_counter()
+        result = self._transcribe(audio, language, stats)
+        # Workers decode in their own processes, so the decode is timed from here
+        record_stage("transcription_queue", stats["queue_time"])
+        record_stage("whisper_decode", time.perf_counter() - started - stats["queue_time"])
+        return result
+    
+    def _transcribe(self, audio, language, stats):
+        """Run one transcription in-process or on a worker, see transcribe()"""
+        if not self.enabled:
+            if batch_transcriber.enabled:
+                result = batch_transcriber.transcribe(audio, language, stats=stats)
+            else:
+                result = transcribe_audio(audio, language, stats=stats)
+            self._record_audio(stats)
+            return result
+        
+        self.start()
+        
+        queued_at = time.perf_counter()
+        try:
+            worker = self._idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            raise TranscriptionBusyError(f"No transcription worker free after {self.queue_timeout}s")
+        stats["queue_time"] = time.perf_counter() - queued_at
+        
+        with self._lock:
+            self._stats["jobs"] += 1
+        
+        try:
+            # The encoded upload is much smaller than decoded samples, workers decode it
+            worker.conn.send((audio, language))
+            
+            if not worker.conn.poll(self.job_timeout):
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                self._replace(worker)
+                raise TranscriptionTimeoutError(f"Transcription took longer than {self.job_timeout}s")
+            
+            status, result = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            # The worker process died mid-job
+            with self._lock:
+                self._stats["crashes"] += 1
+            self._replace(worker)
+            raise TranscriptionError(f"Transcription worker crashed: {str(e)}")
+        
+        worker.jobs += 1
+        self._idle.put(worker)
+        
+        if status != "ok":
+            raise TranscriptionError(result)
+        
+        transcription, detected_language, audio_stats = result
+        stats.update(audio_stats)
+        self._record_audio(stats)
+        return transcription, detected_language
+    
+    def _record_audio(self, stats):
+        """Add a clip's durations to the totals"""
+        with self._lock:
+            for key in self._audio:
+                self._audio[key] += stats.get(key, 0.0)
+    
+    def is_ready(self):
+        """Check whether transcription requests can be served without loading a model"""
+        if not self.enabled:
+            return whisper_transcriber.is_model_ready()
+        
+        with self._lock:
+            workers = list(self._workers.values())
+        return any(worker.ready and worker.process.is_alive() for worker in workers)
+    
+    def get_status(self):
+        """Get the pool's state for health reporting"""
+        with self._lock:
+            audio = {key: round(value, 1) for key, value in self._audio.items()}
+        
+        if not self.enabled:
+            status = whisper_transcriber.get_model_status()
+            if batch_transcriber.enabled:
+                status["batching"] = batch_transcriber.get_status()
+            status["audio_seconds"] = audio
+            return status
+        
+        with self._lock:
+            workers = list(self._workers.values())
+            stats = dict(self._stats)
+        
+        return dict(
+            stats,
+            audio_seconds=audio,
+            ready=self.is_ready(),
+            workers=self.num_workers,
+            alive=sum(1 for worker in workers if worker.process.is_alive()),
+            idle=self._idle.qsize(),
+            model=whisper_transcriber.model_size
+        )
+    
+    def shutdown(self):
+        """Stop all worker processes"""
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers = {}
+        
+        for worker in workers:
+            try:
+                worker.conn.send(None)
+            except (EOFError, OSError):
+                pass
+        for worker in workers:
+            worker.process.join(timeout=5)
+            self._kill(worker)
+
+# Create a singleton instance
+transcription_service = TranscriptionService()
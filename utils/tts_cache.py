@@ -0,0 +1,295 @@
+import os
+import hashlib
+import logging
+import re
+import threading
+import time
+import unicodedata
+import wave
+from collections import OrderedDict
+from utils.tts_generator import SUPPORTED_LANGUAGES, preferred_backends, synthesize_speech, tts_backends
+from utils.groq_client import FORCED_QUESTIONS
+from utils.loan_recommender import loan_recommender
+from utils.audio_storage import STATIC_DIR, audio_storage, shard_path
+from utils.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Synthesized speech is stored under static/tts/, named by a hash of the
+# normalized text and language, so each sentence is synthesized once per language
+TTS_CACHE_DIR = os.path.join(STATIC_DIR, "tts")
+TTS_CACHE_URL = "/audio/tts"
+
+# Render the forced questions and the rule-based loan recommendations for
+# every supported language at startup
+TTS_PRERENDER = os.getenv("TTS_PRERENDER", "true").lower() == "true"
+
+# Speech from a fallback backend (any but the first one that speaks the language)
+# is served while the preferred ones fail, but they are tried again at most this
+# often and their audio replaces it once one succeeds
+TTS_FALLBACK_RETRY_SECONDS = float(os.getenv("TTS_FALLBACK_RETRY_SECONDS", "300"))
+# Most fallback entries whose next retry time is remembered, the oldest are
+# forgotten first and simply become due again
+FALLBACK_RETRY_ENTRIES = 4096
+
+def normalize_text(text):
+    """Normalize text so spacing and Unicode composition differences share an entry"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+class TTSCache:
+    """
+    Content-addressed cache of synthesized speech
+    
+    The files on disk are the cache, so entries survive restarts and are
+    shared by every process serving from the same static folder. Files are
+    stored as ab/cd/<hash>-<backend>.<ext>; audio from any configured backend
+    counts as a hit, preferring backends earlier in TTS_BACKENDS. Audio from a
+    fallback backend is re-rendered with the preferred ones once they work
+    again. Eviction is left to the audio storage sweeper.
+    """
+    def __init__(self, cache_dir=TTS_CACHE_DIR, url_prefix=TTS_CACHE_URL, fallback_retry=TTS_FALLBACK_RETRY_SECONDS):
+        self.cache_dir = cache_dir
+        self.url_prefix = url_prefix
+        self.fallback_retry = fallback_retry
+        self._lock = threading.Lock()
+        # Per-key locks so concurrent requests for the same text synthesize it once
+        self._key_locks = {}
+        # Fallback audio by key -> when to try the preferred backends again
+        self._retry_at = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "failures": 0, "upgrades": 0, "joined": 0}
+        self._prerender_thread = None
+    
+    def key(self, text, language_code):
+        """Cache key for text in a language, a hex digest"""
+        return hashlib.sha256(f"{language_code}\0{normalize_text(text)}".encode()).hexdigest()
+    
+    def _filename(self, key, backend):
+        return shard_path(key, f"{key}-{backend.name}.{backend.extension}")
+    
+    def _find(self, key, language_code):
+        """
+        Get cached audio for key
+        
+        Returns:
+            tuple: (filename, backend that rendered it), or (None, None)
+        """
+        for backend in preferred_backends(language_code):
+            filename = self._filename(key, backend)
+            path = os.path.join(self.cache_dir, filename)
+            if os.path.exists(path):
+                audio_storage.touch(path)
+                return filename, backend
+        return None, None
+    
+    def lookup_key(self, key):
+        """
+        Get the URL of cached speech by its key, from any configured backend
+        
+        Returns:
+            str: URL of the audio file, or None if it is not cached
+        """
+        for backend in tts_backends:
+            filename = self._filename(key, backend)
+            if os.path.exists(os.path.join(self.cache_dir, filename)):
+                return f"{self.url_prefix}/{filename}"
+        return None
+    
+    def _store(self, key, backend, audio):
+        """
+        Write audio to the cache and return its filename
+        
+        Files are served as immutable under their name, so a file that exists
+        is kept as it is, even if this process or another rendered it again.
+        """
+        filename = self._filename(key, backend)
+        path = os.path.join(self.cache_dir, filename)
+        if os.path.exists(path):
+            return filename
+        
+        # Write to a temporary name and link it in place, so a half-written file
+        # is never served and one written meanwhile is not replaced
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp_path, "wb") as f:
+            f.write(audio)
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_path)
+        return filename
+    
+    def _retry_due(self, key, backend, language_code):
+        """Check whether fallback audio should be rendered again with the preferred backends"""
+        if backend is preferred_backends(language_code)[0]:
+            return False
+        with self._lock:
+            return self._retry_at.get(key, 0.0) <= time.monotonic()
+    
+    def _retry_later(self, key):
+        """Serve the fallback audio for key until the next retry"""
+        with self._lock:
+            self._retry_at[key] = time.monotonic() + self.fallback_retry
+            self._retry_at.move_to_end(key)
+            while len(self._retry_at) > FALLBACK_RETRY_ENTRIES:
+                self._retry_at.popitem(last=False)
+    
+    def lookup(self, text, language_code):
+        """
+        Get the URL of cached speech for text without synthesizing anything
+        
+        Returns:
+            str: URL of the audio file, or None if it is not cached or is fallback
+                 audio due to be rendered again, which get_speech() does
+        """
+        key = self.key(text, language_code)
+        filename, backend = self._find(key, language_code)
+        if filename is None or self._retry_due(key, backend, language_code):
+            return None
+        
+        with self._lock:
+            self._stats["hits"] += 1
+        return f"{self.url_prefix}/{filename}"
+    
+    def get_speech(self, text, language_code):
+        """
+        Get the URL of speech for text, synthesizing it only if it is not cached
+        
+        Args:
+            text: Text to convert to speech
+            language_code: ISO language code (e.g., 'hi' for Hindi)
+        
+        Returns:
+            str: URL of the audio file, or None if speech could not be generated
+        """
+        key = self.key(text, language_code)
+        
+        filename, backend = self._find(key, language_code)
+        if filename and not self._retry_due(key, backend, language_code):
+            with self._lock:
+                self._stats["hits"] += 1
+            return f"{self.url_prefix}/{filename}"
+        
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        
+        with key_lock:
+            try:
+                # Another request may have synthesized it while we waited
+                fallback, fallback_backend = self._find(key, language_code)
+                if fallback and not self._retry_due(key, fallback_backend, language_code):
+                    with self._lock:
+                        self._stats["hits"] += 1
+                    return f"{self.url_prefix}/{fallback}"
+                
+                backends = preferred_backends(language_code)
+                if fallback:
+                    # Only a backend preferred over the cached one can improve on it
+                    backends = backends[:backends.index(fallback_backend)]
+                else:
+                    with self._lock:
+                        self._stats["misses"] += 1
+                
+                with timed("tts_synthesis"):
+                    audio, backend = synthesize_speech(text, language_code, backends)
+                if audio is None:
+                    if fallback:
+                        self._retry_later(key)
+                        with self._lock:
+                            self._stats["hits"] += 1
+                        return f"{self.url_prefix}/{fallback}"
+                    with self._lock:
+                        self._stats["failures"] += 1
+                    return None
+                
+                audio_url = f"{self.url_prefix}/{self._store(key, backend, audio)}"
+                
+                if fallback:
+                    # The old file stays for messages that link to it, _find() now prefers the new one
+                    with self._lock:
+                        self._retry_at.pop(key, None)
+                        self._stats["upgrades"] += 1
+                    if audio_storage.is_pinned(f"{self.url_prefix}/{fallback}"):
+                        audio_storage.pin(audio_url)
+                
+                if backend is not preferred_backends(language_code)[0]:
+                    self._retry_later(key)
+                
+                return audio_url
+            finally:
+                with self._lock:
+                    self._key_locks.pop(key, None)
+    
+    def join_speech(self, text, language_code, audio_urls):
+        """
+        Cache speech for text by joining the speech already made for its sentences
+        
+        Args:
+            text: The whole text
+            language_code: ISO language code (e.g., 'hi' for Hindi)
+            audio_urls: URL of each sentence's speech, in order, as returned by get_speech()
+        
+        Returns:
+            str: URL of the speech for text, or None if a sentence has no speech or
+                 the clips cannot be joined, e.g. because different backends made them
+        """
+        audio_url = self.lookup(text, language_code)
+        if audio_url or not audio_urls or None in audio_urls:
+            return audio_url
+        
+        backends = {backend.name: backend for backend in preferred_backends(language_code)}
+        filenames = [url[len(self.url_prefix) + 1:] for url in audio_urls if url.startswith(f"{self.url_prefix}/")]
+        names = {os.path.splitext(filename)[0].rsplit("-", 1)[-1] for filename in filenames}
+        if len(filenames) != len(audio_urls) or len(names) != 1 or not names <= backends.keys():
+            return None
+        backend = backends[names.pop()]
+        
+        try:
+            clips = []
+            for filename in filenames:
+                with open(os.path.join(self.cache_dir, filename), "rb") as f:
+                    clips.append(f.read())
+            audio = backend.join(clips)
+        except (NotImplementedError, OSError, EOFError, wave.Error, ValueError) as e:
+            logger.debug("Could not join %d clips from %s: %s", len(clips), backend.name, e)
+            return None
+        
+        key = self.key(text, language_code)
+        filename = self._store(key, backend, audio)
+        if backend is not preferred_backends(language_code)[0]:
+            self._retry_later(key)
+        
+        with self._lock:
+            self._stats["joined"] += 1
+        return f"{self.url_prefix}/{filename}"
+    
+    def prerender(self):
+        """Synthesize the forced questions and loan recommendations in every supported language"""
+        rendered = 0
+        total = 0
+        for language_code in SUPPORTED_LANGUAGES:
+            texts = FORCED_QUESTIONS + loan_recommender.all_texts(language_code)
+            total += len(texts)
+            for text in texts:
+                audio_url = self.get_speech(text, language_code)
+                if audio_url:
+                    # Every conversation uses these, keep them however old they get
+                    audio_storage.pin(audio_url)
+                    rendered += 1
+        logger.info("Pre-rendered %d of %d fixed prompts", rendered, total)
+    
+    def start_prerender(self):
+        """Pre-render in a background thread, once per process"""
+        with self._lock:
+            if self._prerender_thread is None:
+                self._prerender_thread = threading.Thread(target=self.prerender, name="tts-prerender", daemon=True)
+                self._prerender_thread.start()
+    
+    def get_status(self):
+        """Get the cache counters for health reporting"""
+        with self._lock:
+            return dict(self._stats)
+
+# Create a singleton instance
+tts_cache = TTSCache()
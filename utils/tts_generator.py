@@ -1,5 +1,18 @@
 from gtts import gTTS
+import base64
+import io
+import logging
 import os
+import re
+import shutil
+import urllib.request
+import subprocess
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import requests
+
+logger = logging.getLogger(__name__)
 
 # List of languages supported by gTTS
 # This is not exhaustive but includes many Indian languages
@@ -16,37 +29,217 @@ SUPPORTED_LANGUAGES = {
     'en': 'English'
 }
 
+# Backends tried in order until one produces speech
+# Each backend also reads TTS_<NAME>_TIMEOUT (seconds), TTS_<NAME>_CONCURRENCY
+# and TTS_<NAME>_QUEUE_TIMEOUT (seconds)
+TTS_BACKENDS = [name.strip() for name in os.getenv("TTS_BACKENDS", "gtts,espeak").split(",") if name.strip()]
+
 def is_language_supported(language_code):
-    """Check if the language is supported by gTTS"""
+    """Check if the language is supported for speech"""
     return language_code in SUPPORTED_LANGUAGES
 
-def generate_speech(text, language_code, output_path):
+class TTSBackend:
+    """
+    A speech synthesis engine with a deadline and a concurrency limit
+    
+    Subclasses implement _render(). Each call runs on the backend's own threads,
+    so a hung engine costs at most `timeout` seconds and never more than
+    `concurrency` calls are in flight; when all slots stay busy for
+    `queue_timeout` seconds the caller moves on to the next backend.
+    """
+    name = None
+    extension = None
+    default_timeout = 10.0
+    default_concurrency = 4
+    # Long enough to ride out a short burst, short next to a synthesis
+    default_queue_timeout = 0.5
+    
+    def __init__(self):
+        prefix = f"TTS_{self.name.upper()}"
+        self.timeout = float(os.getenv(f"{prefix}_TIMEOUT", str(self.default_timeout)))
+        self.concurrency = int(os.getenv(f"{prefix}_CONCURRENCY", str(self.default_concurrency)))
+        self.queue_timeout = float(os.getenv(f"{prefix}_QUEUE_TIMEOUT", str(self.default_queue_timeout)))
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"tts-{self.name}")
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "busy": 0, "timeouts": 0, "errors": 0}
+    
+    def is_available(self):
+        """Check whether the engine can run on this machine"""
+        return True
+    
+    def supports(self, language_code):
+        return is_language_supported(language_code)
+    
+    def _render(self, text, language_code):
+        """Synthesize speech and return the encoded audio"""
+        raise NotImplementedError
+    
+    def join(self, clips):
+        """Join the encoded audio of clips this backend made into one clip, played back to back"""
+        raise NotImplementedError
+    
+    def _run(self, text, language_code):
+        """Render on an executor thread, holding a slot until the engine really finishes"""
+        try:
+            return self._render(text, language_code)
+        finally:
+            # Released before the result is set, so a caller that got the result
+            # can immediately start another call
+            self._slots.release()
+    
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+    
+    def synthesize(self, text, language_code):
+        """
+        Synthesize speech within the backend's deadline
+        
+        Args:
+            text: Text to convert to speech
+            language_code: ISO language code (e.g., 'hi' for Hindi)
+        
+        Returns:
+            bytes: Encoded audio, or None if the backend failed, timed out or stayed busy
+        """
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count("busy")
+            return None
+        
+        self._count("calls")
+        # A call that times out keeps its slot until the engine gives up
+        future = self._executor.submit(self._run, text, language_code)
+        
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self._count("timeouts")
+            logger.warning("%s speech synthesis timed out after %ss", self.name, self.timeout)
+        except Exception as e:
+            self._count("errors")
+            logger.error("Error generating speech with %s: %s", self.name, e)
+        return None
+    
+    def get_status(self):
+        with self._lock:
+            return dict(self._stats, available=self.is_available(), timeout=self.timeout,
+                        concurrency=self.concurrency, queue_timeout=self.queue_timeout)
+
+class GTTSBackend(TTSBackend):
+    """Google Translate's TTS over HTTP, needs network access"""
+    name = "gtts"
+    extension = "mp3"
+    default_timeout = 5.0
+    
+    # Each part's MP3 comes base64-encoded inside the JSON of the response
+    AUDIO_PATTERN = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
+    
+    def _render(self, text, language_code):
+        # gTTS sends its requests without a timeout, so a hung connection would keep
+        # its slot forever; they are sent here with one instead
+        buffer = io.BytesIO()
+        with requests.Session() as session:
+            for prepared in gTTS(text=text, lang=language_code, slow=False)._prepare_requests():
+                response = session.send(prepared, timeout=self.timeout, proxies=urllib.request.getproxies())
+                response.raise_for_status()
+                
+                parts = [base64.b64decode(match.group(1)) for match in self.AUDIO_PATTERN.finditer(response.text)]
+                if not parts:
+                    raise ValueError("gTTS response contains no audio")
+                buffer.writelines(parts)
+        return buffer.getvalue()
+    
+    def join(self, clips):
+        # MP3 is a sequence of self-contained frames, so clips can simply be concatenated
+        return b"".join(clips)
+
+class EspeakBackend(TTSBackend):
+    """eSpeak NG run as a local subprocess, works offline"""
+    name = "espeak"
+    extension = "wav"
+    default_concurrency = os.cpu_count() or 1
+    
+    def __init__(self):
+        super().__init__()
+        self.binary = os.getenv("TTS_ESPEAK_BINARY") or shutil.which("espeak-ng") or shutil.which("espeak")
+    
+    def is_available(self):
+        return self.binary is not None
+    
+    def _render(self, text, language_code):
+        # Text goes through stdin so it is never parsed as options, -b 1 reads it as UTF-8
+        result = subprocess.run(
+            [self.binary, "-v", language_code, "-b", "1", "--stdin", "--stdout"],
+            input=text.encode("utf-8"),
+            capture_output=True,
+            timeout=self.timeout,
+            check=True
+        )
+        return result.stdout
+    
+    def join(self, clips):
+        # One header for all the samples, the header eSpeak writes to a pipe has no real length
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as joined:
+            for index, clip in enumerate(clips):
+                with wave.open(io.BytesIO(clip), "rb") as part:
+                    if index == 0:
+                        joined.setparams(part.getparams())
+                    elif part.getparams()[:3] != joined.getparams()[:3]:
+                        raise ValueError("Clips have different sample formats")
+                    joined.writeframes(part.readframes(part.getnframes()))
+        return buffer.getvalue()
+
+# Available engines by name, add a TTSBackend subclass here to plug in another one
+BACKENDS = {
+    GTTSBackend.name: GTTSBackend,
+    EspeakBackend.name: EspeakBackend
+}
+
+def _load_backends():
+    """Instantiate the configured backends, skipping unknown or unavailable ones"""
+    backends = []
+    for name in TTS_BACKENDS:
+        if name not in BACKENDS:
+            logger.warning("Unknown TTS backend '%s', skipping it", name)
+            continue
+        backend = BACKENDS[name]()
+        if not backend.is_available():
+            logger.warning("TTS backend '%s' is not available on this machine, skipping it", name)
+            continue
+        backends.append(backend)
+    return backends
+
+tts_backends = _load_backends()
+
+def preferred_backends(language_code):
+    """Configured backends that can speak a language, most preferred first"""
+    return [backend for backend in tts_backends if backend.supports(language_code)]
+
+def synthesize_speech(text, language_code, backends=None):
     """
-    Generate speech from text using gTTS
+    Generate speech from text with the first configured backend that succeeds
     
     Args:
         text: Text to convert to speech
         language_code: ISO language code (e.g., 'hi' for Hindi)
-        output_path: Path to save the audio file
-        
+        backends: Backends to try, in order, defaults to every configured one
+    
     Returns:
-        bool: True if successful, False otherwise
+        tuple: (encoded audio, backend that produced it), or (None, None) if none could
     """
-    try:
-        # Check if language is supported
-        if not is_language_supported(language_code):
-            print(f"Language {language_code} is not supported by gTTS. Falling back to text only.")
-            return False
-        
-        # Create directory if it doesn't exist
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Generate speech
-        tts = gTTS(text=text, lang=language_code, slow=False)
-        tts.save(output_path)
-        
-        return True
+    if not is_language_supported(language_code):
+        logger.info("Language %s is not supported for speech. Falling back to text only.", language_code)
+        return None, None
     
-    except Exception as e:
-        print(f"Error generating speech: {str(e)}")
-        return False
+    for backend in preferred_backends(language_code) if backends is None else backends:
+        audio = backend.synthesize(text, language_code)
+        if audio:
+            return audio, backend
+    
+    return None, None
+
+def get_backend_status():
+    """Get each backend's counters for health reporting"""
+    return {backend.name: backend.get_status() for backend in tts_backends}
@@ -0,0 +1,116 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from utils.tts_cache import tts_cache
+
+logger = logging.getLogger(__name__)
+
+# Asynchronous speech settings
+# With TTS_ASYNC on, /ask answers with the text right away and speech is
+# synthesized in the background; clients can also ask per request
+TTS_ASYNC = os.getenv("TTS_ASYNC", "false").lower() == "true"
+TTS_ASYNC_WORKERS = int(os.getenv("TTS_ASYNC_WORKERS", "4"))
+# Finished jobs are kept this long for clients to pick up
+TTS_JOB_TTL_SECONDS = float(os.getenv("TTS_JOB_TTL_SECONDS", "300"))
+
+class TTSJob:
+    """Speech being synthesized in the background"""
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.audio_url = None
+        self.finished_at = None
+        self.done = threading.Event()
+    
+    @property
+    def failed(self):
+        return self.done.is_set() and self.audio_url is None
+
+class TTSJobQueue:
+    """
+    Background speech synthesis with waitable job handles
+    
+    Jobs run on a fixed pool of threads; a request can wait on a job's handle
+    until its audio is ready, and an on_ready callback records the result,
+    e.g. on the message it belongs to. Jobs live in the process that runs
+    them, so callers give them ids that other processes can resolve from
+    shared state: a message id, or the speech's TTS cache key.
+    """
+    def __init__(self, workers=TTS_ASYNC_WORKERS, ttl=TTS_JOB_TTL_SECONDS):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0}
+    
+    def _expire(self):
+        """Drop jobs finished longer than the TTL ago, called with the lock held"""
+        now = time.monotonic()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at is not None and now - job.finished_at > self.ttl:
+                del self._jobs[job_id]
+    
+    def submit(self, text, language_code, on_ready=None, job_id=None):
+        """
+        Queue speech synthesis
+        
+        Args:
+            text: Text to convert to speech
+            language_code: ISO language code (e.g., 'hi' for Hindi)
+            on_ready: Optional callback, called with the audio URL once it is ready
+            job_id: Optional id for the job, a job already running or done under
+                    it is reused instead of starting another one
+        
+        Returns:
+            str: Job id to wait on
+        """
+        job = TTSJob(job_id or str(uuid.uuid4()))
+        with self._lock:
+            self._expire()
+            existing = self._jobs.get(job.job_id)
+            if existing is not None and not existing.failed:
+                return existing.job_id
+            self._jobs[job.job_id] = job
+            self._stats["submitted"] += 1
+        
+        self._executor.submit(self._run, job, text, language_code, on_ready)
+        return job.job_id
+    
+    def _run(self, job, text, language_code, on_ready):
+        try:
+            job.audio_url = tts_cache.get_speech(text, language_code)
+            if job.audio_url and on_ready:
+                on_ready(job.audio_url)
+        except Exception as e:
+            logger.exception("Error in background speech synthesis: %s", e)
+        finally:
+            job.finished_at = time.monotonic()
+            with self._lock:
+                self._stats["completed" if job.audio_url else "failed"] += 1
+            job.done.set()
+    
+    def wait(self, job_id, timeout):
+        """
+        Wait up to timeout seconds for a job to finish
+        
+        Returns:
+            TTSJob: The job, finished or not, or None if the id is unknown or expired
+        """
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+        
+        if job is not None:
+            job.done.wait(timeout)
+        return job
+    
+    def get_status(self):
+        """Get the job counters for health reporting"""
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if not job.done.is_set())
+            return dict(self._stats, pending=pending)
+
+# Create a singleton instance
+tts_jobs = TTSJobQueue()
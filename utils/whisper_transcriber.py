@@ -1,62 +1,152 @@
 import os
+import io
+import logging
 from faster_whisper import WhisperModel
-import tempfile
-import subprocess
-import sys
+from faster_whisper.audio import decode_audio
+from utils.audio_preprocessor import SAMPLING_RATE, VAD_FILTER, preprocess_audio
+import threading
+import time
 
-# Define a fallback for audio conversion that doesn't rely on pydub/audioop
+logger = logging.getLogger(__name__)
 
-# Initialize the model (will download if not present)
+# Model configuration, overridable through the environment
 # Using the small model for balance of speed and accuracy
-# Can be changed to tiny, base, medium, large-v2 based on requirements
-model_size = "small"
+# Can be changed to tiny, base, medium, large-v2 (or a path to a converted model) based on requirements
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "small")
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "cpu")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+# 0 lets CTranslate2 pick the number of threads
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", "0"))
+# Number of transcriptions that can run in parallel from different threads
+WHISPER_NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", "1"))
+# Load and warm up the model at startup instead of on the first request
+WHISPER_PRELOAD = os.getenv("WHISPER_PRELOAD", "true").lower() == "true"
+
+# One second of 16 kHz mono silence, decoded once at startup to warm up the model
+WARM_UP_CLIP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "silence.wav")
+
+# Initialize the model (will download if not present)
+model_size = WHISPER_MODEL_SIZE
 model = None
+_model_lock = threading.Lock()
+
+# Readiness state reported by /health
+_model_ready = threading.Event()
+_model_error = None
+_preload_thread = None
 
 def load_model():
     """Lazy load the Whisper model"""
     global model
     if model is None:
-        # Use CUDA if available, otherwise CPU
-        model = WhisperModel(model_size, device="cpu", compute_type="int8")
+        # Concurrent first requests wait for a single load
+        with _model_lock:
+            if model is None:
+                model = WhisperModel(
+                    model_size,
+                    device=WHISPER_DEVICE,
+                    compute_type=WHISPER_COMPUTE_TYPE,
+                    cpu_threads=WHISPER_CPU_THREADS,
+                    num_workers=WHISPER_NUM_WORKERS
+                )
     return model
 
-def convert_audio_if_needed(audio_path):
-    """Convert audio to WAV format if it's not already"""
-    file_ext = os.path.splitext(audio_path)[1].lower()
+def warm_up_model():
+    """Run one transcription of the bundled silent clip so the first request doesn't pay for lazy initialization"""
+    segments, info = load_model().transcribe(WARM_UP_CLIP, language="en", beam_size=1)
+    # Segments are generated lazily, consume them to actually run the decoder
+    list(segments)
     
-    if file_ext not in ['.wav']:
-        # Create a temporary WAV file
-        temp_wav = tempfile.NamedTemporaryFile(suffix='.wav', delete=False).name
-        
-        # For this simplified version, we'll just pass the original file
-        # since faster-whisper can handle various audio formats directly
-        print(f"Note: Audio conversion skipped due to missing dependencies. Using original format.")
-        return audio_path
+    if VAD_FILTER:
+        # Load the VAD model too
+        preprocess_audio(load_audio(WARM_UP_CLIP))
+
+def preload_model():
+    """Load and warm up the model, then mark transcription as ready"""
+    global _model_error
+    try:
+        start = time.perf_counter()
+        load_model()
+        warm_up_model()
+        _model_ready.set()
+        logger.info("Whisper model '%s' loaded and warmed up in %.1fs", model_size, time.perf_counter() - start)
+    except Exception as e:
+        _model_error = str(e)
+        logger.exception("Error preloading Whisper model: %s", e)
+
+def start_preload():
+    """Preload the model in a background thread, once per process"""
+    global _preload_thread
+    if _preload_thread is None:
+        _preload_thread = threading.Thread(target=preload_model, name="whisper-preload", daemon=True)
+        _preload_thread.start()
+
+def is_model_ready():
+    """Check whether the model is loaded and warmed up"""
+    return _model_ready.is_set()
+
+def get_model_status():
+    """Get the model's configuration and readiness for health reporting"""
+    return {
+        "ready": is_model_ready(),
+        "model": model_size,
+        "device": WHISPER_DEVICE,
+        "compute_type": WHISPER_COMPUTE_TYPE,
+        "cpu_threads": WHISPER_CPU_THREADS,
+        "num_workers": WHISPER_NUM_WORKERS,
+        "error": _model_error
+    }
+
+def load_audio(audio):
+    """
+    Decode audio to the 16 kHz mono float32 samples the model works on
+    
+    Args:
+        audio: Encoded audio as bytes or a file-like object, a file path, or already decoded samples
+    
+    Returns:
+        numpy.ndarray: float32 samples
+    """
+    if isinstance(audio, (bytes, bytearray)):
+        # BytesIO shares the buffer of a bytes object instead of copying it
+        audio = io.BytesIO(audio)
     
-    return audio_path
+    if isinstance(audio, str) or hasattr(audio, "read"):
+        # PyAV decodes straight from the buffer, nothing is written to disk
+        return decode_audio(audio, sampling_rate=SAMPLING_RATE)
+    
+    return audio
 
-def transcribe_audio(audio_path, language=None):
+def transcribe_audio(audio, language=None, stats=None):
     """
-    Transcribe audio file using faster-whisper
+    Transcribe audio using faster-whisper
     
     Args:
-        audio_path: Path to the audio file
+        audio: Encoded audio as bytes or a file-like object, a file path, or decoded samples
         language: ISO language code (e.g., 'hi' for Hindi) or None for auto-detection
-        
+        stats: Optional dict, receives the durations from preprocess_audio()
+    
     Returns:
-        tuple: (transcription text, detected language)
+        tuple: (transcription text, detected language), the language is the one
+               passed in when the clip has no speech
     """
     try:
         # Load the model
         model = load_model()
         
-        # Convert audio if needed
-        wav_path = convert_audio_if_needed(audio_path)
+        # Decode the audio in memory and keep only the speech
+        samples, audio_stats = preprocess_audio(load_audio(audio))
+        if stats is not None:
+            stats.update(audio_stats)
+        
+        if not len(samples):
+            # Nothing to decode, don't spend a decoder pass on silence
+            return "", language
         
         # Transcribe with faster-whisper
         # If language is provided, use it; otherwise, auto-detect
         segments, info = model.transcribe(
-            wav_path, 
+            samples, 
             language=language,
             task="transcribe"
         )
@@ -64,14 +154,7 @@ def transcribe_audio(audio_path, language=None):
         # Combine all segments into a single text
         transcription = " ".join([segment.text for segment in segments])
         
-        # Clean up temporary file if created
-        if wav_path != audio_path and os.path.exists(wav_path):
-            os.remove(wav_path)
-            
         return transcription.strip(), info.language
-        
+    
     except Exception as e:
-        # Clean up temporary file if created
-        if 'wav_path' in locals() and wav_path != audio_path and os.path.exists(wav_path):
-            os.remove(wav_path)
         raise Exception(f"Transcription error: {str(e)}")